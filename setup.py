@@ -30,9 +30,14 @@ def setup():
             'boto3 >= 1.4.4',
             'click',
             'configparser',
+            'futures; python_version < "3"',
             'Jinja2',
             'MarkupSafe'
         ],
+        extras_require={
+            'async': ['aiobotocore'],
+            'parquet': ['pyarrow']
+        },
         tests_require=[
             'mock',
             'pytest',
@@ -40,7 +45,7 @@ def setup():
         ],
         entry_points={
             'console_scripts': ['check-reserved-instances = '
-                                'check_reserved_instances:cli']
+                                'check_reserved_instances.commands:cli']
         },
         package_data={
             '': ['LICENSE'],
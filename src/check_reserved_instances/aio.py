@@ -0,0 +1,406 @@
+"""Scan the accounts with asyncio, keeping many AWS calls in flight.
+
+The describe calls of every account, region and service are sent at once,
+with a bounded number in flight per endpoint of each account, since AWS
+throttles the calls of each account and region. The calls are made by
+aiobotocore clients, so they are signed, retried (with the [Connection]
+retry settings), timed out and parsed by botocore as for the synchronous
+clients.
+
+The built-in EC2, RDS and ElastiCache collectors count the records with
+the same `pipeline` stages as the synchronous ones in `aws`, including
+the EC2 instance segments, so the results are the same as the other
+engines'. Collectors from other packages, session creation and the CPU
+utilization sampling run in the default thread pool.
+
+Requires Python 3.7 or later and aiobotocore
+(``pip install check-reserved-instances[async]``).
+"""
+
+import asyncio
+from contextlib import AsyncExitStack
+import functools
+import threading
+
+try:
+    from aiobotocore.session import AioSession
+except ImportError:  # pragma: no cover
+    raise ImportError('The async engine requires aiobotocore, '
+                      'install check-reserved-instances[async]')
+
+from check_reserved_instances import aws
+from check_reserved_instances.aws import DeadlineExceeded
+from check_reserved_instances.calculate import merge_results, new_results
+from check_reserved_instances.checkpoint import unit_name
+from check_reserved_instances.collectors import enabled_collectors
+from check_reserved_instances.pipeline import count_records, page_records
+from check_reserved_instances.scan import (
+    overlapping_regions, retryable_error, UNIT_ERRORS, unit_failure)
+from check_reserved_instances.utilization import sample_utilization
+
+# calls in flight per endpoint of each account, unless --workers is given
+ENDPOINT_CONCURRENCY = 10
+
+
+class AsyncClient(object):
+    """Calls of an aiobotocore client, a bounded number at once."""
+
+    def __init__(self, client, limit):
+        """Initialize a client.
+
+        Args:
+            client (:aiobotocore:client.AioBaseClient): The client.
+            limit (int): How many calls may be in flight at once.
+
+        """
+        self.client = client
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def call(self, method, **params):
+        """Make a call.
+
+        Args:
+            method (str): The client method of the operation, e.g.
+                'describe_instances'.
+            **params: The parameters of the call.
+
+        Returns:
+            The parsed response.
+
+        """
+        aws.check_deadline()
+        async with self.semaphore:
+            return await getattr(self.client, method)(**params)
+
+    async def paginate(self, method, handle_page, **params):
+        """Make the calls of every page of an operation.
+
+        Args:
+            method (str): The client method of the operation.
+            handle_page (callable): Function called with each parsed page,
+                as it is received.
+            **params: The parameters of the first call.
+
+        """
+        pages = self.client.get_paginator(method).paginate(
+            **params).__aiter__()
+        while True:
+            aws.check_deadline()
+            async with self.semaphore:
+                try:
+                    page = await pages.__anext__()
+                except StopAsyncIteration:
+                    return
+            handle_page(page)
+
+
+def count_pages(results, path, function, seen=None):
+    """Return a page handler counting the records of a page.
+
+    Args:
+        results (dict): Results in dictionary format to be appended.
+        path (tuple): The keys of the records in the page, see
+            `page_records`.
+        function (callable): The normalize function of the records.
+        seen (Optional set): See `pipeline.select`.
+
+    """
+    def handle_page(page):
+        count_records(results, page_records(page, path), function, seen)
+    return handle_page
+
+
+async def collect_ec2_instances(ec2, results):
+    """Count the running EC2 instances, in `aws.ec2_segments` segments.
+
+    Args:
+        ec2 (AsyncClient): The EC2 client.
+        results (dict): Results in dictionary format to be appended.
+
+    """
+    segments = [[]]
+    if aws.ec2_segments > 1:
+        segments = aws.segment_filters(await ec2.call(
+            'describe_availability_zones', AllAvailabilityZones=True),
+            aws.ec2_segments)
+    # instances can only be in one segment, but an instance seen twice
+    # must not be counted twice
+    seen = set() if len(segments) > 1 else None
+    await asyncio.gather(*[
+        ec2.paginate('describe_instances', count_pages(
+            results, ('Reservations', 'Instances'), aws.ec2_instance_record,
+            seen), Filters=[aws.RUNNING_FILTER] + filters)
+        for filters in segments])
+
+
+async def collect_ec2(ec2, results):
+    """Calculate the running/reserved instances in EC2, see `aws`.
+
+    Args:
+        ec2 (AsyncClient): The EC2 client.
+        results (dict): Results in dictionary format to be appended.
+
+    Returns:
+        The updated results dictionary.
+
+    """
+    attributes, _, reserved = await asyncio.gather(
+        ec2.call('describe_account_attributes',
+                 AttributeNames=['supported-platforms']),
+        collect_ec2_instances(ec2, results),
+        ec2.call('describe_reserved_instances',
+                 Filters=[{'Name': 'state', 'Values': ['active']}]))
+    account_is_vpc_only = [{'AttributeValue': 'VPC'}] == attributes[
+        'AccountAttributes'][0]['AttributeValues']
+    count_records(results, reserved['ReservedInstances'], functools.partial(
+        aws.ec2_reservation_record, account_is_vpc_only=account_is_vpc_only))
+    return results
+
+
+async def collect_rds(rds, results):
+    """Calculate the running/reserved instances in RDS, see `aws`."""
+    await asyncio.gather(
+        rds.paginate('describe_db_instances', count_pages(
+            results, ('DBInstances',), aws.rds_instance_record)),
+        rds.paginate('describe_reserved_db_instances', count_pages(
+            results, ('ReservedDBInstances',), aws.rds_reservation_record)))
+    return results
+
+
+async def collect_elc(elc, results):
+    """Calculate the running/reserved instances in ElastiCache."""
+    await asyncio.gather(
+        elc.paginate('describe_cache_clusters', count_pages(
+            results, ('CacheClusters',), aws.elc_cluster_record)),
+        elc.paginate('describe_reserved_cache_nodes', count_pages(
+            results, ('ReservedCacheNodes',), aws.elc_reservation_record)))
+    return results
+
+
+# asynchronous versions of the collector functions
+ASYNC_COLLECTORS = {
+    aws.calculate_ec2_ris: collect_ec2,
+    aws.calculate_rds_ris: collect_rds,
+    aws.calculate_elc_ris: collect_elc
+}
+
+
+def session_getter(account):
+    """Return a function creating the session of an account once."""
+    lock = threading.Lock()
+    session = []
+
+    def get_session():
+        with lock:
+            if not session:
+                session.append(aws.create_boto_session(account))
+        return session[0]
+    return get_session
+
+
+def run_in_thread(function, *args):
+    """Run a blocking function in the default thread pool."""
+    return asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+
+class AsyncScanner(object):
+    """Scan of the accounts on an event loop."""
+
+    def __init__(self, services, workers=None, progress=None, **options):
+        """Initialize a scan.
+
+        Args:
+            services (list): (report section, results prefix) tuples of the
+                services to collect.
+            workers (Optional int): How many calls may be in flight per
+                endpoint of each account.
+            progress (Optional callable): See `scan_accounts`.
+            **options: Checkpoint, retry, counts_only and utilization
+                options, as for `scan_account`.
+
+        """
+        self.services = services
+        self.limit = workers or ENDPOINT_CONCURRENCY
+        self.progress = progress
+        self.options = options
+        self.aio_session = AioSession()
+        # the clients open until the scan ends
+        self.exit_stack = AsyncExitStack()
+        # tasks creating the client of each session and service
+        self.clients = {}
+        # the units collected by AWS account ID, region and service
+        self.flights = set()
+
+    async def create_client(self, session, service):
+        """Open the asynchronous client of a service of a session."""
+        # refreshing assumed role credentials blocks
+        credentials = await run_in_thread(
+            lambda: session.get_credentials().get_frozen_credentials())
+        client = await self.exit_stack.enter_async_context(
+            self.aio_session.create_client(
+                service, region_name=session.region_name,
+                aws_access_key_id=credentials.access_key,
+                aws_secret_access_key=credentials.secret_key,
+                aws_session_token=credentials.token,
+                config=aws.client_config))
+        return AsyncClient(client, self.limit)
+
+    def client(self, session, service):
+        """Return the asynchronous client of a service of a session."""
+        key = (session, service)
+        if key not in self.clients:
+            self.clients[key] = asyncio.ensure_future(
+                self.create_client(session, service))
+        return self.clients[key]
+
+    async def collect(self, collector, get_session):
+        """Collect one service of an account, retrying transient errors."""
+        max_attempts = self.options.get('max_attempts', 1)
+        for attempt in range(1, max_attempts + 1):
+            if aws.deadline_passed():
+                raise DeadlineExceeded('Run deadline exceeded')
+            results = new_results(
+                self.services, self.options.get('counts_only', False))
+            try:
+                session = await run_in_thread(get_session)
+                function = ASYNC_COLLECTORS.get(collector.load())
+                if function is None:
+                    return await run_in_thread(
+                        collector.collect, session, results)
+                return await function(
+                    await self.client(session, collector.client), results)
+            except UNIT_ERRORS as error:
+                if (attempt >= max_attempts or aws.deadline_passed() or
+                        not retryable_error(error)):
+                    raise
+                await asyncio.sleep(self.options.get('retry_delay', 0) *
+                                    2 ** (attempt - 1))
+
+    async def load_unit(self, account, collector, get_session):
+        """Load a unit from its checkpoint, or collect it.
+
+        Returns:
+            A tuple of the results dictionary of the unit and None, or of
+            None and the failure dict of the unit.
+
+        """
+        unit = unit_name(account, collector)
+        checkpoints = self.options.get('checkpoints')
+        partial = None
+        if checkpoints and self.options.get('resume'):
+            partial = checkpoints.load(unit)
+        if partial is not None:
+            return partial, None
+        try:
+            partial = await self.collect(collector, get_session)
+        except UNIT_ERRORS + (DeadlineExceeded,) as error:
+            return None, unit_failure(account, collector, error)
+        if checkpoints:
+            checkpoints.save(unit, partial, self.services)
+        return partial, None
+
+    async def scan_account(self, account, coalesce):
+        """Collect the services of one account concurrently.
+
+        Args:
+            account (dict): The AWS Account to scan.
+            coalesce (bool): Whether another section may connect to the
+                same AWS account and region, whose units are then only
+                collected once.
+
+        Returns:
+            A tuple of the results dictionary of the account, and a list of
+            the units which failed.
+
+        """
+        get_session = session_getter(account)
+        collectors = enabled_collectors(account)
+        if coalesce:
+            try:
+                account_id = await run_in_thread(
+                    aws.get_account_id, account, get_session)
+            except UNIT_ERRORS + (DeadlineExceeded,):
+                account_id = None
+            if account_id is not None:
+                units = [(account_id, account['region'], collector.name)
+                         for collector in collectors]
+                # counted (or reported as failed) with the other section
+                collectors = [collector for collector, unit in zip(
+                    collectors, units) if unit not in self.flights]
+                self.flights.update(units)
+
+        results = new_results(
+            self.services, self.options.get('counts_only', False))
+        failures = []
+        for partial, failure in await asyncio.gather(*[
+                self.load_unit(account, collector, get_session)
+                for collector in collectors]):
+            if failure:
+                failures.append(failure)
+            else:
+                merge_results(results, partial)
+
+        utilization = self.options.get('utilization')
+        if utilization and results.get('instances'):
+            try:
+                session = await run_in_thread(get_session)
+                await run_in_thread(
+                    sample_utilization, session, results, utilization)
+            except UNIT_ERRORS + (DeadlineExceeded,):
+                # the instances are reported without their utilization
+                pass
+        if self.progress:
+            self.progress(account, self.services, results, failures)
+        return results, failures
+
+    async def scan_accounts(self, accounts):
+        """Collect every account concurrently.
+
+        Returns:
+            A tuple of the results for all accounts, a list of (account
+            name, results dict) tuples for each account, and the list of
+            failed units, in the order of the accounts.
+
+        """
+        overlapping = overlapping_regions(accounts)
+        async with self.exit_stack:
+            scanned = await asyncio.gather(*[
+                self.scan_account(account, account['region'] in overlapping)
+                for account in accounts])
+
+        results = new_results(
+            self.services, self.options.get('counts_only', False))
+        account_results = []
+        failures = []
+        for account, (partial, account_failures) in zip(accounts, scanned):
+            merge_results(results, partial)
+            account_results.append((account['name'], partial))
+            failures.extend(account_failures)
+        return results, account_results, failures
+
+
+def scan_accounts_async(accounts, services, workers=None, progress=None,
+                        **options):
+    """Collect the running/reserved instances of every account with asyncio.
+
+    Args:
+        accounts (list): The AWS Accounts to scan.
+        services (list): (report section, results prefix) tuples of the
+            services to collect.
+        workers (Optional int): How many calls may be in flight per endpoint
+            of each account. Defaults to `ENDPOINT_CONCURRENCY`.
+        progress (Optional callable): See `scan_accounts`.
+        **options: Options passed to `scan_account`.
+
+    Returns:
+        A tuple of the results for all accounts, a list of (account name,
+        results dict) tuples for each account, and the list of failed units,
+        as `scan_accounts`.
+
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(AsyncScanner(
+            services, workers, progress, **options).scan_accounts(accounts))
+    finally:
+        loop.close()
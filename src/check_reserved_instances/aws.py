@@ -1,23 +1,264 @@
 """Calculate the RI's for each AWS service."""
 
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import datetime
+import functools
+import threading
+import time
 
 import boto3
+from botocore.config import Config
+import botocore.session
 
-from check_reserved_instances.calculate import calc_expiry_time
+from check_reserved_instances import tracing
+from check_reserved_instances.calculate import merge_results
+from check_reserved_instances.pipeline import (
+    aggregate, count_records, fetch, Instance, Reservation)
+from check_reserved_instances.profiling import instrument_session
 
+# botocore configuration of every client created, see configure_clients
+client_config = None
+# concurrent segments of the describe_instances scan, see configure_clients
+ec2_segments = 1
 
-# instance IDs/name to report with unreserved instances
-instance_ids = defaultdict(list)
+# instance type prefixes, most common first, spread over the segments
+INSTANCE_TYPE_PREFIXES = 'mcrtgixpzdhuafvlebjknoqswy'
+RUNNING_FILTER = {'Name': 'instance-state-name', 'Values': ['running']}
+# the platform and tenancy of the size-flexible EC2 reservations
+LINUX_PLATFORM = 'Linux/UNIX'
+DEFAULT_TENANCY = 'default'
 
-# reserve expiration time to report with unused reservations
-reserve_expiry = defaultdict(list)
+# epoch time after which no more AWS calls are made, see set_deadline
+deadline = None
+# temporary credentials of assumed roles by role ARN, reused until they expire
+role_credentials = {}
+role_credentials_lock = threading.Lock()
+
+# creating boto3 clients isn't thread-safe, assuming roles is
+sts_client_lock = threading.Lock()
+# AWS account IDs by access key ID, see get_account_id
+account_ids = {}
+account_ids_lock = threading.Lock()
+# sessions reused by credentials and region, see reuse_sessions
+session_cache = None
+session_cache_lock = threading.Lock()
+
+# assumed role credentials expiring sooner than this are renewed
+CREDENTIALS_RENEWAL = datetime.timedelta(minutes=5)
+
+
+class DeadlineExceeded(Exception):
+    """The run deadline passed before an AWS call could be made."""
+
+
+def configure_clients(connection):
+    """Set the botocore configuration of every client created.
+
+    Also sets how many segments the EC2 instances are scanned in.
+
+    Args:
+        connection (dict): The [Connection] configuration. Options which are
+            None keep the botocore defaults.
+
+    """
+    global client_config, ec2_segments
+    ec2_segments = connection.get('ec2_segments') or 1
+    options = dict((name, connection[name]) for name in (
+        'connect_timeout', 'read_timeout', 'max_pool_connections')
+        if connection.get(name) is not None)
+    retries = dict((name, connection[option]) for name, option in (
+        ('mode', 'retry_mode'), ('max_attempts', 'max_retries'))
+        if connection.get(option) is not None)
+    if retries:
+        options['retries'] = retries
+    client_config = Config(**options) if options else None
+
+
+def set_deadline(seconds):
+    """Set the deadline after which AWS calls raise `DeadlineExceeded`.
+
+    Args:
+        seconds (float): Seconds from now, or None for no deadline.
+
+    """
+    global deadline
+    deadline = None if seconds is None else time.time() + seconds
+
+
+def client_settings():
+    """Return the client settings, to apply them in a worker process.
+
+    Returns:
+        A dict of the client configuration, EC2 segments and deadline.
+
+    """
+    return {
+        'client_config': client_config,
+        'ec2_segments': ec2_segments,
+        'deadline': deadline
+    }
+
+
+def apply_client_settings(settings):
+    """Apply the client settings of the parent process.
+
+    Args:
+        settings (dict): The output of `client_settings`.
+
+    """
+    global client_config, ec2_segments, deadline
+    client_config = settings['client_config']
+    ec2_segments = settings['ec2_segments']
+    deadline = settings['deadline']
+
+
+def deadline_passed():
+    """Return whether the run deadline has passed."""
+    return deadline is not None and time.time() >= deadline
+
+
+def check_deadline(**kwargs):
+    """Refuse to make AWS calls once the deadline passed.
+
+    Registered for the botocore 'before-call' event of every session.
+
+    """
+    if deadline_passed():
+        raise DeadlineExceeded('Run deadline exceeded')
+
+
+def assume_role(role_arn, region, source_role_arn=None):
+    """Assume an IAM role, reusing its credentials while they are valid.
+
+    Args:
+        role_arn (str): The ARN of the IAM role to assume.
+        region (str): The AWS region of the STS endpoint to use.
+        source_role_arn (Optional str): The ARN of an IAM role to assume
+            first, with whose credentials `role_arn` is assumed. Otherwise
+            the default credentials are used.
+
+    Returns:
+        The credentials dict of the AssumeRole response.
+
+    """
+    with role_credentials_lock:
+        credentials = role_credentials.get(role_arn)
+    if credentials and (credentials['Expiration'].replace(tzinfo=None) -
+                        datetime.datetime.utcnow() > CREDENTIALS_RENEWAL):
+        return credentials
+
+    if source_role_arn:
+        source_credentials = assume_role(source_role_arn, region)
+        with sts_client_lock:
+            sts_client = boto3.Session(
+                aws_access_key_id=source_credentials['AccessKeyId'],
+                aws_secret_access_key=source_credentials['SecretAccessKey'],
+                aws_session_token=source_credentials['SessionToken'],
+                region_name=region
+            ).client('sts', config=client_config)
+    else:
+        with sts_client_lock:
+            sts_client = boto3.client(
+                'sts', region_name=region, config=client_config)
+
+    credentials = sts_client.assume_role(
+        RoleArn=role_arn,
+        RoleSessionName='check-reserved-instances')['Credentials']
+    if credentials.get('Expiration'):
+        with role_credentials_lock:
+            role_credentials[role_arn] = credentials
+
+    return credentials
+
+
+def get_account_id(account, get_session):
+    """Return the ID of the AWS account an account section connects to.
+
+    The ID is read from the ARN of the role assumed, if any, otherwise the
+    account of the credentials is looked up with STS GetCallerIdentity, once
+    per access key ID.
+
+    Args:
+        account (dict): The AWS Account as loaded from the configuration
+            file.
+        get_session (callable): Function returning the account's boto3
+            session, only called if the account must be looked up.
+
+    Returns:
+        The AWS account ID.
+
+    """
+    # arn:aws:iam::123456789012:role/RoleName
+    arn_parts = (account.get('aws_role_arn') or '').split(':')
+    if len(arn_parts) > 4 and arn_parts[4]:
+        return arn_parts[4]
+
+    key = (account.get('aws_role_arn'), account['aws_access_key_id'])
+    with account_ids_lock:
+        if key in account_ids:
+            return account_ids[key]
+    account_id = get_session().client('sts').get_caller_identity()[
+        'Account']
+    with account_ids_lock:
+        account_ids[key] = account_id
+    return account_id
+
+
+@contextlib.contextmanager
+def reuse_sessions(cache):
+    """Reuse the sessions and clients of a cache while in the context.
+
+    Sessions are cached by region and credentials, so the sessions of
+    renewed role credentials are created again. Each cached session also
+    returns the same client when asked for the same one again, keeping the
+    loaded service models and connection pools warm between scans, e.g. the
+    invocations of a Lambda function.
+
+    Args:
+        cache (dict): The sessions by region and credentials, kept by the
+            caller between scans.
+
+    """
+    global session_cache
+    session_cache = cache
+    try:
+        yield cache
+    finally:
+        session_cache = None
+
+
+def reuse_clients(session):
+    """Make a session return the same client for the same arguments.
+
+    Args:
+        session (:boto3:session.Session): The session to cache clients of.
+
+    Returns:
+        The session.
+
+    """
+    clients = {}
+    create_client = session.client
+
+    def client(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        with session_cache_lock:
+            if key not in clients:
+                clients[key] = create_client(*args, **kwargs)
+            return clients[key]
+
+    session.client = client
+    return session
 
 
 def create_boto_session(account):
     """Set up the boto3 session to connect to AWS.
 
+    Every client created from the session uses `client_config` and checks
+    the run deadline before each call. Inside `reuse_sessions`, the session
+    of the same credentials and region is reused.
+
     Args:
         account (dict): The AWS Account to scan as loaded from the
             configuration file.
@@ -26,31 +267,54 @@ def create_boto_session(account):
         The authenticated boto3 session.
 
     """
+    check_deadline()
     aws_access_key_id = account['aws_access_key_id']
     aws_secret_access_key = account['aws_secret_access_key']
+    aws_session_token = None
     aws_role_arn = account['aws_role_arn']
     region = account['region']
 
     if aws_role_arn:
-        sts_client = boto3.client('sts', region_name=region)
-        creds = sts_client.assume_role(
-            RoleArn=aws_role_arn, RoleSessionName='check-reserved-instances')
-        aws_access_key_id = creds['Credentials']['AccessKeyId']
-        aws_secret_access_key = creds['Credentials']['SecretAccessKey']
-        aws_session_token = creds['Credentials']['SessionToken']
+        creds = assume_role(
+            aws_role_arn, region, account.get('source_role_arn'))
+        aws_access_key_id = creds['AccessKeyId']
+        aws_secret_access_key = creds['SecretAccessKey']
+        aws_session_token = creds['SessionToken']
+
+    cache = session_cache
+    key = (region, aws_access_key_id, aws_secret_access_key,
+           aws_session_token)
+    if cache is not None:
+        with session_cache_lock:
+            if key in cache:
+                return cache[key]
+
+    botocore_session = botocore.session.Session()
+    if client_config:
+        botocore_session.set_default_client_config(client_config)
+    botocore_session.register('before-call', check_deadline)
+    instrument_session(botocore_session)
+    tracing.instrument_session(botocore_session)
+
+    if aws_session_token:
         session = boto3.Session(
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
             aws_session_token=aws_session_token,
-            region_name=region
+            region_name=region,
+            botocore_session=botocore_session
         )
     else:
         session = boto3.Session(
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
-            region_name=region
+            region_name=region,
+            botocore_session=botocore_session
         )
 
+    if cache is not None:
+        with session_cache_lock:
+            session = cache.setdefault(key, reuse_clients(session))
     return session
 
 
@@ -78,85 +342,216 @@ def calculate_ec2_ris(session, results):
             AttributeNames=['supported-platforms'])['AccountAttributes'][0]
         ['AttributeValues'])
 
-    paginator = ec2_conn.get_paginator('describe_instances')
-    page_iterator = paginator.paginate(
-        Filters=[{'Name': 'instance-state-name', 'Values': ['running']}])
-
-    # Loop through running EC2 instances and record their AZ, type, and
-    # Instance ID or Name Tag if it exists.
-    for page in page_iterator:
-        for reservation in page['Reservations']:
-            for instance in reservation['Instances']:
-                # Ignore spot instances
-                if 'SpotInstanceRequestId' not in instance:
-                    az = instance['Placement']['AvailabilityZone']
-                    instance_type = instance['InstanceType']
-                    # Check for 'skip reservation' tag and name tag
-                    found_skip_tag = False
-                    instance_name = None
-                    if 'Tags' in instance:
-                        for tag in instance['Tags']:
-                            if tag['Key'] == 'NoReservation' and len(
-                                tag['Value']) > 0 and tag[
-                                    'Value'].lower() == 'true':
-                                found_skip_tag = True
-                            if tag['Key'] == 'Name' and len(tag['Value']) > 0:
-                                instance_name = tag['Value']
-
-                    # If skip tag is not found, increment running instances
-                    # count and add instance name/ID
-                    if not found_skip_tag:
-                        # not in vpc
-                        if not instance.get('VpcId'):
-                            results['ec2_classic_running_instances'][(
-                                instance_type,
-                                az)] = results[
-                                'ec2_classic_running_instances'].get(
-                                (instance_type, az), 0) + 1
-                            instance_ids[(instance_type, az)].append(
-                                instance['InstanceId'] if not instance_name
-                                else instance_name)
-                        else:
-                            # inside vpc
-                            results['ec2_vpc_running_instances'][
-                                (instance_type,
-                                 az)] = results[
-                                'ec2_vpc_running_instances'].get(
-                                (instance_type, az), 0) + 1
-                            instance_ids[(instance_type, az)].append(
-                                instance['InstanceId'] if not instance_name
-                                else instance_name)
-
-    # Loop through active EC2 RIs and record their AZ and type.
-    for reserved_instance in ec2_conn.describe_reserved_instances(
+    segments = ec2_instance_segments(ec2_conn, ec2_segments)
+    if len(segments) == 1:
+        add_ec2_instances(ec2_conn, results, segments[0])
+    else:
+        # instances can only be in one segment, but an instance seen twice
+        # must not be counted twice
+        seen = set()
+        parent = tracing.current_span()
+
+        def add_segment(filters):
+            with tracing.attach(parent):
+                return add_ec2_instances(
+                    ec2_conn, dict((name, {}) for name in results), filters,
+                    seen)
+
+        executor = ThreadPoolExecutor(max_workers=ec2_segments)
+        try:
+            partials = list(executor.map(add_segment, segments))
+        finally:
+            executor.shutdown()
+        for partial in partials:
+            merge_results(results, partial)
+
+    # Count the active EC2 RIs by their AZ and type.
+    count_records(
+        results, ec2_conn.describe_reserved_instances(
             Filters=[{'Name': 'state', 'Values': ['active']}])[
-            'ReservedInstances']:
-        # Detect if an EC2 RI is a regional benefit RI or not
-        if reserved_instance['Scope'] == 'Availability Zone':
-            az = reserved_instance['AvailabilityZone']
-        else:
-            az = 'All'
-
-        instance_type = reserved_instance['InstanceType']
-        # check if VPC/Classic reserved instance
-        if account_is_vpc_only or 'VPC' in reserved_instance.get(
-                'ProductDescription'):
-            results['ec2_vpc_reserved_instances'][(
-                instance_type, az)] = results[
-                'ec2_vpc_reserved_instances'].get(
-                (instance_type, az), 0) + reserved_instance['InstanceCount']
-        else:
-            results['ec2_classic_reserved_instances'][(
-                instance_type, az)] = results[
-                'ec2_classic_reserved_instances'].get(
-                (instance_type, az), 0) + reserved_instance['InstanceCount']
-
-        reserve_expiry[(instance_type, az)].append(calc_expiry_time(
-            expiry=reserved_instance['End']))
+            'ReservedInstances'],
+        functools.partial(ec2_reservation_record,
+                          account_is_vpc_only=account_is_vpc_only))
 
     return results
 
 
+def ec2_instance_segments(ec2_conn, segments):
+    """Split the running instances into disjoint describe_instances filters.
+
+    Args:
+        ec2_conn (:boto3:client.EC2): The EC2 client.
+        segments (int): How many segments to aim for.
+
+    Returns:
+        A list of the filters of each segment, see `segment_filters`.
+
+    """
+    if segments <= 1:
+        return [[]]
+    return segment_filters(ec2_conn.describe_availability_zones(
+        AllAvailabilityZones=True), segments)
+
+
+def segment_filters(zones_response, segments):
+    """Return the describe_instances filters of each segment.
+
+    The instances are split by availability zone, then by groups of
+    instance type prefixes when more segments than zones are wanted.
+
+    Args:
+        zones_response (dict): The response of DescribeAvailabilityZones.
+        segments (int): How many segments to aim for.
+
+    Returns:
+        A list of the filters of each segment, besides the running state.
+
+    """
+    zones = [zone['ZoneName']
+             for zone in zones_response['AvailabilityZones']]
+    if segments <= 1 or not zones:
+        return [[]]
+
+    type_segments = min(-(-segments // len(zones)),
+                        len(INSTANCE_TYPE_PREFIXES))
+    filters = []
+    for zone in zones:
+        for index in range(type_segments):
+            segment = [{'Name': 'availability-zone', 'Values': [zone]}]
+            if type_segments > 1:
+                segment.append({'Name': 'instance-type', 'Values': [
+                    prefix + '*' for prefix in
+                    INSTANCE_TYPE_PREFIXES[index::type_segments]]})
+            filters.append(segment)
+    return filters
+
+
+def add_ec2_instances(ec2_conn, results, filters, seen=None):
+    """Count the running EC2 instances matching filters.
+
+    Args:
+        ec2_conn (:boto3:client.EC2): The EC2 client.
+        results (dict): Results in dictionary format to be appended.
+        filters (list): describe_instances filters, besides the running
+            state.
+        seen (Optional set): IDs of the instances counted by any segment,
+            to skip them.
+
+    Returns:
+        The updated results dictionary.
+
+    """
+    # Count the running EC2 instances by their AZ and type, with their
+    # Instance ID or Name Tag if it exists.
+    return count_records(
+        results, fetch(ec2_conn, 'describe_instances',
+                       ('Reservations', 'Instances'),
+                       Filters=[RUNNING_FILTER] + filters),
+        ec2_instance_record, seen)
+
+
+def ec2_instance_record(instance):
+    """Normalize a running EC2 instance.
+
+    Args:
+        instance (dict): The instance as returned by DescribeInstances.
+
+    Returns:
+        The `Instance` record, skipped for spot instances and instances
+        tagged with NoReservation.
+
+    """
+    # Ignore spot instances
+    skip = 'spot' if 'SpotInstanceRequestId' in instance else None
+
+    # Check for 'skip reservation' tag and name tag
+    instance_name = None
+    for tag in instance.get('Tags', ()):
+        if tag['Key'] == 'NoReservation' and len(
+                tag['Value']) > 0 and tag['Value'].lower() == 'true':
+            skip = skip or 'NoReservation tag'
+        if tag['Key'] == 'Name' and len(tag['Value']) > 0:
+            instance_name = tag['Value']
+
+    if not instance.get('VpcId'):
+        # not in vpc
+        name = 'ec2_classic_running_instances'
+    else:
+        # inside vpc
+        name = 'ec2_vpc_running_instances'
+    return Instance(
+        name,
+        (instance['InstanceType'], instance['Placement']['AvailabilityZone']),
+        instance['InstanceId'], instance_name or instance['InstanceId'], skip,
+        instance.get('LaunchTime'),
+        instance.get('PlatformDetails') == LINUX_PLATFORM and
+        instance['Placement'].get('Tenancy', 'default') == DEFAULT_TENANCY)
+
+
+def ec2_reservation_record(reserved_instance, account_is_vpc_only):
+    """Normalize an active EC2 reserved instance.
+
+    Args:
+        reserved_instance (dict): The reservation as returned by
+            DescribeReservedInstances.
+        account_is_vpc_only (bool): Whether the account supports VPC only.
+
+    Returns:
+        The `Reservation` record.
+
+    """
+    # Detect if an EC2 RI is a regional benefit RI or not
+    if reserved_instance['Scope'] == 'Availability Zone':
+        az = reserved_instance['AvailabilityZone']
+    else:
+        az = 'All'
+
+    # check if VPC/Classic reserved instance
+    if account_is_vpc_only or 'VPC' in reserved_instance.get(
+            'ProductDescription'):
+        name = 'ec2_vpc_reserved_instances'
+    else:
+        name = 'ec2_classic_reserved_instances'
+
+    # only the regional Linux/UNIX reservations of the default tenancy are
+    # size flexible
+    size_flexible = (
+        az == 'All' and reserved_instance.get('InstanceTenancy') ==
+        DEFAULT_TENANCY and reserved_instance.get(
+            'ProductDescription', '').replace(' (Amazon VPC)', '') ==
+        LINUX_PLATFORM)
+
+    return Reservation(
+        name, (reserved_instance['InstanceType'], az),
+        reserved_instance['InstanceCount'], reserved_instance['End'],
+        reserved_instance.get('ReservedInstancesId'), None, size_flexible)
+
+
+def add_ec2_instance(results, instance):
+    """Count a running EC2 instance.
+
+    Args:
+        results (dict): Global results in dictionary format to be appended.
+        instance (dict): The instance as returned by DescribeInstances.
+
+    """
+    count_records(results, [instance], ec2_instance_record)
+
+
+def add_ec2_reservation(results, reserved_instance, account_is_vpc_only):
+    """Count an active EC2 reserved instance.
+
+    Args:
+        results (dict): Global results in dictionary format to be appended.
+        reserved_instance (dict): The reservation as returned by
+            DescribeReservedInstances.
+        account_is_vpc_only (bool): Whether the account supports VPC only.
+
+    """
+    aggregate(results, [ec2_reservation_record(
+        reserved_instance, account_is_vpc_only)])
+
+
 def calculate_elc_ris(session, results):
     """Calculate the running/reserved instances in ElastiCache.
 
@@ -170,49 +565,63 @@ def calculate_elc_ris(session, results):
     """
     elc_conn = session.client('elasticache')
 
-    paginator = elc_conn.get_paginator('describe_cache_clusters')
-    page_iterator = paginator.paginate()
-    # Loop through running ElastiCache instance and record their engine,
-    # type, and name.
-    for page in page_iterator:
-        for instance in page['CacheClusters']:
-            if instance['CacheClusterStatus'] == 'available':
-                engine = instance['Engine']
-                instance_type = instance['CacheNodeType']
-
-                results['elc_running_instances'][(
-                    instance_type, engine)] = results[
-                    'elc_running_instances'].get(
-                        (instance_type, engine), 0) + 1
-                instance_ids[(instance_type, engine)].append(
-                    instance['CacheClusterId'])
-
-    paginator = elc_conn.get_paginator('describe_reserved_cache_nodes')
-    page_iterator = paginator.paginate()
-    # Loop through active ElastiCache RIs and record their type and engine.
-    for page in page_iterator:
-        for reserved_instance in page['ReservedCacheNodes']:
-            if reserved_instance['State'] == 'active':
-                engine = reserved_instance['ProductDescription']
-                instance_type = reserved_instance['CacheNodeType']
-
-                results['elc_reserved_instances'][(instance_type, engine)] = (
-                    results['elc_reserved_instances'].get((
-                        instance_type, engine), 0) + reserved_instance[
-                        'CacheNodeCount'])
-
-                # No end datetime is returned, so calculate from 'StartTime'
-                # (a `DateTime`) and 'Duration' in seconds (integer)
-                expiry_time = reserved_instance[
-                    'StartTime'] + datetime.timedelta(
-                        seconds=reserved_instance['Duration'])
-
-                reserve_expiry[(instance_type, engine)].append(
-                    calc_expiry_time(expiry=expiry_time))
+    # Count the available ElastiCache clusters by their engine and type,
+    # with their name.
+    count_records(
+        results, fetch(elc_conn, 'describe_cache_clusters',
+                       ('CacheClusters',)),
+        elc_cluster_record)
+
+    # Count the active ElastiCache RIs by their type and engine.
+    count_records(
+        results, fetch(elc_conn, 'describe_reserved_cache_nodes',
+                       ('ReservedCacheNodes',)),
+        elc_reservation_record)
 
     return results
 
 
+def elc_cluster_record(instance):
+    """Normalize an ElastiCache cluster.
+
+    Args:
+        instance (dict): The cluster as returned by DescribeCacheClusters.
+
+    Returns:
+        The `Instance` record, skipped unless the cluster is available.
+
+    """
+    status = instance['CacheClusterStatus']
+    return Instance(
+        'elc_running_instances',
+        (instance['CacheNodeType'], instance['Engine']),
+        instance['CacheClusterId'], instance['CacheClusterId'],
+        None if status == 'available' else status,
+        instance.get('CacheClusterCreateTime'), False)
+
+
+def elc_reservation_record(reserved_instance):
+    """Normalize an ElastiCache reserved node.
+
+    Args:
+        reserved_instance (dict): The reservation as returned by
+            DescribeReservedCacheNodes.
+
+    Returns:
+        The `Reservation` record, skipped unless the reservation is active.
+
+    """
+    state = reserved_instance['State']
+    return Reservation(
+        'elc_reserved_instances',
+        (reserved_instance['CacheNodeType'],
+         reserved_instance['ProductDescription']),
+        reserved_instance['CacheNodeCount'],
+        reservation_end(reserved_instance),
+        reserved_instance.get('ReservedCacheNodeId'),
+        None if state == 'active' else state, False)
+
+
 def calculate_rds_ris(session, results):
     """Calculate the running/reserved instances in RDS.
 
@@ -226,42 +635,65 @@ def calculate_rds_ris(session, results):
     """
     rds_conn = session.client('rds')
 
-    paginator = rds_conn.get_paginator('describe_db_instances')
-    page_iterator = paginator.paginate()
-
-    # Loop through running RDS instances and record their Multi-AZ setting,
-    # type, and Name
-    for page in page_iterator:
-        for instance in page['DBInstances']:
-            az = instance['MultiAZ']
-            instance_type = instance['DBInstanceClass']
-            results['rds_running_instances'][(
-                instance_type, az)] = results['rds_running_instances'].get(
-                    (instance_type, az), 0) + 1
-            instance_ids[(instance_type, az)].append(
-                instance['DBInstanceIdentifier'])
-
-    paginator = rds_conn.get_paginator('describe_reserved_db_instances')
-    page_iterator = paginator.paginate()
-    # Loop through active RDS RIs and record their type and Multi-AZ setting.
-    for page in page_iterator:
-        for reserved_instance in page['ReservedDBInstances']:
-            if reserved_instance['State'] == 'active':
-                az = reserved_instance['MultiAZ']
-                instance_type = reserved_instance['DBInstanceClass']
-                results['rds_reserved_instances'][(
-                    instance_type, az)] = results[
-                    'rds_reserved_instances'].get(
-                    (instance_type, az), 0) + reserved_instance[
-                    'DBInstanceCount']
-
-                # No end datetime is returned, so calculate from 'StartTime'
-                # (a `DateTime`) and 'Duration' in seconds (integer)
-                expiry_time = reserved_instance[
-                    'StartTime'] + datetime.timedelta(
-                        seconds=reserved_instance['Duration'])
-
-                reserve_expiry[(instance_type, az)].append(calc_expiry_time(
-                    expiry=expiry_time))
+    # Count the running RDS instances by their Multi-AZ setting and type,
+    # with their Name
+    count_records(
+        results, fetch(rds_conn, 'describe_db_instances', ('DBInstances',)),
+        rds_instance_record)
+
+    # Count the active RDS RIs by their type and Multi-AZ setting.
+    count_records(
+        results, fetch(rds_conn, 'describe_reserved_db_instances',
+                       ('ReservedDBInstances',)),
+        rds_reservation_record)
 
     return results
+
+
+def rds_instance_record(instance):
+    """Normalize a running RDS instance.
+
+    Args:
+        instance (dict): The instance as returned by DescribeDBInstances.
+
+    Returns:
+        The `Instance` record.
+
+    """
+    return Instance(
+        'rds_running_instances',
+        (instance['DBInstanceClass'], instance['MultiAZ']),
+        instance['DBInstanceIdentifier'], instance['DBInstanceIdentifier'],
+        None, instance.get('InstanceCreateTime'), False)
+
+
+def rds_reservation_record(reserved_instance):
+    """Normalize an RDS reserved instance.
+
+    Args:
+        reserved_instance (dict): The reservation as returned by
+            DescribeReservedDBInstances.
+
+    Returns:
+        The `Reservation` record, skipped unless the reservation is active.
+
+    """
+    state = reserved_instance['State']
+    return Reservation(
+        'rds_reserved_instances',
+        (reserved_instance['DBInstanceClass'], reserved_instance['MultiAZ']),
+        reserved_instance['DBInstanceCount'],
+        reservation_end(reserved_instance),
+        reserved_instance.get('ReservedDBInstanceId'),
+        None if state == 'active' else state, False)
+
+
+def reservation_end(reserved_instance):
+    """Return when an RDS or ElastiCache reservation ends.
+
+    No end datetime is returned, so calculate from 'StartTime' (a
+    `DateTime`) and 'Duration' in seconds (integer).
+
+    """
+    return reserved_instance['StartTime'] + datetime.timedelta(
+        seconds=reserved_instance['Duration'])
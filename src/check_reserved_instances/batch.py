@@ -0,0 +1,177 @@
+"""Scan the accounts of several configurations once, then report each.
+
+Teams often keep their own configuration files listing the same accounts
+with different email settings. In batch mode, the account sections of
+every configuration are planned together: the sections with the same
+credentials and region, and in the regions of several sections those
+connecting to the same AWS account ID, are scanned once, with every
+service any of them enables. The results of each configuration are then
+assembled from the shared results of its sections, keeping only the
+services they enable.
+
+The scan settings ([Connection], [Checkpoint], retries and [Utilization]
+sampling) are those of the first configuration, the report settings of
+each configuration apply to its own report.
+"""
+
+from collections import OrderedDict
+import glob
+import os
+
+from check_reserved_instances.aws import (
+    create_boto_session, DeadlineExceeded, get_account_id)
+from check_reserved_instances.calculate import (
+    merge_results, new_results, select_services)
+from check_reserved_instances.collectors import (
+    enabled_collectors, get_collector, registry, report_sections)
+from check_reserved_instances.profiling import stage
+from check_reserved_instances.scan import (
+    get_accounts, overlapping_regions, scan, UNIT_ERRORS)
+
+# the configuration files of a directory
+CONFIG_PATTERN = '*.ini'
+
+
+def config_paths(paths):
+    """Expand the directories of configuration files.
+
+    Args:
+        paths (list): The paths of configuration files or directories.
+
+    Returns:
+        The paths of the configuration files, those of each directory in
+        name order.
+
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path, CONFIG_PATTERN))))
+        else:
+            found.append(path)
+    return found
+
+
+def section_key(account):
+    """Return what identifies the connection of an account section.
+
+    Sections with the same credentials, role and region connect to the same
+    AWS account, whatever their name and enabled services.
+
+    """
+    return tuple(sorted(
+        (option, repr(value)) for option, value in account.items()
+        if option != 'name' and option not in registry))
+
+
+def plan_batch(account_lists):
+    """Group the account sections of several configurations.
+
+    Args:
+        account_lists (list): The AWS Accounts of each configuration.
+
+    Returns:
+        An (accounts, members) tuple: the accounts to scan, one per group of
+        sections, enabling every service of its sections, and for each
+        configuration, the position in `accounts` of each of its sections.
+
+    """
+    sections = OrderedDict()
+    for accounts in account_lists:
+        for account in accounts:
+            sections.setdefault(section_key(account), account)
+
+    # sections with other credentials in the same region may still connect
+    # to the same AWS account
+    overlapping = overlapping_regions(list(sections.values()))
+    groups = {}
+    for key, account in sections.items():
+        groups[key] = key
+        if account['region'] in overlapping:
+            try:
+                groups[key] = (get_account_id(
+                    account, lambda: create_boto_session(account)),
+                    account['region'])
+            except UNIT_ERRORS + (DeadlineExceeded,):
+                pass
+
+    accounts = []
+    positions = {}
+    members = []
+    for config_accounts in account_lists:
+        config_members = []
+        for account in config_accounts:
+            group = groups[section_key(account)]
+            if group not in positions:
+                positions[group] = len(accounts)
+                accounts.append(dict(account))
+            for collector in enabled_collectors(account):
+                accounts[positions[group]][collector.name] = True
+            config_members.append(positions[group])
+        members.append(config_members)
+    return accounts, members
+
+
+def config_results(accounts, members, shared, shared_failures):
+    """Assemble the results of a configuration from the shared results.
+
+    Args:
+        accounts (list): The AWS Accounts of the configuration.
+        members (list): The position of each account in the shared results.
+        shared (list): The (account name, results dict) tuples of the
+            accounts scanned, as returned by `scan`.
+        shared_failures (list): The units which could not be scanned.
+
+    Returns:
+        A tuple of the results, services, account results and failures of
+        the configuration, as returned by `scan`.
+
+    """
+    services = report_sections(accounts)
+    # the services of the configuration's sections, by account scanned
+    collectors = OrderedDict()
+    for account, position in zip(accounts, members):
+        collectors.setdefault(position, set()).update(
+            collector.name for collector in enabled_collectors(account))
+
+    results = new_results(services)
+    account_results = []
+    failures = []
+    for account, position in zip(accounts, members):
+        names = collectors.pop(position, None)
+        if names is None:
+            # counted with a previous section of the same account
+            account_results.append((account['name'], new_results(services)))
+            continue
+        partial = select_services(shared[position][1], [
+            section for name in sorted(names)
+            for section in get_collector(name).sections])
+        merge_results(results, partial)
+        account_results.append((account['name'], partial))
+        failures.extend(
+            dict(failure, account=account['name'])
+            for failure in shared_failures
+            if failure['account'] == shared[position][0] and
+            failure['region'] == account['region'] and
+            failure['service'] in names)
+    return results, services, account_results, failures
+
+
+def scan_batch(configs):
+    """Scan the accounts of several configurations in one pass.
+
+    Args:
+        configs (list): The application configurations.
+
+    Returns:
+        The output of `scan` for each configuration.
+
+    """
+    with stage('plan batch'):
+        account_lists = [get_accounts(config) for config in configs]
+        accounts, members = plan_batch(account_lists)
+    _, _, shared, failures = scan(configs[0], accounts=accounts)
+    return [config_results(config_accounts, config_members, shared,
+                           failures)
+            for config_accounts, config_members in zip(account_lists,
+                                                       members)]
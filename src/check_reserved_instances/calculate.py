@@ -1,7 +1,13 @@
 """Results calculation functions."""
 
+import calendar
 import datetime
 
+# results entries holding per-key lists rather than counts
+RESULTS_LISTS = ('instance_ids', 'reserve_expiry')
+# results entries indexing the records counted by instance/reservation ID
+RESULTS_INDEXES = ('instances', 'reservations', 'utilization')
+
 
 def calc_expiry_time(expiry):
     """Calculate the number of days until the reserved instance expires.
@@ -92,3 +98,236 @@ def report_diffs(running_instances, reserved_instances):
         'qty_running_instances': qty_running_instances,
         'qty_reserved_instances': qty_reserved_instances
     }
+
+
+def new_results(services, counts_only=False):
+    """Create an empty results dictionary.
+
+    Args:
+        services (list): (report section, results prefix) tuples of the
+            services to collect.
+        counts_only (Optional bool): Whether to only count the instances and
+            the days until reservations expire, without recording instance
+            IDs/names or indexing the records by ID.
+
+    Returns:
+        A dict with an empty running and reserved instances dict for each
+        service, keyed as '<prefix>_running_instances' and
+        '<prefix>_reserved_instances', and the empty `RESULTS_LISTS` and
+        `RESULTS_INDEXES` dicts:
+
+        - instance_ids: instance IDs/names by key, to report with unreserved
+          instances.
+        - reserve_expiry: days until expiry by key, to report with unused
+          reservations.
+        - instances: (results name, key, instance ID/name, launch timestamp,
+          size flexible) by instance ID, see the coverage module.
+        - reservations: (results name, key, count, days until expiry, expiry
+          timestamp, size flexible) by reservation ID.
+        - utilization: (results name, key, average CPU) of the instances
+          sampled by instance ID, see the utilization module.
+
+        With `counts_only`, only reserve_expiry is kept.
+
+    """
+    results = {}
+    for _, prefix in services:
+        results[prefix + '_running_instances'] = {}
+        results[prefix + '_reserved_instances'] = {}
+    for name in RESULTS_LISTS + RESULTS_INDEXES:
+        if not counts_only or name == 'reserve_expiry':
+            results[name] = {}
+    return results
+
+
+def merge_results(results, partial):
+    """Add the counts from one results dictionary into another.
+
+    Args:
+        results (dict): Results dictionary to be appended.
+        partial (dict): Results dictionary, usually of a single account, whose
+            counts, lists and indexes are added to `results`.
+
+    Returns:
+        The updated `results` dictionary.
+
+    """
+    for name, values in partial.items():
+        totals = results.setdefault(name, {})
+        if name in RESULTS_INDEXES:
+            totals.update(values)
+        elif name in RESULTS_LISTS:
+            for placement_key, items in values.items():
+                totals.setdefault(placement_key, []).extend(items)
+        else:
+            for placement_key, count in values.items():
+                totals[placement_key] = totals.get(placement_key, 0) + count
+    return results
+
+
+def select_services(results, services):
+    """Return the part of a results dictionary of some services.
+
+    The per-key lists are rebuilt from the indexes, so the reservations
+    counted without an ID lose their days until expiry.
+
+    Args:
+        results (dict): Results dictionary, with the `RESULTS_INDEXES`.
+        services (list): (report section, results prefix) tuples of the
+            services to keep.
+
+    Returns:
+        A new results dictionary of the services.
+
+    """
+    selected = new_results(services)
+    for name in selected:
+        if name in results and name not in RESULTS_LISTS + RESULTS_INDEXES:
+            selected[name] = dict(results[name])
+    for instance_id, record in results.get('instances', {}).items():
+        if record[0] in selected:
+            selected['instances'][instance_id] = record
+            selected['instance_ids'].setdefault(record[1], []).append(
+                record[2])
+    for reservation_id, record in results.get('reservations', {}).items():
+        if record[0] in selected:
+            selected['reservations'][reservation_id] = record
+            selected['reserve_expiry'].setdefault(record[1], []).append(
+                record[3])
+    for instance_id, record in results.get('utilization', {}).items():
+        if record[0] in selected:
+            selected['utilization'][instance_id] = record
+    return selected
+
+
+def add_instance(results, name, placement_key, instance_id, label,
+                 launched_at=None, size_flexible=False):
+    """Count a running instance.
+
+    Args:
+        results (dict): Results dictionary to be appended.
+        name (str): The running instances entry of the results to count the
+            instance in.
+        placement_key (tuple): The unique identifier for RI's (instance type
+            and availability zone, engine or Multi-AZ setting).
+        instance_id (str): The unique ID of the instance.
+        label (str): The instance ID or name to report the instance with.
+        launched_at (Optional DateTime): When the instance was launched, if
+            known.
+        size_flexible (Optional bool): Whether the instance is known to run
+            Linux/UNIX on default tenancy, so that size-flexible
+            reservations can cover it.
+
+    """
+    counts = results[name]
+    counts[placement_key] = counts.get(placement_key, 0) + 1
+    if 'instances' in results:
+        results['instance_ids'].setdefault(placement_key, []).append(label)
+        results['instances'][instance_id] = (
+            name, placement_key, label,
+            calendar.timegm(launched_at.utctimetuple()) if launched_at
+            else None, size_flexible)
+
+
+def add_reservation(results, name, placement_key, count, expiry,
+                    reservation_id=None, size_flexible=False):
+    """Count a reservation.
+
+    Args:
+        results (dict): Results dictionary to be appended.
+        name (str): The reserved instances entry of the results to count the
+            reservation in.
+        placement_key (tuple): The unique identifier for RI's.
+        count (int): The number of instances reserved.
+        expiry (DateTime): The date when the reservation will expire.
+        reservation_id (Optional str): The unique ID of the reservation.
+        size_flexible (Optional bool): Whether the reservation is a regional
+            Linux/UNIX reservation of the default tenancy, which covers the
+            other sizes of its instance family.
+
+    """
+    counts = results[name]
+    counts[placement_key] = counts.get(placement_key, 0) + count
+    days = calc_expiry_time(expiry=expiry)
+    results['reserve_expiry'].setdefault(placement_key, []).append(days)
+    if reservation_id and 'reservations' in results:
+        results['reservations'][reservation_id] = (
+            name, placement_key, count, days,
+            calendar.timegm(expiry.utctimetuple()), size_flexible)
+
+
+def remove_instance(results, instance_id):
+    """Stop counting a running instance.
+
+    Args:
+        results (dict): Results dictionary to be updated.
+        instance_id (str): The unique ID of the instance.
+
+    Returns:
+        Whether the instance was counted.
+
+    """
+    if instance_id not in results['instances']:
+        return False
+    name, placement_key, label = results['instances'].pop(instance_id)[:3]
+    _decrement(results[name], placement_key, 1)
+    _remove_item(results['instance_ids'], placement_key, label)
+    results.get('utilization', {}).pop(instance_id, None)
+    return True
+
+
+def remove_reservation(results, reservation_id):
+    """Stop counting a reservation.
+
+    Args:
+        results (dict): Results dictionary to be updated.
+        reservation_id (str): The unique ID of the reservation.
+
+    Returns:
+        Whether the reservation was counted.
+
+    """
+    if reservation_id not in results['reservations']:
+        return False
+    name, placement_key, count, days = results['reservations'].pop(
+        reservation_id)[:4]
+    _decrement(results[name], placement_key, count)
+    _remove_item(results['reserve_expiry'], placement_key, days)
+    return True
+
+
+def _decrement(counts, placement_key, count):
+    """Decrement a count, removing it once zero."""
+    counts[placement_key] -= count
+    if counts[placement_key] <= 0:
+        del counts[placement_key]
+
+
+def _remove_item(lists, placement_key, item):
+    """Remove an item from a per-key list, removing the list once empty."""
+    items = lists.get(placement_key, [])
+    if item in items:
+        items.remove(item)
+    if not items:
+        lists.pop(placement_key, None)
+
+
+def build_report(results, services):
+    """Calculate the differences for every service in the results.
+
+    Args:
+        results (dict): Results dictionary as returned by `new_results` and
+            filled in by the collectors.
+        services (list): (report section, results prefix) tuples of the
+            services to report on.
+
+    Returns:
+        A dict keyed by service name with the output of `report_diffs`.
+
+    """
+    report = {}
+    for service, prefix in services:
+        report[service] = report_diffs(
+            results[prefix + '_running_instances'],
+            results[prefix + '_reserved_instances'])
+    return report
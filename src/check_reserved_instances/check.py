@@ -0,0 +1,150 @@
+"""Evaluate the results against thresholds as a monitoring check.
+
+The status and output follow the Nagios plugin conventions, so the check
+can be run by Nagios, Icinga, Sensu and similar monitoring systems.
+"""
+
+from check_reserved_instances.calculate import build_report
+
+# Nagios plugin exit codes
+OK = 0
+WARNING = 1
+CRITICAL = 2
+UNKNOWN = 3
+STATUS_NAMES = {
+    OK: 'OK',
+    WARNING: 'WARNING',
+    CRITICAL: 'CRITICAL',
+    UNKNOWN: 'UNKNOWN'
+}
+
+
+def calc_totals(results, services):
+    """Total the counts of every service in the results.
+
+    Args:
+        results (dict): Results dictionary, usually collected with
+            `counts_only`.
+        services (list): (report section, results prefix) tuples of the
+            services in the results.
+
+    Returns:
+        A dict of the running, reserved and unreserved instance totals, and
+        the days until each reservation expires.
+
+    """
+    totals = {'running': 0, 'reserved': 0, 'unreserved': 0}
+    for diffs in build_report(results, services).values():
+        totals['running'] += diffs['qty_running_instances']
+        totals['reserved'] += diffs['qty_reserved_instances']
+        totals['unreserved'] += sum(diffs['unreserved_instances'].values())
+    totals['expiry_days'] = [days for expiry in
+                             results['reserve_expiry'].values()
+                             for days in expiry]
+    return totals
+
+
+def threshold_status(value, warning, critical, above=True):
+    """Return the status of a value against its thresholds.
+
+    Args:
+        value: The measured value.
+        warning: The warning threshold, or None.
+        critical: The critical threshold, or None.
+        above (Optional bool): Whether values above the thresholds alert,
+            otherwise values below them do.
+
+    Returns:
+        OK, WARNING or CRITICAL.
+
+    """
+    def exceeds(threshold):
+        if threshold is None:
+            return False
+        return value > threshold if above else value < threshold
+
+    if exceeds(critical):
+        return CRITICAL
+    if exceeds(warning):
+        return WARNING
+    return OK
+
+
+def perfdata(label, value, unit='', warning=None, critical=None):
+    """Format a Nagios performance data item."""
+    return "'{}'={}{};{};{};0".format(
+        label, value, unit, '' if warning is None else warning,
+        '' if critical is None else critical)
+
+
+def check_results(results, services, thresholds, failures=None):
+    """Evaluate the results against the thresholds of the check.
+
+    Args:
+        results (dict): Results dictionary, usually collected with
+            `counts_only`.
+        services (list): (report section, results prefix) tuples of the
+            services in the results.
+        thresholds (dict): The [Check] configuration.
+        failures (Optional list): The units which could not be scanned.
+
+    Returns:
+        A tuple of the exit status and the line of output, made of a summary
+        and the performance data.
+
+    """
+    totals = calc_totals(results, services)
+    coverage = 100.0
+    if totals['running']:
+        coverage = round(100.0 * (totals['running'] - totals['unreserved']) /
+                         totals['running'], 1)
+
+    statuses = [
+        threshold_status(totals['unreserved'],
+                         thresholds.get('warning_unreserved'),
+                         thresholds.get('critical_unreserved')),
+        threshold_status(coverage, thresholds.get('warning_coverage'),
+                         thresholds.get('critical_coverage'), above=False)
+    ]
+    summary = ['{} unreserved'.format(totals['unreserved']),
+               '{}% coverage'.format(coverage)]
+
+    warning_days = thresholds.get('warning_expiry_days')
+    critical_days = thresholds.get('critical_expiry_days')
+    expiring = None
+    if warning_days is not None or critical_days is not None:
+        # the longest threshold, so the expiring count covers both
+        within = max(days for days in (warning_days, critical_days)
+                     if days is not None)
+        expiring = len([days for days in totals['expiry_days']
+                        if days <= within])
+        soonest = min(totals['expiry_days'] or [within + 1])
+        if critical_days is not None and soonest <= critical_days:
+            statuses.append(CRITICAL)
+        elif warning_days is not None and soonest <= warning_days:
+            statuses.append(WARNING)
+        summary.append('{} reservations expiring within {} days'.format(
+            expiring, within))
+
+    status = max(statuses)
+    if failures:
+        # the counts are incomplete, unless already critical
+        if status != CRITICAL:
+            status = UNKNOWN
+        summary.append('{} units not scanned'.format(len(failures)))
+
+    data = [
+        perfdata('unreserved', totals['unreserved'], '',
+                 thresholds.get('warning_unreserved'),
+                 thresholds.get('critical_unreserved')),
+        perfdata('coverage', coverage, '%',
+                 thresholds.get('warning_coverage'),
+                 thresholds.get('critical_coverage')),
+        perfdata('running', totals['running']),
+        perfdata('reserved', totals['reserved'])
+    ]
+    if expiring is not None:
+        data.append(perfdata('expiring', expiring))
+
+    return status, 'RESERVED INSTANCES {} - {} | {}'.format(
+        STATUS_NAMES[status], ', '.join(summary), ' '.join(data))
@@ -0,0 +1,127 @@
+"""Checkpoints of the results of each account and service."""
+
+import hashlib
+import os
+import time
+
+from check_reserved_instances.snapshot import dump_snapshot, load_snapshot
+
+# used when no [Checkpoint] section is configured: units aren't retried
+DEFAULT_MAX_ATTEMPTS = 1
+DEFAULT_RETRY_DELAY = 5.0
+
+
+def unit_name(account, collector):
+    """Return the name identifying the scan of a service in an account.
+
+    Args:
+        account (dict): The AWS Account.
+        collector (Collector): The collector of the service.
+
+    Returns:
+        The unit name, made of the account name, region and collector name.
+
+    """
+    return u'{}|{}|{}'.format(
+        account['name'], account['region'], collector.name)
+
+
+class CheckpointStore(object):
+    """Directory of the results of each completed unit."""
+
+    def __init__(self, directory, max_age):
+        """Initialize the store, creating the directory if needed.
+
+        Args:
+            directory (str): A filesystem location for the checkpoints.
+            max_age (int): How many seconds a checkpoint can be resumed from.
+
+        """
+        self.directory = directory
+        self.max_age = max_age
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, unit):
+        """Return the checkpoint file location of a unit."""
+        return os.path.join(self.directory, '{}.json'.format(
+            hashlib.sha1(unit.encode('utf-8')).hexdigest()))
+
+    def load(self, unit):
+        """Return the results of a unit if it completed recently enough.
+
+        Args:
+            unit (str): The unit name.
+
+        Returns:
+            The results dictionary, or None.
+
+        """
+        path = self.path(unit)
+        if not os.path.exists(path):
+            return None
+        checkpoint = load_snapshot(path)
+        if (checkpoint.get('unit') != unit or
+                time.time() - checkpoint['taken_at'] > self.max_age):
+            return None
+        return checkpoint['results']
+
+    def save(self, unit, results, services):
+        """Record the results of a completed unit.
+
+        Args:
+            unit (str): The unit name.
+            results (dict): The results of the unit.
+            services (list): (report section, results prefix) tuples of the
+                services in the results.
+
+        """
+        dump_snapshot(self.path(unit), results, services, unit=unit)
+
+    def remove(self, units):
+        """Delete the checkpoints of units, e.g. once a run completed.
+
+        Args:
+            units (list): The unit names.
+
+        """
+        for unit in units:
+            try:
+                os.remove(self.path(unit))
+            except OSError:
+                # the unit wasn't checkpointed
+                pass
+
+
+def open_checkpoints(config):
+    """Open the checkpoint directory if it is configured.
+
+    Args:
+        config (dict): The application configuration.
+
+    Returns:
+        A `CheckpointStore`, or None if no [Checkpoint] section is
+        configured.
+
+    """
+    if not config.get('Checkpoint'):
+        return None
+    return CheckpointStore(config['Checkpoint']['directory'],
+                           config['Checkpoint']['max_age_minutes'] * 60)
+
+
+def retry_settings(config):
+    """Return the attempts and initial delay for retrying failed units.
+
+    Args:
+        config (dict): The application configuration.
+
+    Returns:
+        A tuple of the maximum attempts and the seconds to wait before the
+        first retry, doubled for each further retry.
+
+    """
+    if not config.get('Checkpoint'):
+        return DEFAULT_MAX_ATTEMPTS, DEFAULT_RETRY_DELAY
+    return (config['Checkpoint']['max_attempts'],
+            config['Checkpoint']['retry_delay'])
@@ -0,0 +1,206 @@
+"""Registry of the AWS service collectors.
+
+Each collector declares the boto3 client and paginators it uses, the key
+schema of its results and the report sections it fills in. The function
+doing the work is only imported once the collector is enabled for an
+account being scanned.
+
+Collectors from other packages are discovered through the
+`check_reserved_instances.collectors` entry point group, where the entry
+point name is the configuration option enabling it and the entry point
+loads a `Collector`. Those collectors are disabled unless enabled in the
+configuration file.
+"""
+
+from collections import OrderedDict
+import importlib
+
+try:
+    from importlib import metadata
+except ImportError:  # pragma: no cover
+    # Python < 3.8
+    metadata = None
+
+ENTRY_POINT_GROUP = 'check_reserved_instances.collectors'
+
+
+class Collector(object):
+    """AWS service collector class."""
+
+    def __init__(self, name, calculate, client, paginators, key_schema,
+                 sections, default=True):
+        """Initialize a collector.
+
+        Args:
+            name (str): The name of the collector, also the boolean option
+                in the [AWS ] sections enabling it.
+            calculate (str or callable): The function taking a boto3 session
+                and the results dict and returning the updated results, or
+                its 'module:function' path to import it lazily.
+            client (str): The boto3 client the collector uses.
+            paginators (tuple): The client operations the collector
+                paginates.
+            key_schema (tuple): The names of the fields the results are keyed
+                by.
+            sections (list): (report section, results prefix) tuples of the
+                results filled in by the collector.
+            default (Optional bool): Whether the collector is enabled when
+                not configured.
+
+        """
+        self.name = name
+        self.calculate = calculate
+        self.client = client
+        self.paginators = paginators
+        self.key_schema = key_schema
+        self.sections = sections
+        self.default = default
+
+    def load(self):
+        """Import the collector function if needed.
+
+        Returns:
+            The collector function.
+
+        """
+        if not callable(self.calculate):
+            module_name, function_name = self.calculate.split(':')
+            self.calculate = getattr(
+                importlib.import_module(module_name), function_name)
+        return self.calculate
+
+    def collect(self, session, results):
+        """Collect the running/reserved instances of an account.
+
+        Args:
+            session (:boto3:session.Session): The authenticated boto3 session.
+            results (dict): Results in dictionary format to be appended.
+
+        Returns:
+            The updated results dictionary.
+
+        """
+        return self.load()(session, results)
+
+
+# collectors (or entry points not loaded yet) by name, in scanning order
+registry = OrderedDict()
+
+
+def register_collector(collector):
+    """Add a collector to the registry.
+
+    Args:
+        collector (Collector): The collector to add. Replaces any collector
+            registered with the same name.
+
+    """
+    registry[collector.name] = collector
+
+
+def iter_entry_points(group):
+    """Return the entry points of a group declared by installed packages.
+
+    Uses importlib.metadata where available, since importing pkg_resources
+    scans every installed distribution and slows down each start.
+
+    Args:
+        group (str): The entry point group.
+
+    Returns:
+        An iterable of the entry points, with their name and load method.
+
+    """
+    if metadata is None:  # pragma: no cover
+        import pkg_resources
+        return pkg_resources.iter_entry_points(group)
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return entry_points.select(group=group)
+    return entry_points.get(group, ())
+
+
+def load_entry_points():
+    """Add the collectors declared by installed packages to the registry.
+
+    The entry points are only loaded once the collector is needed.
+
+    """
+    for entry_point in iter_entry_points(ENTRY_POINT_GROUP):
+        registry.setdefault(entry_point.name, entry_point)
+
+
+def get_collector(name):
+    """Return a registered collector, loading its entry point if needed.
+
+    Args:
+        name (str): The name of the collector.
+
+    Returns:
+        The `Collector`.
+
+    """
+    collector = registry[name]
+    if not isinstance(collector, Collector):
+        collector = registry[name] = collector.load()
+    return collector
+
+
+def collector_defaults():
+    """Return the registered collector names and whether enabled by default.
+
+    Returns:
+        A list of (name, default) tuples. Collectors from entry points that
+        are not loaded yet are disabled by default.
+
+    """
+    return [(name, collector.default if isinstance(collector, Collector)
+             else False) for name, collector in registry.items()]
+
+
+def enabled_collectors(account):
+    """Return the collectors enabled for an account.
+
+    Args:
+        account (dict): The AWS Account to scan as loaded from the
+            configuration file.
+
+    Returns:
+        A list of `Collector` in scanning order.
+
+    """
+    return [get_collector(name) for name in registry if account.get(name)]
+
+
+def report_sections(accounts):
+    """Return the report sections of the collectors enabled for any account.
+
+    Args:
+        accounts (list): The AWS Accounts as loaded from the configuration
+            file.
+
+    Returns:
+        A list of (report section, results prefix) tuples, sorted by section.
+
+    """
+    sections = set()
+    for account in accounts:
+        for collector in enabled_collectors(account):
+            sections.update(collector.sections)
+    return sorted(sections)
+
+
+register_collector(Collector(
+    'ec2', 'check_reserved_instances.aws:calculate_ec2_ris', 'ec2',
+    ('describe_instances',), ('instance_type', 'availability_zone'),
+    [('EC2 Classic', 'ec2_classic'), ('EC2 VPC', 'ec2_vpc')]))
+register_collector(Collector(
+    'rds', 'check_reserved_instances.aws:calculate_rds_ris', 'rds',
+    ('describe_db_instances', 'describe_reserved_db_instances'),
+    ('instance_class', 'multi_az'), [('RDS', 'rds')]))
+register_collector(Collector(
+    'elasticache', 'check_reserved_instances.aws:calculate_elc_ris',
+    'elasticache',
+    ('describe_cache_clusters', 'describe_reserved_cache_nodes'),
+    ('node_type', 'engine'), [('ElastiCache', 'elc')]))
+load_entry_points()
@@ -0,0 +1,497 @@
+"""Command line interface comparing reservations and running instances."""
+
+import os
+
+import click
+
+from check_reserved_instances.aws import configure_clients, set_deadline
+from check_reserved_instances.batch import config_paths, scan_batch
+from check_reserved_instances.calculate import (
+    build_report, merge_results, new_results)
+from check_reserved_instances.check import check_results, STATUS_NAMES, UNKNOWN
+from check_reserved_instances.config import parse_config
+from check_reserved_instances.coverage import assign_coverage, export_coverage
+from check_reserved_instances.cur import cur_results
+from check_reserved_instances.events import read_events, watch
+from check_reserved_instances.history import (
+    calc_coverage, INTERVALS, open_history, record_history)
+from check_reserved_instances.profiling import profiled, stage
+from check_reserved_instances.progress import FORMATS, ProgressPrinter
+from check_reserved_instances.recommend import (
+    format_recommendations, merge_recommendations, recommend)
+from check_reserved_instances.reporting import send_report
+from check_reserved_instances.scan import (
+    ENGINES, get_accounts, scan, set_engine)
+from check_reserved_instances.snapshot import (
+    dump_partial, dump_snapshot, load_partials, load_snapshot)
+from check_reserved_instances.tracing import traced
+
+# global configuration object
+current_config = {}
+# will look like:
+# current_config = {
+#   'Accounts': [
+#       {
+#           'name': 'Account 1',
+#           'aws_access_key_id': '',
+#           'aws_secret_access_key': '',
+#           'aws_role_arn': '',
+#           'region': 'us-east-1',
+#           'ec2': True,
+#           'rds': True,
+#           'elasticache': True,
+#       }
+#    ],
+#    'Email': {
+#       'smtp_host': '',
+#       'smtp_port': 25,
+#       'smtp_user': '',
+#       'smtp_password': '',
+#       'smtp_recipients': '',
+#       'smtp_sendas': '',
+#       'smtp_tls': False,
+#    },
+#    'Notification': {
+#       'state_file': 'check_reserved_instances.notification.json',
+#       'heartbeat_hours': 0.0,
+#    },
+#    'Pricing': {
+#       'ec2_offer': None,
+#       'rds_offer': None,
+#       'elasticache_offer': None,
+#       'index': 'check_reserved_instances.pricing.db',
+#       'region': 'us-east-1',
+#       'reserved_term': '1yr No Upfront',
+#       'ec2_platform': 'Linux',
+#       'rds_engine': 'MySQL',
+#    },
+#    'Organization': {
+#       'management_role_arn': '',
+#       'member_role_arn': 'arn:aws:iam::{account_id}:role/RoleName',
+#       'regions': 'us-east-1, us-west-2',
+#       'exclude_accounts': '',
+#       'max_workers': 10,
+#       'ec2': True,
+#       'rds': True,
+#       'elasticache': True,
+#    },
+#    'Check': {
+#       'warning_unreserved': None,
+#       'critical_unreserved': None,
+#       'warning_coverage': None,
+#       'critical_coverage': None,
+#       'warning_expiry_days': None,
+#       'critical_expiry_days': None,
+#    },
+#    'Connection': {
+#       'connect_timeout': None,
+#       'read_timeout': None,
+#       'max_pool_connections': None,
+#       'retry_mode': None,
+#       'max_retries': None,
+#       'ec2_segments': None,
+#    },
+#    'Utilization': {
+#       'cpu_threshold': 5.0,
+#       'period_days': 14,
+#       'action': 'annotate',
+#       'cache': 'check_reserved_instances.utilization.db',
+#       'cache_ttl_hours': 24.0,
+#       'max_workers': 4,
+#    },
+#    'History': {
+#       'database': 'check_reserved_instances.db',
+#       'compact_after_days': 30,
+#       'retention_days': 0,
+#    }
+# }
+
+
+def parse_shard(ctx, param, value):
+    """Parse the --shard option in I/N format into an (I, N) tuple."""
+    if not value:
+        return None
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise click.BadParameter('must be in I/N format, e.g. 1/4')
+    if not 1 <= index <= count:
+        raise click.BadParameter('I must be between 1 and N')
+    return index, count
+
+
+@click.group(invoke_without_command=True)
+@click.option(
+    '--config', multiple=True, default=['config.ini'],
+    help='Provide the path to the configuration file, or to a directory of '
+         '.ini files. May be repeated to scan the accounts of every file '
+         'once and send the report of each',
+    type=click.Path(exists=True))
+@click.option(
+    '--shard', callback=parse_shard, metavar='I/N',
+    help='Only scan the I-th of N deterministic partitions of the accounts '
+         'and write them to the --partial file')
+@click.option(
+    '--partial', type=click.Path(dir_okay=False),
+    help="Partial results file to write the shard's results to, see the "
+         'merge command')
+@click.option(
+    '--resume', is_flag=True,
+    help='Reuse the recent results of accounts and services checkpointed '
+         'by a previous run')
+@click.option(
+    '--deadline', type=float, metavar='SECONDS',
+    help='Stop scanning after this many seconds and report the coverage as '
+         'partial')
+@click.option(
+    '--check', is_flag=True,
+    help='Only count the instances and evaluate the [Check] thresholds, '
+         'printing one line and exiting with a Nagios plugin status')
+@click.option(
+    '--profile', is_flag=True,
+    help='Print the wall time, CPU time and peak memory of each stage, '
+         'account and service')
+@click.option(
+    '--profile-output', type=click.Path(dir_okay=False),
+    help='Also write cProfile statistics of the run to this file, implies '
+         '--profile')
+@click.option(
+    '--engine', type=click.Choice(ENGINES), default='serial',
+    show_default=True,
+    help='How to scan the accounts: one after the other, in a pool of '
+         'worker processes, or all at once on an asyncio event loop')
+@click.option(
+    '--workers', type=int,
+    help='How many worker processes the process engine uses (defaults to '
+         'the number of processors), or how many calls the async engine '
+         'makes at once per endpoint of each account (defaults to 10)')
+@click.option(
+    '--progress', type=click.Choice(FORMATS),
+    help='Print the reconciled results of each account as soon as it is '
+         'scanned, as text blocks or NDJSON lines, before the consolidated '
+         'report')
+@click.option(
+    '--trace', metavar='FILE|URL',
+    help='Trace the sessions, services and AWS calls of the run, and export '
+         'the spans to an OTLP/HTTP collector URL (e.g. '
+         'http://localhost:4318/v1/traces) or to a JSON file')
+@click.pass_context
+def cli(ctx, config, shard, partial, resume, deadline, check, profile,
+        profile_output, engine, workers, progress, trace):
+    """Compare instance reservations and running instances for AWS services.
+
+    Args:
+        config (tuple): The paths to the configuration files or directories.
+        shard (tuple): The (index, count) of the shard to scan, if any.
+        partial (str): The path to write the shard's results to.
+        resume (bool): Whether to resume from the checkpoints.
+        deadline (float): Seconds after which to stop scanning, if any.
+        check (bool): Whether to run as a monitoring check.
+        profile (bool): Whether to print the profile of the run's stages.
+        profile_output (str): The path to write cProfile statistics to.
+        engine (str): How to scan the accounts, see `set_engine`.
+        workers (int): How many worker processes or concurrent calls to scan
+            with, if any.
+        progress (str): The format to print each account in once scanned,
+            if any.
+        trace (str): The OTLP collector URL or path to export spans to.
+
+    """
+    paths = config_paths(config)
+    if not paths:
+        raise click.UsageError('No .ini configuration file found')
+    configs = [parse_config(path) for path in paths]
+    current_config = configs[0]
+    ctx.obj = current_config
+    configure_clients(current_config.get('Connection', {}))
+    set_deadline(deadline)
+    set_engine(engine, workers)
+    batch = len(configs) > 1
+    if batch and (ctx.invoked_subcommand is not None or shard or resume or
+                  check or progress):
+        raise click.UsageError(
+            'Several configuration files can only be reported on, without '
+            '--shard, --resume, --check or --progress')
+    if ctx.invoked_subcommand is not None:
+        return
+    if bool(shard) != bool(partial):
+        raise click.UsageError('--shard and --partial must be used together')
+    if resume and not current_config.get('Checkpoint'):
+        raise click.UsageError(
+            '--resume requires a [Checkpoint] section in the configuration '
+            'file')
+    if check and (shard or resume):
+        raise click.UsageError(
+            '--check cannot be used with --shard or --resume')
+    if check and progress:
+        raise click.UsageError('--check cannot be used with --progress')
+
+    if batch:
+        run_function, args = run_batch, (list(zip(paths, configs)),)
+    else:
+        run_function = run_check if check else run
+        args = (current_config, shard, partial, resume, progress)
+    with traced(trace):
+        if profile or profile_output:
+            with profiled(profile_output):
+                status = run_function(*args)
+        else:
+            status = run_function(*args)
+    if check:
+        ctx.exit(status)
+
+
+def run_check(current_config, *args):
+    """Scan the accounts counting the instances, and print the check status.
+
+    Args:
+        current_config (dict): The application configuration.
+        *args: The shard, partial, resume and progress arguments of `run`,
+            unused.
+
+    Returns:
+        The Nagios plugin exit status.
+
+    """
+    try:
+        results, services, _, failures = scan(
+            current_config, counts_only=True)
+        with stage('check'):
+            status, output = check_results(
+                results, services, current_config.get('Check', {}),
+                failures)
+    except Exception as error:
+        status, output = UNKNOWN, 'RESERVED INSTANCES {} - {}'.format(
+            STATUS_NAMES[UNKNOWN], error)
+    click.echo(output)
+    return status
+
+
+def run(current_config, shard, partial, resume, progress=None):
+    """Scan the accounts, then report the results or write the shard's.
+
+    Args:
+        current_config (dict): The application configuration.
+        shard (tuple): The (index, count) of the shard to scan, if any.
+        partial (str): The path to write the shard's results to.
+        resume (bool): Whether to resume from the checkpoints.
+        progress (Optional str): The format to print each account in once
+            scanned, see `progress.FORMATS`.
+
+    """
+    printer = ProgressPrinter(progress) if progress else None
+    results, services, account_results, failures = scan(
+        current_config, shard, resume, progress=printer)
+    if shard:
+        dump_partial(partial, results, services, account_results, shard,
+                     failures)
+        click.echo('Wrote the results of shard {}/{} to {}'.format(
+            shard[0], shard[1], partial))
+        return
+
+    with stage('history'):
+        record_history(current_config, account_results, services)
+    send_report(current_config, results, services, failures, printer)
+
+
+def run_batch(configs):
+    """Scan the accounts of several configurations once, then report each.
+
+    Args:
+        configs (list): (path, application configuration) tuples.
+
+    """
+    outputs = scan_batch([current_config for _, current_config in configs])
+    for (path, current_config), (results, services, account_results,
+                                 failures) in zip(configs, outputs):
+        click.echo('Configuration {}'.format(path))
+        with stage('history'):
+            record_history(current_config, account_results, services)
+        send_report(current_config, results, services, failures)
+
+
+@cli.command()
+@click.option(
+    '--days', default=90, show_default=True,
+    help='How many days of history to show')
+@click.option(
+    '--instance-type',
+    help='Instance type, family (e.g. m5) or glob pattern to filter on')
+@click.option('--account', help='Account section name to filter on')
+@click.option('--service', help='Service name to filter on (e.g. RDS)')
+@click.option(
+    '--interval', default='run', show_default=True,
+    type=click.Choice(sorted(INTERVALS)),
+    help='Average the totals over each interval')
+@click.pass_obj
+def history(current_config, days, instance_type, account, service,
+            interval):
+    """Show the coverage trend from the history database."""
+    store = open_history(current_config)
+    if not store:
+        raise click.ClickException(
+            'Please specify a [History] section in the configuration file!')
+
+    rows = store.trend(days, instance_type=instance_type, account=account,
+                       service=service, interval=interval)
+    store.close()
+
+    click.echo('{:<20}{:>10}{:>10}{:>10}'.format(
+        'Date', 'Running', 'Reserved', 'Coverage'))
+    for run_at, running, reserved in rows:
+        coverage = calc_coverage(running, reserved)
+        click.echo('{:<20}{:>10}{:>10}{:>10}'.format(
+            run_at.strftime('%Y-%m-%d %H:%M'), running, reserved,
+            '-' if coverage is None else '{:.1f}%'.format(coverage)))
+
+
+@cli.command('watch')
+@click.option(
+    '--snapshot', required=True, type=click.Path(dir_okay=False),
+    help='Snapshot file to start from, created by a full scan if missing, '
+         'and kept up to date')
+@click.option(
+    '--events', 'events_path', required=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help='JSON-lines file of instance and reservation events')
+@click.option(
+    '--follow/--no-follow', default=False, show_default=True,
+    help='Keep waiting for events appended to the file')
+@click.option(
+    '--reconcile-interval', default=3600, show_default=True,
+    help='Seconds between full scans correcting drift (0 to disable)')
+@click.pass_obj
+def watch_events(current_config, snapshot, events_path, follow,
+                 reconcile_interval):
+    """Update a snapshot of the results from instance and RI events."""
+    if os.path.exists(snapshot):
+        state = load_snapshot(snapshot)
+        results, services = state['results'], state['services']
+    else:
+        results, services, _, _ = scan(current_config)
+        dump_snapshot(snapshot, results, services)
+
+    def reconcile():
+        click.echo('Reconciling with a full scan')
+        return scan(current_config)[0]
+
+    def on_change(results, applied):
+        dump_snapshot(snapshot, results, services)
+        click.echo('{} events applied, snapshot updated'.format(applied))
+
+    results = watch(results, read_events(events_path, follow=follow),
+                    reconcile, reconcile_interval, on_change)
+
+    send_report(current_config, results, services)
+
+
+@cli.command()
+@click.argument(
+    'partials', nargs=-1, required=True,
+    type=click.Path(exists=True, dir_okay=False))
+@click.pass_obj
+def merge(current_config, partials):
+    """Combine the partial results files of shards into one report."""
+    results, services, account_results, shards, failures = load_partials(
+        partials)
+
+    counts = set(count for _, count in shards)
+    indexes = set(index for index, _ in shards)
+    if len(counts) > 1:
+        click.echo('Warning: merging shards of different partitions')
+    elif counts and indexes != set(range(1, counts.pop() + 1)):
+        click.echo('Warning: merging an incomplete set of shards')
+    if len(indexes) != len(shards):
+        click.echo('Warning: merging a shard more than once')
+
+    record_history(current_config, account_results, services)
+    send_report(current_config, results, services, failures)
+
+
+@cli.command()
+@click.argument(
+    'reports', nargs=-1, required=True,
+    type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--max-workers', type=int,
+    help='How many report files to read at once. Defaults to the number of '
+         'processors')
+@click.pass_obj
+def cur(current_config, reports, max_workers):
+    """Report from Cost and Usage Report files instead of the AWS APIs."""
+    results, services = cur_results(list(reports), max_workers)
+    send_report(current_config, results, services)
+
+
+def snapshot_or_scan(current_config, snapshot):
+    """Return the (results, services) of a snapshot, or of a full scan."""
+    if snapshot:
+        state = load_snapshot(snapshot)
+        return state['results'], state['services']
+    return scan(current_config)[:2]
+
+
+@cli.command('recommend')
+@click.option(
+    '--snapshot', type=click.Path(exists=True, dir_okay=False),
+    help='Results snapshot to recommend from, e.g. the one kept up to date '
+         'by the watch command. Defaults to scanning the accounts')
+@click.pass_obj
+def recommend_modifications(current_config, snapshot):
+    """Recommend EC2 reservation modifications covering more instances."""
+    if snapshot:
+        state = load_snapshot(snapshot)
+        recommendations = recommend(
+            build_report(state['results'], state['services']))
+    else:
+        # the regional reservations only cover the instances of their
+        # region, so the accounts are reported region by region
+        accounts = get_accounts(current_config)
+        _, services, account_results, _ = scan(
+            current_config, accounts=accounts)
+        regions = {}
+        for account, (_, partial) in zip(accounts, account_results):
+            merge_results(regions.setdefault(
+                account['region'], new_results(services)), partial)
+        recommendations = merge_recommendations([
+            recommend(build_report(results, services), region)
+            for region, results in sorted(regions.items())])
+    for line in format_recommendations(recommendations):
+        click.echo(line)
+
+
+@cli.command('coverage')
+@click.option(
+    '--snapshot', type=click.Path(exists=True, dir_okay=False),
+    help='Results snapshot to assign, e.g. the one kept up to date by the '
+         'watch command. Defaults to scanning the accounts')
+@click.option(
+    '--instance', 'lookups', multiple=True,
+    help='Instance ID or name to look up instead of exporting the table '
+         '(may be repeated)')
+@click.option(
+    '--output', default='-', type=click.Path(dir_okay=False),
+    help='File to export the CSV table to. Defaults to stdout')
+@click.pass_obj
+def coverage_table(current_config, snapshot, lookups, output):
+    """Export the reservation covering each running instance."""
+    results, services = snapshot_or_scan(current_config, snapshot)
+    coverage, _ = assign_coverage(results, services)
+    if not lookups:
+        with click.open_file(output, 'w') as stream:
+            export_coverage(coverage, stream)
+        return
+
+    labels = dict((assignment.label, instance_id)
+                  for instance_id, assignment in coverage.items())
+    for lookup in lookups:
+        assignment = coverage.get(labels.get(lookup, lookup))
+        if assignment is None:
+            click.echo('{}\tNOT RUNNING'.format(lookup))
+        elif assignment.scope is None:
+            click.echo('{}\tNOT RESERVED\t{}\t{}'.format(
+                lookup, assignment.key[0], assignment.key[1]))
+        else:
+            click.echo('{}\t{}\t{}\t{}'.format(
+                lookup, assignment.scope, assignment.reservation_id or '-',
+                assignment.key[0]))
@@ -5,7 +5,17 @@ from __future__ import print_function
 from configparser import ConfigParser
 import sys
 
+from check_reserved_instances.collectors import collector_defaults
+
+CHECK_SECTION_NAME = 'Check'
+CHECKPOINT_SECTION_NAME = 'Checkpoint'
+CONNECTION_SECTION_NAME = 'Connection'
 EMAIL_SECTION_NAME = 'Email'
+HISTORY_SECTION_NAME = 'History'
+NOTIFICATION_SECTION_NAME = 'Notification'
+ORGANIZATION_SECTION_NAME = 'Organization'
+PRICING_SECTION_NAME = 'Pricing'
+UTILIZATION_SECTION_NAME = 'Utilization'
 AWS_SECTION_NAME = 'AWS '
 
 
@@ -48,25 +58,14 @@ def parse_aws_config(section, config_parser):
         ConfigLine('aws_access_key_id', False, None),
         ConfigLine('aws_secret_access_key', False, None),
         ConfigLine('aws_role_arn', False, None),
-        ConfigLine('region', False, 'us-east-1'),
-        ConfigLine('rds', False, True, bool),
-        ConfigLine('elasticache', False, True, bool)
+        ConfigLine('region', False, 'us-east-1')
     ]
+    # one boolean option for each collector, e.g. `rds = False`
+    for name, default in collector_defaults():
+        allowed_aws_options.append(ConfigLine(name, False, default, bool))
 
-    aws_config = {
-        'name': section
-    }
-
-    for option in allowed_aws_options:
-        if config_parser.has_option(section, option.name):
-            if option.config_type == bool:
-                aws_config[option.name] = config_parser.getboolean(
-                    section, option.name)
-            else:
-                aws_config[option.name] = config_parser.get(
-                    section, option.name)
-        else:
-            aws_config[option.name] = option.default
+    aws_config = parse_options(section, config_parser, allowed_aws_options)
+    aws_config['name'] = section
 
     return aws_config
 
@@ -83,12 +82,65 @@ def parse_config(filename):
 
     """
     config_parser = ConfigParser()
-    config = {}
     config_parser.read_file(open(filename))
+    return load_config(config_parser)
+
+
+def parse_config_string(text):
+    """Parse the configuration from a string, e.g. a Lambda event's.
+
+    Args:
+        text (str): The configuration, in the configuration file format.
+
+    Returns:
+        config (dict): A dictionary containing the loaded configurations.
+
+    """
+    config_parser = ConfigParser()
+    config_parser.read_string(text)
+    return load_config(config_parser)
+
+
+def load_config(config_parser):
+    """Load the configuration sections.
+
+    Args:
+        config_parser (ConfigParser): The ConfigParser object with the config
+            loaded.
+
+    Returns:
+        config (dict): A dictionary containing the loaded configurations.
+
+    """
+    config = {}
 
     if config_parser.has_section(EMAIL_SECTION_NAME):
         config['Email'] = parse_email_config(config_parser)
 
+    if config_parser.has_section(HISTORY_SECTION_NAME):
+        config['History'] = parse_history_config(config_parser)
+
+    if config_parser.has_section(CHECK_SECTION_NAME):
+        config['Check'] = parse_check_config(config_parser)
+
+    if config_parser.has_section(CHECKPOINT_SECTION_NAME):
+        config['Checkpoint'] = parse_checkpoint_config(config_parser)
+
+    if config_parser.has_section(CONNECTION_SECTION_NAME):
+        config['Connection'] = parse_connection_config(config_parser)
+
+    if config_parser.has_section(NOTIFICATION_SECTION_NAME):
+        config['Notification'] = parse_notification_config(config_parser)
+
+    if config_parser.has_section(ORGANIZATION_SECTION_NAME):
+        config['Organization'] = parse_organization_config(config_parser)
+
+    if config_parser.has_section(PRICING_SECTION_NAME):
+        config['Pricing'] = parse_pricing_config(config_parser)
+
+    if config_parser.has_section(UTILIZATION_SECTION_NAME):
+        config['Utilization'] = parse_utilization_config(config_parser)
+
     config_sections = config_parser.sections()
     if config_sections:
         aws_sections = []
@@ -96,9 +148,9 @@ def parse_config(filename):
             if AWS_SECTION_NAME in section:
                 aws_config = parse_aws_config(section, config_parser)
                 aws_sections.append(aws_config)
-                config['Accounts'] = aws_sections
+        config['Accounts'] = aws_sections
 
-        if aws_sections:
+        if aws_sections or config.get('Organization'):
             return config
 
     print('Please specify at least one [AWS ] section in the configuration '
@@ -117,8 +169,6 @@ def parse_email_config(config_parser):
         email_config (dict): A dict containing the email configuration.
 
     """
-    email_config = {}
-
     allowed_email_options = [
         ConfigLine('smtp_host', True),
         ConfigLine('smtp_port', False, 25, int),
@@ -129,24 +179,251 @@ def parse_email_config(config_parser):
         ConfigLine('smtp_tls', False, False, bool)
     ]
 
-    for option in allowed_email_options:
+    return parse_options(
+        EMAIL_SECTION_NAME, config_parser, allowed_email_options)
+
+
+def parse_check_config(config_parser):
+    """Parse configuration for the thresholds of the monitoring check.
+
+    Args:
+        config_parser (ConfigParser): The ConfigParser object with the config
+            file loaded.
+
+    Returns:
+        check_config (dict): A dict containing the check thresholds.
+            Thresholds not configured are None, and never alert.
+
+    """
+    allowed_check_options = [
+        ConfigLine('warning_unreserved', False, None, int),
+        ConfigLine('critical_unreserved', False, None, int),
+        ConfigLine('warning_coverage', False, None, float),
+        ConfigLine('critical_coverage', False, None, float),
+        ConfigLine('warning_expiry_days', False, None, int),
+        ConfigLine('critical_expiry_days', False, None, int)
+    ]
+
+    return parse_options(
+        CHECK_SECTION_NAME, config_parser, allowed_check_options)
+
+
+def parse_checkpoint_config(config_parser):
+    """Parse configuration for checkpointing and retrying scans.
+
+    Args:
+        config_parser (ConfigParser): The ConfigParser object with the config
+            file loaded.
+
+    Returns:
+        checkpoint_config (dict): A dict containing the checkpoint
+            configuration.
+
+    """
+    allowed_checkpoint_options = [
+        ConfigLine('directory', False, '.check_reserved_instances'),
+        ConfigLine('max_age_minutes', False, 60, int),
+        ConfigLine('max_attempts', False, 3, int),
+        ConfigLine('retry_delay', False, 5.0, float)
+    ]
+
+    return parse_options(
+        CHECKPOINT_SECTION_NAME, config_parser, allowed_checkpoint_options)
+
+
+def parse_connection_config(config_parser):
+    """Parse configuration for the connections of the AWS clients.
+
+    Args:
+        config_parser (ConfigParser): The ConfigParser object with the config
+            file loaded.
+
+    Returns:
+        connection_config (dict): A dict containing the connection
+            configuration. Options not configured are None, keeping the
+            botocore defaults.
+
+    """
+    allowed_connection_options = [
+        ConfigLine('connect_timeout', False, None, float),
+        ConfigLine('read_timeout', False, None, float),
+        ConfigLine('max_pool_connections', False, None, int),
+        ConfigLine('retry_mode', False, None),
+        ConfigLine('max_retries', False, None, int),
+        ConfigLine('ec2_segments', False, None, int)
+    ]
+
+    return parse_options(
+        CONNECTION_SECTION_NAME, config_parser, allowed_connection_options)
+
+
+def parse_history_config(config_parser):
+    """Parse configuration for the local history database.
+
+    Args:
+        config_parser (ConfigParser): The ConfigParser object with the config
+            file loaded.
+
+    Returns:
+        history_config (dict): A dict containing the history configuration.
+
+    """
+    allowed_history_options = [
+        ConfigLine('database', False, 'check_reserved_instances.db'),
+        ConfigLine('compact_after_days', False, 30, int),
+        ConfigLine('retention_days', False, 0, int)
+    ]
+
+    return parse_options(
+        HISTORY_SECTION_NAME, config_parser, allowed_history_options)
+
+
+def parse_notification_config(config_parser):
+    """Parse configuration for only reporting changed results.
+
+    Args:
+        config_parser (ConfigParser): The ConfigParser object with the config
+            file loaded.
+
+    Returns:
+        notification_config (dict): A dict containing the notification
+            configuration.
+
+    """
+    allowed_notification_options = [
+        ConfigLine('state_file', False,
+                   'check_reserved_instances.notification.json'),
+        ConfigLine('heartbeat_hours', False, 0.0, float)
+    ]
+
+    return parse_options(
+        NOTIFICATION_SECTION_NAME, config_parser,
+        allowed_notification_options)
+
+
+def parse_organization_config(config_parser):
+    """Parse configuration for discovering the accounts of an organization.
+
+    Args:
+        config_parser (ConfigParser): The ConfigParser object with the config
+            file loaded.
+
+    Returns:
+        organization_config (dict): A dict containing the organization
+            configuration.
+
+    """
+    allowed_organization_options = [
+        ConfigLine('management_role_arn', False, None),
+        ConfigLine('member_role_arn', True),
+        ConfigLine('regions', False, 'us-east-1'),
+        ConfigLine('exclude_accounts', False, None),
+        ConfigLine('max_workers', False, 10, int)
+    ]
+    for name, default in collector_defaults():
+        allowed_organization_options.append(
+            ConfigLine(name, False, default, bool))
+
+    return parse_options(
+        ORGANIZATION_SECTION_NAME, config_parser,
+        allowed_organization_options)
+
+
+def parse_pricing_config(config_parser):
+    """Parse configuration for the cost figures of the report.
+
+    Args:
+        config_parser (ConfigParser): The ConfigParser object with the config
+            file loaded.
+
+    Returns:
+        pricing_config (dict): A dict containing the pricing configuration.
+
+    """
+    allowed_pricing_options = [
+        ConfigLine('ec2_offer', False, None),
+        ConfigLine('rds_offer', False, None),
+        ConfigLine('elasticache_offer', False, None),
+        ConfigLine('index', False, 'check_reserved_instances.pricing.db'),
+        ConfigLine('region', False, 'us-east-1'),
+        ConfigLine('reserved_term', False, '1yr No Upfront'),
+        ConfigLine('ec2_platform', False, 'Linux'),
+        ConfigLine('rds_engine', False, 'MySQL')
+    ]
+
+    return parse_options(
+        PRICING_SECTION_NAME, config_parser, allowed_pricing_options)
+
+
+def parse_options(section, config_parser, allowed_options):
+    """Load the allowed options of a section, applying types and defaults.
+
+    Exits if a required option is missing from the section.
+
+    Args:
+        section (str): The section name in the config file.
+        config_parser (ConfigParser): The ConfigParser object with the config
+            file loaded.
+        allowed_options (list): The `ConfigLine` items for the section.
+
+    Returns:
+        options (dict): A dict of the option names and their values.
+
+    """
+    options = {}
+
+    for option in allowed_options:
         if option.required and not config_parser.has_option(
-                EMAIL_SECTION_NAME, option.name):
-            print('Required configuration option for email ({}) is not '
-                  'configured!'.format(option.name))
+                section, option.name):
+            print('Required configuration option for {} ({}) is not '
+                  'configured!'.format(section.lower(), option.name))
             sys.exit(-1)
 
-        if config_parser.has_option(EMAIL_SECTION_NAME, option.name):
+        if config_parser.has_option(section, option.name):
             if option.config_type == bool:
-                email_config[option.name] = config_parser.getboolean(
-                    EMAIL_SECTION_NAME, option.name)
+                options[option.name] = config_parser.getboolean(
+                    section, option.name)
             elif option.config_type == int:
-                email_config[option.name] = config_parser.getint(
-                    EMAIL_SECTION_NAME, option.name)
+                options[option.name] = config_parser.getint(
+                    section, option.name)
+            elif option.config_type == float:
+                options[option.name] = config_parser.getfloat(
+                    section, option.name)
             else:
-                email_config[option.name] = config_parser.get(
-                    EMAIL_SECTION_NAME, option.name)
+                options[option.name] = config_parser.get(
+                    section, option.name)
         else:
-            email_config[option.name] = option.default
+            options[option.name] = option.default
+
+    return options
+
+
+def parse_utilization_config(config_parser):
+    """Parse configuration for flagging the idle unreserved instances.
+
+    Args:
+        config_parser (ConfigParser): The ConfigParser object with the config
+            file loaded.
+
+    Returns:
+        utilization_config (dict): A dict containing the utilization
+            configuration.
+
+    """
+    allowed_utilization_options = [
+        ConfigLine('cpu_threshold', False, 5.0, float),
+        ConfigLine('period_days', False, 14, int),
+        ConfigLine('action', False, 'annotate'),
+        ConfigLine('cache', False,
+                   'check_reserved_instances.utilization.db'),
+        ConfigLine('cache_ttl_hours', False, 24.0, float),
+        ConfigLine('max_workers', False, 4, int)
+    ]
 
-    return email_config
+    utilization_config = parse_options(
+        UTILIZATION_SECTION_NAME, config_parser, allowed_utilization_options)
+    if utilization_config['action'] not in ('annotate', 'exclude'):
+        print('Utilization action must be annotate or exclude, not '
+              '{}!'.format(utilization_config['action']))
+        sys.exit(-1)
+    return utilization_config
@@ -0,0 +1,308 @@
+"""Assign each running instance to the reservation covering it.
+
+`report_diffs` only nets the counts of each key. `assign_coverage` maps
+every running instance to the reservation covering it, in three passes
+over the instances of each report section:
+
+1. zonal reservations cover the instances of their key;
+2. regional reservations cover the instances of their type left in any
+   zone, the zones taken in the order `report_diffs` visits them, so the
+   instances left of each key are as many as it reports;
+3. the regional EC2 reservations left cover the instances left of other
+   sizes of their instance family, in normalized units (size flexibility).
+
+Within a key, the oldest instances are covered first (by launch time, then
+ID), so an instance keeps its reservation from one run to the next as
+newer ones come and go, and the reservations expiring first are used
+first. Size flexibility only applies to the Linux/UNIX regional
+reservations of the default tenancy, covering the instances known to run
+Linux/UNIX on default tenancy: the reservations and instances whose
+platform isn't known (e.g. read from a snapshot of an older version) are
+left out of the third pass.
+
+The assignments are indexed by instance ID, and exported as a table with
+`export_coverage`.
+"""
+
+from collections import namedtuple
+import csv
+import heapq
+
+from check_reserved_instances.recommend import (
+    EC2_SECTIONS, REGIONAL, size_units)
+
+# how a running instance is covered, `scope` is None if it isn't
+Assignment = namedtuple(
+    'Assignment',
+    ('section', 'key', 'label', 'reservation_id', 'scope'))
+
+ZONAL = 'zonal'
+REGIONAL_SCOPE = 'regional'
+SIZE_FLEXIBLE = 'size-flexible'
+
+TABLE_COLUMNS = ('instance_id', 'section', 'instance_type', 'placement',
+                 'label', 'reservation_id', 'scope')
+
+
+def section_records(results, prefix):
+    """Group the indexed instances and reservations of a section by key.
+
+    Args:
+        results (dict): The results, with the `instances` and
+            `reservations` indexes.
+        prefix (str): The results prefix of the section.
+
+    Returns:
+        An (instances, reservations) tuple of dicts by key: the
+        (launch timestamp, instance ID, label, size flexible) of the
+        instances, oldest first, and the [reservation ID, count left, size
+        flexible] of the reservations, expiring first. The reservations
+        counted without an ID are added with a None ID, last. The instances
+        are None if some of the section's instances aren't indexed.
+
+    """
+    running = results[prefix + '_running_instances']
+    reserved = results[prefix + '_reserved_instances']
+    instances = {}
+    for instance_id, record in results['instances'].items():
+        if record[0] == prefix + '_running_instances':
+            instances.setdefault(record[1], []).append(
+                (record[3], instance_id, record[2],
+                 len(record) > 4 and bool(record[4])))
+    if any(len(instances.get(key, ())) != count
+           for key, count in running.items()):
+        return None, None
+    for records in instances.values():
+        records.sort(key=lambda record: (record[0] is None, record[0] or 0,
+                                         record[1]))
+
+    reservations = {}
+    for reservation_id, record in results['reservations'].items():
+        if record[0] == prefix + '_reserved_instances':
+            reservations.setdefault(record[1], []).append(
+                (record[4], reservation_id, record[2],
+                 len(record) > 5 and bool(record[5])))
+    slots = {}
+    for key, count in reserved.items():
+        records = sorted(reservations.get(key, ()))
+        slots[key] = [[reservation_id, reservation_count, size_flexible]
+                      for _, reservation_id, reservation_count, size_flexible
+                      in records]
+        unindexed = count - sum(record[2] for record in records)
+        if unindexed > 0:
+            slots[key].append([None, unindexed, False])
+    return instances, slots
+
+
+def take(slots, units=1):
+    """Use units of the first reservation with enough of them left.
+
+    Args:
+        slots (list): [reservation ID, units left, size flexible] of the
+            reservations.
+        units (Optional int): The units to use.
+
+    Returns:
+        A (used, reservation ID) tuple, where used is False if no
+        reservation has enough units left.
+
+    """
+    while slots and slots[0][1] <= 0:
+        slots.pop(0)
+    for slot in slots:
+        if slot[1] >= units:
+            slot[1] -= units
+            return True, slot[0]
+    return False, None
+
+
+def assign_section(coverage, service, instances, slots):
+    """Assign the instances of a section, see the module docstring.
+
+    Args:
+        coverage (dict): The assignments by instance ID to add to.
+        service (str): The report section.
+        instances (dict): The instances by key, see `section_records`.
+        slots (dict): The reservations by key, see `section_records`.
+            Updated in place with the counts left, in normalized units for
+            the regional EC2 reservations.
+
+    """
+    # the keys in the order of report_diffs: the zonal keys reserved, then
+    # the keys only running
+    keys = [key for key in slots if key[1] != REGIONAL]
+    keys += [key for key in instances if key not in slots]
+    # the instances left by instance family, each key's oldest first
+    left = {}
+    for key in keys:
+        regional = slots.get((key[0], REGIONAL), [])
+        key_left = []
+        for launched_at, instance_id, label, size_flexible in instances.get(
+                key, ()):
+            used, reservation_id = take(slots.get(key, []))
+            scope = ZONAL
+            if not used:
+                used, reservation_id = take(regional)
+                scope = REGIONAL_SCOPE
+            if used:
+                coverage[instance_id] = Assignment(
+                    service, key, label, reservation_id, scope)
+            elif size_flexible and service in EC2_SECTIONS and size_units(
+                    key[0]):
+                key_left.append((launched_at is None, launched_at or 0,
+                                 instance_id, key, label))
+            else:
+                coverage[instance_id] = Assignment(
+                    service, key, label, None, None)
+        if key_left:
+            left.setdefault(key[0].split('.')[0], []).append(key_left)
+    assign_size_flexible(coverage, service, left, slots)
+
+
+def assign_size_flexible(coverage, service, left, slots):
+    """Cover the instances left with the size-flexible reservations left.
+
+    Args:
+        coverage (dict): The assignments by instance ID to add to.
+        service (str): The report section.
+        left (dict): Lists of the (not launched, launch timestamp, instance
+            ID, key, label) of the size-flexible instances left by instance
+            family, a list per key, each oldest first.
+        slots (dict): The reservations by key, see `section_records`.
+
+    """
+    # the size-flexible reservations left in normalized units, by family
+    families = {}
+    for key, key_slots in slots.items():
+        units = size_units(key[0])
+        if key[1] == REGIONAL and units and key[0].split('.')[0] in left:
+            family = families.setdefault(key[0].split('.')[0], [])
+            for slot in key_slots:
+                if slot[2]:
+                    slot[1] *= units
+                    family.append(slot)
+    for family, family_left in left.items():
+        # merge the keys' instances, already oldest first, in
+        # O(n log keys) rather than sorting them again
+        for _, _, instance_id, key, label in heapq.merge(*family_left):
+            used, reservation_id = take(families.get(family, []),
+                                        size_units(key[0]))
+            coverage[instance_id] = Assignment(
+                service, key, label, reservation_id, SIZE_FLEXIBLE if used
+                else None)
+    for key, key_slots in slots.items():
+        if key[1] == REGIONAL and key[0].split('.')[0] in families:
+            # back to whole reservations of the key's size
+            for slot in key_slots:
+                if slot[2]:
+                    slot[1] //= size_units(key[0])
+
+
+def assign_coverage(results, services):
+    """Assign each running instance to the reservation covering it.
+
+    Args:
+        results (dict): The results, as returned by `new_results` and filled
+            in by the collectors.
+        services (list): (report section, results prefix) tuples of the
+            services to assign.
+
+    Returns:
+        A (coverage, unused) tuple: the `Assignment` of each running
+        instance by instance ID, and the count of the regional reservations
+        left unused by (report section, key). The sections whose instances
+        aren't all indexed (e.g. counted only, or read from Cost and Usage
+        Reports) are left out of both.
+
+    """
+    coverage = {}
+    unused = {}
+    if 'instances' not in results:
+        return coverage, unused
+    for service, prefix in services:
+        instances, slots = section_records(results, prefix)
+        if instances is None:
+            continue
+        assign_section(coverage, service, instances, slots)
+        for key, key_slots in slots.items():
+            if key[1] == REGIONAL:
+                unused[(service, key)] = sum(slot[1] for slot in key_slots)
+    return coverage, unused
+
+
+def instance_label(results, instance_id):
+    """Return the ID or name to report an indexed instance with.
+
+    Args:
+        results (dict): The results, with the `instances` index.
+        instance_id (str): The instance ID, or the ID/name of an instance
+            which isn't indexed, returned as is.
+
+    Returns:
+        The label of the instance.
+
+    """
+    record = results.get('instances', {}).get(instance_id)
+    return record[2] if record else instance_id
+
+
+def cover_report(report, results, services, labels=True):
+    """Report exactly the instances left uncovered by the assignments.
+
+    Args:
+        report (dict): The report, as returned by `build_report`, whose
+            unreserved instances and unused regional reservations are
+            updated from the assignments.
+        results (dict): The results the report was built from.
+        services (list): (report section, results prefix) tuples of the
+            services in the report.
+        labels (Optional bool): Whether to list the instances left uncovered
+            by their IDs/names to report them with, or by their IDs (see
+            `instance_label`).
+
+    Returns:
+        The instance IDs/names by key of the unreserved instances: the
+        instances left uncovered, or every instance of the key for the
+        sections not assigned.
+
+    """
+    coverage, unused = assign_coverage(results, services)
+    sections = set(service for service, _ in unused)
+    sections.update(assignment.section for assignment in coverage.values())
+    for service in sections:
+        report[service]['unreserved_instances'] = {}
+    for (service, key), count in unused.items():
+        if count > 0:
+            report[service]['unused_reservations'][key] = count
+        else:
+            report[service]['unused_reservations'].pop(key, None)
+
+    instance_ids = dict(results.get('instance_ids') or {})
+    uncovered = dict((assignment.key, []) for assignment in coverage.values())
+    for instance_id, assignment in coverage.items():
+        if assignment.scope is None:
+            unreserved = report[assignment.section]['unreserved_instances']
+            unreserved[assignment.key] = unreserved.get(assignment.key, 0) + 1
+            uncovered[assignment.key].append(
+                assignment.label if labels else instance_id)
+    for key, labels in uncovered.items():
+        instance_ids[key] = sorted(labels)
+    return instance_ids
+
+
+def export_coverage(coverage, stream):
+    """Write the assignments as a CSV table, one row per instance.
+
+    Args:
+        coverage (dict): The assignments by instance ID, as returned by
+            `assign_coverage`.
+        stream (file): Where to write the table to.
+
+    """
+    writer = csv.writer(stream)
+    writer.writerow(TABLE_COLUMNS)
+    for instance_id, assignment in sorted(coverage.items()):
+        writer.writerow((
+            instance_id, assignment.section, assignment.key[0],
+            assignment.key[1], assignment.label,
+            assignment.reservation_id or '', assignment.scope or ''))
@@ -0,0 +1,275 @@
+"""Count running and reserved instances from Cost and Usage Report files.
+
+Cost and Usage Reports (CUR) are billing exports with one line item per
+resource and hour (or day). Instead of describing the instances through
+the AWS APIs, the running instances are derived from the hours of instance
+usage in the report, and the reservations from their recurring fee line
+items.
+
+Each file is streamed, keeping only the columns used and one total per
+type and placement, and files (the parts of a report) are read in parallel
+processes. Both gzip compressed CSV and Parquet (with pyarrow installed)
+reports are supported.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import datetime
+import gzip
+import io
+import re
+
+from check_reserved_instances.calculate import add_reservation, new_results
+from check_reserved_instances.collectors import get_collector
+
+# CSV column of each field read from the report
+COLUMNS = {
+    'line_item_type': 'lineItem/LineItemType',
+    'product_code': 'lineItem/ProductCode',
+    'usage_type': 'lineItem/UsageType',
+    'usage_amount': 'lineItem/UsageAmount',
+    'usage_start': 'lineItem/UsageStartDate',
+    'usage_end': 'lineItem/UsageEndDate',
+    'resource_id': 'lineItem/ResourceId',
+    'availability_zone': 'lineItem/AvailabilityZone',
+    'instance_type': 'product/instanceType',
+    'deployment_option': 'product/deploymentOption',
+    'cache_engine': 'product/cacheEngine',
+    'reservation_arn': 'reservation/ReservationARN',
+    'reservations': 'reservation/NumberOfReservations',
+    'reservation_end': 'reservation/EndTime'
+}
+
+# line items of instance usage, on-demand or covered by a reservation or
+# savings plan
+USAGE_LINE_ITEMS = ('Usage', 'DiscountedUsage', 'SavingsPlanCoveredUsage')
+# the monthly line item of every active reservation
+RESERVATION_LINE_ITEM = 'RIFee'
+
+# the collectors, results prefixes and usage types of the instance hours of
+# each service
+SERVICES = {
+    'AmazonEC2': ('ec2', 'ec2_vpc', ('BoxUsage',)),
+    'AmazonRDS': ('rds', 'rds', ('InstanceUsage', 'Multi-AZUsage')),
+    'AmazonElastiCache': ('elasticache', 'elc', ('NodeUsage',))
+}
+
+# rows of Parquet files read at once
+PARQUET_BATCH_SIZE = 65536
+
+
+def column_id(column):
+    """Return a column name without its separators and case.
+
+    The Parquet columns of a report split every capital of the CSV column
+    names, e.g. 'reservation/ReservationARN' is stored as
+    'reservation_reservation_a_r_n', so the columns of both formats are
+    compared by their letters and digits only.
+
+    """
+    return re.sub(r'[^a-z0-9]', '', column.lower())
+
+
+def iter_csv(path):
+    """Yield the fields of each line item of a (gzip compressed) CSV file."""
+    if path.endswith('.gz'):
+        report = io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8',
+                                  newline='')
+    else:
+        report = io.open(path, 'r', encoding='utf-8', newline='')
+    with report:
+        reader = csv.reader(report)
+        header = next(reader)
+        # project the fields present in this report
+        indexes = [(field, header.index(column))
+                   for field, column in COLUMNS.items() if column in header]
+        for row in reader:
+            yield dict((field, row[index]) for field, index in indexes)
+
+
+def iter_parquet(path):
+    """Yield the fields of each line item of a Parquet file."""
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Reading Parquet reports requires pyarrow, '
+                          'install check-reserved-instances[parquet]')
+
+    report = pyarrow.parquet.ParquetFile(path)
+    fields = dict((column_id(column), field)
+                  for field, column in COLUMNS.items())
+    # project the fields present in this report
+    columns = dict((column, fields[column_id(column)])
+                   for column in report.schema_arrow.names
+                   if column_id(column) in fields)
+    for batch in report.iter_batches(batch_size=PARQUET_BATCH_SIZE,
+                                     columns=list(columns)):
+        for row in batch.to_pylist():
+            yield dict((columns[column], '' if value is None else value)
+                       for column, value in row.items())
+
+
+def iter_line_items(path):
+    """Yield the fields of each line item of a report file."""
+    if path.endswith('.parquet'):
+        return iter_parquet(path)
+    return iter_csv(path)
+
+
+def parse_time(value):
+    """Parse a report timestamp, e.g. 2024-01-01T00:00:00Z."""
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None)
+    return datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+def placement_key(service, item, instance_type, reserved=False):
+    """Return the results key of a line item, as the collectors key them.
+
+    Args:
+        service (str): The results prefix of the service.
+        item (dict): The fields of the line item.
+        instance_type (str): The instance type, class or node type.
+        reserved (Optional bool): Whether the line item is a reservation.
+
+    Returns:
+        The placement key tuple.
+
+    """
+    if service == 'ec2_vpc':
+        # regional reservations have no availability zone
+        return (instance_type,
+                item.get('availability_zone') or ('All' if reserved else ''))
+    if service == 'rds':
+        return (instance_type,
+                'Multi-AZ' in item.get('deployment_option', '') or
+                'Multi-AZ' in item['usage_type'])
+    return (instance_type, item.get('cache_engine', '').lower())
+
+
+def read_part(path):
+    """Total the instance hours and reservations of one report file.
+
+    Args:
+        path (str): A filesystem location of a gzip CSV or Parquet file.
+
+    Returns:
+        A dict of the instance hours and the resource IDs by (results
+        prefix, key), the (results prefix, key, count, end) of the
+        reservations by ARN, and the earliest start and latest end of the
+        usage.
+
+    """
+    part = {'hours': {}, 'resources': {}, 'reservations': {},
+            'start': None, 'end': None}
+    for item in iter_line_items(path):
+        line_item_type = item.get('line_item_type')
+        if line_item_type not in USAGE_LINE_ITEMS + (RESERVATION_LINE_ITEM,):
+            continue
+        service = SERVICES.get(item.get('product_code'))
+        if not service or ':' not in item.get('usage_type', ''):
+            continue
+        # e.g. USW2-BoxUsage:m5.large
+        usage, instance_type = item['usage_type'].split(':', 1)
+        instance_type = item.get('instance_type') or instance_type
+        _, prefix, usage_types = service
+
+        if line_item_type == RESERVATION_LINE_ITEM:
+            # reports without the reservation columns can't count them
+            if item.get('reservation_arn') and item.get('reservation_end'):
+                part['reservations'][item['reservation_arn']] = (
+                    prefix, placement_key(prefix, item, instance_type, True),
+                    int(float(item.get('reservations') or 1)),
+                    item['reservation_end'])
+            continue
+        if not any(usage == usage_type or usage.endswith('-' + usage_type)
+                   for usage_type in usage_types):
+            continue
+        start, end = item.get('usage_start'), item.get('usage_end')
+        if not start or not end:
+            continue
+
+        key = (prefix, placement_key(prefix, item, instance_type))
+        part['hours'][key] = part['hours'].get(key, 0.0) + float(
+            item.get('usage_amount') or 0)
+        if item.get('resource_id'):
+            part['resources'].setdefault(key, set()).add(item['resource_id'])
+        if part['start'] is None or start < part['start']:
+            part['start'] = start
+        if part['end'] is None or end > part['end']:
+            part['end'] = end
+    return part
+
+
+def read_parts(paths, max_workers=None):
+    """Read report files in parallel processes.
+
+    Args:
+        paths (list): Filesystem locations of the report files.
+        max_workers (Optional int): How many files to read at once. Defaults
+            to the number of processors.
+
+    Returns:
+        The `read_part` output of each file.
+
+    """
+    if len(paths) == 1 or max_workers == 1:
+        return [read_part(path) for path in paths]
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        return list(executor.map(read_part, paths))
+    finally:
+        executor.shutdown()
+
+
+def cur_results(paths, max_workers=None):
+    """Count the running and reserved instances of Cost and Usage Reports.
+
+    The running instances of each type and placement are the average number
+    of instances over the period of the reports, rounded to the nearest
+    instance, so the counts can be compared with the reservations.
+
+    Args:
+        paths (list): Filesystem locations of the report files.
+        max_workers (Optional int): How many files to read at once.
+
+    Returns:
+        A tuple of the results dictionary and the (report section, results
+        prefix) tuples of its services.
+
+    """
+    parts = read_parts(paths, max_workers)
+    services = sorted(set(
+        section for collector, _, _ in SERVICES.values()
+        for section in get_collector(collector).sections))
+    results = new_results(services)
+
+    hours = {}
+    resources = {}
+    reservations = {}
+    starts = [part['start'] for part in parts if part['start']]
+    ends = [part['end'] for part in parts if part['end']]
+    for part in parts:
+        for key, amount in part['hours'].items():
+            hours[key] = hours.get(key, 0.0) + amount
+        for key, resource_ids in part['resources'].items():
+            resources.setdefault(key, set()).update(resource_ids)
+        reservations.update(part['reservations'])
+
+    period = 0.0
+    if starts and ends:
+        period = (parse_time(max(ends)) -
+                  parse_time(min(starts))).total_seconds() / 3600
+    for (prefix, key), amount in hours.items():
+        count = int(round(amount / period)) if period else 0
+        if count:
+            results[prefix + '_running_instances'][key] = count
+            # every instance seen, which may be more than the average
+            results['instance_ids'][key] = sorted(
+                resources.get((prefix, key), ()))
+
+    for arn, (prefix, key, count, end) in reservations.items():
+        add_reservation(results, prefix + '_reserved_instances', key, count,
+                        parse_time(end), arn)
+
+    return results, services
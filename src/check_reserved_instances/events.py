@@ -0,0 +1,232 @@
+"""Incremental updates of the results from instance and reservation events.
+
+Events use the EventBridge envelope. Instance state changes are the
+"EC2 Instance State-change Notification" events, where an instance not in
+the results yet carries its DescribeInstances record under
+`detail.instance`::
+
+    {"detail-type": "EC2 Instance State-change Notification",
+     "detail": {"instance-id": "i-0abc", "state": "running",
+                "instance": {"InstanceId": "i-0abc", ...}}}
+
+Reservation purchases and expiries are "EC2 Reserved Instances
+State-change" events, where a new reservation carries its
+DescribeReservedInstances record under `detail.reserved-instances`::
+
+    {"detail-type": "EC2 Reserved Instances State-change",
+     "detail": {"reserved-instances-id": "ri-0abc", "state": "active",
+                "reserved-instances": {"ReservedInstancesId": "ri-0abc",
+                                       ...}}}
+
+RDS and ElastiCache changes are picked up by the periodic full reconcile.
+"""
+
+import calendar
+import datetime
+import io
+import json
+import time
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+from check_reserved_instances.aws import add_ec2_instance, add_ec2_reservation
+from check_reserved_instances.calculate import (
+    remove_instance, remove_reservation)
+
+INSTANCE_STATE_CHANGE = 'EC2 Instance State-change Notification'
+RESERVED_INSTANCES_STATE_CHANGE = 'EC2 Reserved Instances State-change'
+
+# outcomes of applying an event
+APPLIED = 'applied'
+IGNORED = 'ignored'
+# the results can't be updated from the event, a reconcile is needed
+STALE = 'stale'
+
+
+def parse_datetime(value):
+    """Parse an ISO 8601 UTC timestamp as found in JSON events."""
+    return datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+def apply_event(results, event):
+    """Update the results in place from an event.
+
+    Args:
+        results (dict): The results dictionary to update.
+        event (dict): An instance or reservation state-change event.
+
+    Returns:
+        `APPLIED` if the results changed, `IGNORED` if the event makes no
+        difference and `STALE` if the results can't be updated from it.
+
+    """
+    detail = event.get('detail', {})
+    if event.get('detail-type') == INSTANCE_STATE_CHANGE:
+        instance_id = detail['instance-id']
+        if detail['state'] != 'running':
+            return APPLIED if remove_instance(results, instance_id) else (
+                IGNORED)
+        if instance_id in results['instances']:
+            return IGNORED
+        if 'instance' not in detail:
+            return STALE
+        instance = dict(detail['instance'])
+        if instance.get('LaunchTime') and not isinstance(
+                instance['LaunchTime'], datetime.datetime):
+            instance['LaunchTime'] = parse_datetime(instance['LaunchTime'])
+        add_ec2_instance(results, instance)
+        return APPLIED
+
+    if event.get('detail-type') == RESERVED_INSTANCES_STATE_CHANGE:
+        reservation_id = detail['reserved-instances-id']
+        if detail['state'] != 'active':
+            return APPLIED if remove_reservation(
+                results, reservation_id) else IGNORED
+        if reservation_id in results['reservations']:
+            return IGNORED
+        if 'reserved-instances' not in detail:
+            return STALE
+        reserved_instance = dict(detail['reserved-instances'])
+        if not isinstance(reserved_instance['End'], datetime.datetime):
+            reserved_instance['End'] = parse_datetime(
+                reserved_instance['End'])
+        # EC2-Classic reservations only exist where Classic is in use
+        account_is_vpc_only = not (
+            results.get('ec2_classic_running_instances') or
+            results.get('ec2_classic_reserved_instances'))
+        add_ec2_reservation(results, reserved_instance, account_is_vpc_only)
+        return APPLIED
+
+    return IGNORED
+
+
+def expire_reservations(results, now=None):
+    """Stop counting the reservations which have expired.
+
+    Args:
+        results (dict): The results dictionary to update.
+        now (Optional int): Epoch timestamp to compare the expiry with.
+
+    Returns:
+        The number of reservations removed.
+
+    """
+    if now is None:
+        now = calendar.timegm(time.gmtime())
+    expired = [reservation_id for reservation_id, reservation in
+               results['reservations'].items() if reservation[4] <= now]
+    for reservation_id in expired:
+        remove_reservation(results, reservation_id)
+    return len(expired)
+
+
+def read_events(path, follow=False, poll_interval=1.0):
+    """Read events from a JSON-lines file.
+
+    Args:
+        path (str): A filesystem location of the file.
+        follow (Optional bool): Whether to keep waiting for lines appended to
+            the file, like `tail -f`.
+        poll_interval (Optional float): Seconds to wait for new lines.
+
+    Yields:
+        The events, and None whenever no new event arrived within
+        `poll_interval` while following.
+
+    """
+    with io.open(path, 'r', encoding='utf-8') as events_file:
+        buffered = ''
+        while True:
+            line = events_file.readline()
+            if line.endswith('\n'):
+                line, buffered = buffered + line, ''
+                if line.strip():
+                    yield json.loads(line)
+            elif follow:
+                # keep partially written lines until they are complete
+                buffered += line
+                yield None
+                time.sleep(poll_interval)
+            else:
+                if (buffered + line).strip():
+                    yield json.loads(buffered + line)
+                return
+
+
+def read_queue(events_queue, poll_interval=1.0):
+    """Read events from a queue until a None item is put on it.
+
+    Args:
+        events_queue (Queue): The queue events are put on.
+        poll_interval (Optional float): Seconds to wait for new events.
+
+    Yields:
+        The events, and None whenever no new event arrived within
+        `poll_interval`.
+
+    """
+    while True:
+        try:
+            event = events_queue.get(timeout=poll_interval)
+        except queue.Empty:
+            yield None
+            continue
+        if event is None:
+            return
+        yield event
+
+
+def watch(results, events, reconcile, reconcile_interval, on_change,
+          clock=time.time):
+    """Keep the results up to date from a stream of events.
+
+    Changes are reported whenever the stream goes idle. The results are
+    replaced by a full reconcile every `reconcile_interval` seconds, even
+    while events keep arriving, and as soon as an event can't be applied.
+
+    Args:
+        results (dict): The baseline results dictionary.
+        events (iterable): The events, with None whenever the stream is
+            idle, as yielded by `read_events` or `read_queue`.
+        reconcile (callable): Function returning fresh results of a full
+            scan.
+        reconcile_interval (float): Seconds between full reconciles. 0
+            disables periodic reconciles.
+        on_change (callable): Function called with the results and the
+            number of events applied since the last call.
+        clock (Optional callable): Function returning the current time.
+
+    Returns:
+        The up to date results once the events are exhausted.
+
+    """
+    last_reconcile = clock()
+    applied = 0
+    for event in events:
+        stale = False
+        if event is not None:
+            outcome = apply_event(results, event)
+            if outcome == APPLIED:
+                applied += 1
+            stale = outcome == STALE
+        elif expire_reservations(results):
+            applied += 1
+
+        # checked after every event, so a busy stream is reconciled too
+        if stale or (reconcile_interval and
+                     clock() - last_reconcile >= reconcile_interval):
+            results = reconcile()
+            last_reconcile = clock()
+            on_change(results, applied)
+            applied = 0
+        elif event is None and applied:
+            on_change(results, applied)
+            applied = 0
+
+    expire_reservations(results)
+    if applied:
+        on_change(results, applied)
+    return results
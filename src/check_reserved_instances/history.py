@@ -0,0 +1,246 @@
+"""Local history of reserved instance coverage snapshots."""
+
+import datetime
+import sqlite3
+import time
+
+SECONDS_PER_DAY = 86400
+
+# bucket size in seconds for each supported trend interval
+INTERVALS = {
+    'run': None,
+    'day': SECONDS_PER_DAY,
+    'week': 7 * SECONDS_PER_DAY,
+}
+# start of the first bucket: the epoch was a Thursday, so weeks start on
+# the following Monday, 1970-01-05
+BUCKETS_START = 4 * SECONDS_PER_DAY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_run_at
+    ON runs (run_at);
+CREATE TABLE IF NOT EXISTS snapshots (
+    run_id INTEGER NOT NULL,
+    account TEXT NOT NULL,
+    service TEXT NOT NULL,
+    instance_type TEXT NOT NULL,
+    placement TEXT NOT NULL,
+    running INTEGER NOT NULL,
+    reserved INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_run_id
+    ON snapshots (run_id);
+CREATE INDEX IF NOT EXISTS snapshots_account
+    ON snapshots (account, run_id);
+CREATE INDEX IF NOT EXISTS snapshots_service
+    ON snapshots (service, run_id);
+CREATE INDEX IF NOT EXISTS snapshots_instance_type
+    ON snapshots (instance_type, run_id, running, reserved);
+"""
+
+
+class HistoryStore(object):
+    """SQLite database of per-account coverage counts for every run."""
+
+    def __init__(self, database):
+        """Open (and create if needed) the history database.
+
+        Args:
+            database (str): A filesystem location to the SQLite database.
+
+        """
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+    def record_run(self, account_results, services, run_at=None):
+        """Append the counts of one run to the history.
+
+        Each run is recorded on its own, even if another run was recorded
+        at the same time, e.g. by another configuration.
+
+        Args:
+            account_results (list): (account name, results dict) tuples, one
+                for each account scanned in the run.
+            services (list): (report section, results prefix) tuples of the
+                services in the results.
+            run_at (Optional int): Epoch timestamp of the run. Defaults to
+                now.
+
+        Returns:
+            The epoch timestamp the run was recorded with.
+
+        """
+        if run_at is None:
+            run_at = int(time.time())
+
+        with self.connection:
+            run_id = self.connection.execute(
+                'INSERT INTO runs (run_at) VALUES (?)', (run_at,)).lastrowid
+            rows = []
+            for account, results in account_results:
+                for service, prefix in services:
+                    running = results.get(prefix + '_running_instances', {})
+                    reserved = results.get(
+                        prefix + '_reserved_instances', {})
+                    for placement_key in set(running) | set(reserved):
+                        rows.append((
+                            run_id, account, service, placement_key[0],
+                            str(placement_key[1]),
+                            running.get(placement_key, 0),
+                            reserved.get(placement_key, 0)))
+            self.connection.executemany(
+                'INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+        return run_at
+
+    def compact(self, compact_after_days, retention_days=0, now=None):
+        """Downsample and expire old runs.
+
+        Runs older than `compact_after_days` are reduced to the last run of
+        each day, and runs older than `retention_days` are removed.
+
+        Args:
+            compact_after_days (int): Age in days after which runs are
+                downsampled to one per day. 0 disables downsampling.
+            retention_days (Optional int): Age in days after which runs are
+                deleted. 0 keeps runs forever.
+            now (Optional int): Epoch timestamp to compute ages from.
+
+        """
+        if now is None:
+            now = int(time.time())
+
+        with self.connection:
+            if retention_days:
+                cutoff = now - retention_days * SECONDS_PER_DAY
+                self._delete_runs(
+                    'SELECT run_id FROM runs WHERE run_at < ?', (cutoff,))
+            if compact_after_days:
+                cutoff = now - compact_after_days * SECONDS_PER_DAY
+                # the runs recorded at the same last time are all kept
+                self._delete_runs(
+                    'SELECT run_id FROM runs WHERE run_at < ? AND run_at '
+                    'NOT IN (SELECT MAX(run_at) FROM runs WHERE run_at < ? '
+                    'GROUP BY run_at / {})'.format(SECONDS_PER_DAY),
+                    (cutoff, cutoff))
+
+    def _delete_runs(self, select, parameters):
+        """Delete the runs, and their snapshots, matched by a query."""
+        run_ids = [(row[0],) for row in self.connection.execute(
+            select, parameters)]
+        self.connection.executemany(
+            'DELETE FROM snapshots WHERE run_id = ?', run_ids)
+        self.connection.executemany(
+            'DELETE FROM runs WHERE run_id = ?', run_ids)
+
+    def trend(self, days, instance_type=None, account=None, service=None,
+              interval='run', now=None):
+        """Query the running and reserved instance totals over time.
+
+        Args:
+            days (int): How many days back to query.
+            instance_type (Optional str): An instance type (`m5.large`),
+                instance family (`m5`) or glob pattern (`db.m5.*`) to
+                filter on.
+            account (Optional str): The account name to filter on.
+            service (Optional str): The service name to filter on.
+            interval (Optional str): One of `INTERVALS`. Totals of runs
+                within an interval are averaged. Weeks start on Monday.
+            now (Optional int): Epoch timestamp to count the days back from.
+
+        Returns:
+            A list of (datetime, running, reserved) tuples, oldest first.
+
+        """
+        if now is None:
+            now = int(time.time())
+
+        conditions = ['run_at >= ?']
+        parameters = [now - days * SECONDS_PER_DAY]
+        if instance_type:
+            if '*' in instance_type or '?' in instance_type:
+                conditions.append('instance_type GLOB ?')
+                parameters.append(instance_type)
+            else:
+                conditions.append('(instance_type = ? OR instance_type '
+                                  'GLOB ? OR instance_type GLOB ?)')
+                parameters.extend([instance_type, instance_type + '.*',
+                                   '*.' + instance_type + '.*'])
+        if account:
+            conditions.append('account = ?')
+            parameters.append(account)
+        if service:
+            conditions.append('service = ?')
+            parameters.append(service)
+
+        query = ('SELECT run_at, SUM(running) AS running, SUM(reserved) AS '
+                 'reserved FROM snapshots JOIN runs USING (run_id) WHERE {} '
+                 'GROUP BY run_id'.format(' AND '.join(conditions)))
+        bucket = INTERVALS[interval]
+        if bucket:
+            query = ('SELECT run_at - (run_at - {0}) % {1}, AVG(running), '
+                     'AVG(reserved) FROM ({2}) GROUP BY (run_at - {0}) / '
+                     '{1}'.format(BUCKETS_START, bucket, query))
+
+        return [(datetime.datetime.utcfromtimestamp(run_at),
+                 int(round(running)), int(round(reserved)))
+                for run_at, running, reserved in self.connection.execute(
+                    query + ' ORDER BY 1', parameters)]
+
+
+def calc_coverage(running, reserved):
+    """Calculate the percentage of running instances covered by RIs.
+
+    Args:
+        running (int): Count of running instances.
+        reserved (int): Count of reserved instances.
+
+    Returns:
+        The coverage percentage, or None if nothing is running.
+
+    """
+    if not running:
+        return None
+    return 100.0 * min(running, reserved) / running
+
+
+def open_history(config):
+    """Open the history database if it is configured.
+
+    Args:
+        config (dict): The application configuration.
+
+    Returns:
+        A `HistoryStore`, or None if no [History] section is configured.
+
+    """
+    if not config.get('History'):
+        return None
+    return HistoryStore(config['History']['database'])
+
+
+def record_history(config, account_results, services):
+    """Record a run to the history database if it is configured.
+
+    Args:
+        config (dict): The application configuration.
+        account_results (list): (account name, results dict) tuples, one for
+            each account scanned in the run.
+        services (list): (report section, results prefix) tuples of the
+            services in the results.
+
+    """
+    history = open_history(config)
+    if history:
+        history.record_run(account_results, services)
+        history.compact(config['History']['compact_after_days'],
+                        config['History']['retention_days'])
+        history.close()
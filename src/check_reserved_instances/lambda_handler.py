@@ -0,0 +1,111 @@
+"""AWS Lambda entry point, reusing its state across warm invocations.
+
+Configure the function's handler as
+`check_reserved_instances.lambda_handler.handler`. The configuration is
+read, in order of precedence, from the event's `config` (in the
+configuration file format), the CHECK_RESERVED_INSTANCES_CONFIG environment
+variable, or the file named by CHECK_RESERVED_INSTANCES_CONFIG_FILE
+(config.ini by default).
+
+The parsed configuration, the boto3 sessions and clients of each account
+(with their assumed role credentials) and the compiled report templates are
+kept at module level, so warm invocations of the same container only make
+the AWS calls of the scan itself.
+"""
+
+import os
+
+from check_reserved_instances import aws
+from check_reserved_instances.config import parse_config, parse_config_string
+from check_reserved_instances.progress import build_payload
+from check_reserved_instances.reporting import assemble_report, send_report
+from check_reserved_instances.scan import scan
+
+CONFIG_VARIABLE = 'CHECK_RESERVED_INSTANCES_CONFIG'
+CONFIG_FILE_VARIABLE = 'CHECK_RESERVED_INSTANCES_CONFIG_FILE'
+DEFAULT_CONFIG_FILE = 'config.ini'
+
+# seconds of the invocation's remaining time kept to build the payload once
+# the scan deadline passed
+DEADLINE_MARGIN = 10
+
+# the parsed configuration, by its source, and the sessions of its accounts
+current_config = {}
+sessions = {}
+
+
+def load_config(event):
+    """Return the configuration of an invocation, parsing it if it changed.
+
+    Args:
+        event (dict): The Lambda event.
+
+    Returns:
+        The application configuration.
+
+    """
+    text = event.get('config') or os.environ.get(CONFIG_VARIABLE)
+    source = ('text', text) if text else ('file', os.environ.get(
+        CONFIG_FILE_VARIABLE, DEFAULT_CONFIG_FILE))
+    if current_config.get('source') != source:
+        if text:
+            config = parse_config_string(text)
+        else:
+            config = parse_config(source[1])
+        # sessions of another configuration may have another client config
+        sessions.clear()
+        aws.configure_clients(config.get('Connection', {}))
+        current_config.clear()
+        current_config.update(source=source, config=config)
+    return current_config['config']
+
+
+def invocation_deadline(event, context):
+    """Return the seconds the scan may take, or None.
+
+    Args:
+        event (dict): The Lambda event, whose `deadline` takes precedence.
+        context: The Lambda context, or None when called locally.
+
+    Returns:
+        The seconds until the scan deadline.
+
+    """
+    if event.get('deadline') is not None:
+        return float(event['deadline'])
+    if context is not None and hasattr(context,
+                                       'get_remaining_time_in_millis'):
+        return max(context.get_remaining_time_in_millis() / 1000.0 -
+                   DEADLINE_MARGIN, 0)
+    return None
+
+
+def handler(event, context=None):
+    """Scan the configured accounts and return the reconciled results.
+
+    Args:
+        event (dict): The Lambda event. Its optional `config` is the
+            configuration, `deadline` the seconds the scan may take (by
+            default, the invocation's remaining time), and `send_report`
+            whether to also print and email the report as the command does.
+        context: The Lambda context, or None when called locally.
+
+    Returns:
+        The payload of `progress.build_payload`.
+
+    """
+    event = event or {}
+    config = load_config(event)
+    aws.set_deadline(invocation_deadline(event, context))
+    try:
+        with aws.reuse_sessions(sessions):
+            results, services, _, failures = scan(config)
+    finally:
+        aws.set_deadline(None)
+
+    if event.get('send_report'):
+        report, instance_ids = send_report(config, results, services,
+                                           failures)
+    else:
+        report, instance_ids = assemble_report(config, results, services)
+    return build_payload(report, instance_ids, failures)
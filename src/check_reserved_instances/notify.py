@@ -0,0 +1,167 @@
+"""Only report when the reconciled results changed since the last report.
+
+The unused reservations, unreserved instances and units not scanned of a
+report are reduced to a canonical list of entries, fingerprinted and saved
+with the time of the report. Later reports with the same fingerprint are
+skipped, unless a heartbeat is due.
+"""
+
+import hashlib
+import io
+import json
+import os
+import time
+
+# report entries compared between reports, by the report field they are in
+KINDS = (('unused_reservations', 'unused'),
+         ('unreserved_instances', 'unreserved'))
+FAILURE_KIND = 'not scanned'
+
+
+def report_entries(report, failures=None):
+    """Reduce a report to the entries compared between reports.
+
+    Args:
+        report (dict): The report, as returned by `build_report`.
+        failures (Optional list): The units which could not be scanned.
+
+    Returns:
+        A dict of the counts by (service, kind, key).
+
+    """
+    entries = {}
+    for service, diffs in report.items():
+        for field, kind in KINDS:
+            for key, count in diffs[field].items():
+                entries[(service, kind, tuple(key))] = count
+    for failure in failures or []:
+        entries[(failure['service'], FAILURE_KIND,
+                 (failure['account'], failure['region']))] = 1
+    return entries
+
+
+def serialize_entries(entries):
+    """Convert report entries to a sorted list of JSON-compatible items."""
+    return sorted(([service, kind, list(key), count]
+                   for (service, kind, key), count in entries.items()),
+                  key=json.dumps)
+
+
+def fingerprint(entries):
+    """Return the canonical SHA-256 fingerprint of report entries."""
+    canonical = json.dumps(serialize_entries(entries), separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def compare_entries(previous, current):
+    """List the entries whose count changed between two reports.
+
+    Args:
+        previous (dict): The entries of the last report.
+        current (dict): The entries of this report.
+
+    Returns:
+        A list of change dicts of the service, kind, key and previous and
+        current counts (0 when absent), sorted.
+
+    """
+    changes = []
+    for entry in sorted(set(previous) | set(current), key=repr):
+        if previous.get(entry, 0) != current.get(entry, 0):
+            service, kind, key = entry
+            changes.append({
+                'service': service,
+                'kind': kind,
+                'key': key,
+                'previous': previous.get(entry, 0),
+                'current': current.get(entry, 0)
+            })
+    return changes
+
+
+class NotificationState(object):
+    """State file of the last report sent."""
+
+    def __init__(self, path, heartbeat):
+        """Initialize the state.
+
+        Args:
+            path (str): A filesystem location for the state file.
+            heartbeat (float): Seconds after which an unchanged report is
+                sent again, or 0 to never send it again.
+
+        """
+        self.path = path
+        self.heartbeat = heartbeat
+
+    def load(self):
+        """Return the saved state, or None if no report was sent yet."""
+        if not os.path.exists(self.path):
+            return None
+        with io.open(self.path, 'r', encoding='utf-8') as state_file:
+            state = json.loads(state_file.read())
+        state['entries'] = dict(
+            ((service, kind, tuple(key)), count)
+            for service, kind, key, count in state['entries'])
+        return state
+
+    def changes(self, report, failures=None, now=None):
+        """Compare a report with the last report sent.
+
+        Args:
+            report (dict): The report, as returned by `build_report`.
+            failures (Optional list): The units which could not be scanned.
+            now (Optional float): The current time, defaults to now.
+
+        Returns:
+            The list of changes (see `compare_entries`), empty for the first
+            report or a heartbeat, or None if the report should be skipped.
+
+        """
+        now = time.time() if now is None else now
+        state = self.load()
+        if state is None:
+            return []
+        entries = report_entries(report, failures)
+        if fingerprint(entries) != state['fingerprint']:
+            return compare_entries(state['entries'], entries)
+        if self.heartbeat and now - state['sent_at'] >= self.heartbeat:
+            return []
+        return None
+
+    def save(self, report, failures=None, now=None):
+        """Record a report as sent.
+
+        Args:
+            report (dict): The report, as returned by `build_report`.
+            failures (Optional list): The units which could not be scanned.
+            now (Optional float): The time it was sent, defaults to now.
+
+        """
+        entries = report_entries(report, failures)
+        state = {
+            'fingerprint': fingerprint(entries),
+            'sent_at': time.time() if now is None else now,
+            'entries': serialize_entries(entries)
+        }
+        temporary_path = '{}.{}'.format(self.path, os.getpid())
+        with io.open(temporary_path, 'w', encoding='utf-8') as state_file:
+            state_file.write(json.dumps(state, separators=(',', ':')))
+        getattr(os, 'replace', os.rename)(temporary_path, self.path)
+
+
+def open_notification_state(config):
+    """Open the notification state if change-only reports are configured.
+
+    Args:
+        config (dict): The application configuration.
+
+    Returns:
+        A `NotificationState`, or None if no [Notification] section is
+        configured.
+
+    """
+    if not config.get('Notification'):
+        return None
+    return NotificationState(config['Notification']['state_file'],
+                             config['Notification']['heartbeat_hours'] * 3600)
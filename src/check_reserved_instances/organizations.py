@@ -0,0 +1,135 @@
+"""Discover the member accounts of an AWS Organization."""
+
+from __future__ import print_function
+
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from check_reserved_instances.aws import assume_role, create_boto_session
+from check_reserved_instances.collectors import collector_defaults
+
+# AWS Organizations is a global service served from us-east-1
+ORGANIZATIONS_REGION = 'us-east-1'
+
+
+def split_list(value):
+    """Split a comma delimited configuration value.
+
+    Args:
+        value (str): The configuration value.
+
+    Returns:
+        A list of the stripped, non-empty items.
+
+    """
+    return [item.strip() for item in (value or '').split(',')
+            if item.strip()]
+
+
+def list_member_accounts(organization):
+    """List the active member accounts of the organization.
+
+    Args:
+        organization (dict): The [Organization] configuration.
+
+    Returns:
+        A list of the account dicts from the ListAccounts responses.
+
+    """
+    session = create_boto_session({
+        'aws_access_key_id': None,
+        'aws_secret_access_key': None,
+        'aws_role_arn': organization['management_role_arn'],
+        'region': ORGANIZATIONS_REGION
+    })
+    excluded = split_list(organization['exclude_accounts'])
+
+    paginator = session.client('organizations').get_paginator(
+        'list_accounts')
+    return [member for page in paginator.paginate()
+            for member in page['Accounts']
+            if member['Status'] == 'ACTIVE' and member['Id'] not in excluded]
+
+
+def assume_member_roles(accounts, max_workers):
+    """Assume the role of every account concurrently.
+
+    The credentials are cached for `create_boto_session` to use.
+
+    Args:
+        accounts (list): The discovered AWS Accounts.
+        max_workers (int): How many roles to assume at once.
+
+    Returns:
+        The accounts whose role could be assumed.
+
+    """
+    source_role_arns = set(account['source_role_arn'] for account in accounts)
+    # assume the management role once, before the member roles need it
+    for source_role_arn in source_role_arns:
+        if source_role_arn:
+            assume_role(source_role_arn, ORGANIZATIONS_REGION)
+
+    def assume(account):
+        try:
+            assume_role(account['aws_role_arn'], account['region'],
+                        account['source_role_arn'])
+        except (ClientError, BotoCoreError) as error:
+            return error
+
+    role_accounts = dict(
+        (account['aws_role_arn'], account) for account in accounts)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        errors = dict(zip(role_accounts, executor.map(
+            assume, role_accounts.values())))
+    finally:
+        executor.shutdown()
+
+    for role_arn, error in errors.items():
+        if error:
+            print('Skipping {}, unable to assume {}: {}'.format(
+                role_accounts[role_arn]['member_name'], role_arn, error))
+
+    return [account for account in accounts
+            if not errors[account['aws_role_arn']]]
+
+
+def discover_accounts(organization, selected=None):
+    """Build the AWS Accounts to scan from the organization's members.
+
+    Args:
+        organization (dict): The [Organization] configuration.
+        selected (Optional callable): Function returning whether an account
+            should be scanned, called before its role is assumed.
+
+    Returns:
+        A list of AWS Account dicts, one for each member account and region,
+        in the same format as the [AWS ] sections of the configuration file.
+        Each is named after the member account and the region, as the
+        sections are told apart by name.
+
+    """
+    accounts = []
+    for member in list_member_accounts(organization):
+        member_name = 'AWS {} ({})'.format(member['Name'], member['Id'])
+        for region in split_list(organization['regions']):
+            account = dict((name, organization[name])
+                           for name, _ in collector_defaults())
+            account.update({
+                'name': 'AWS {} ({}, {})'.format(
+                    member['Name'], member['Id'], region),
+                'member_name': member_name,
+                'account_id': member['Id'],
+                'aws_access_key_id': None,
+                'aws_secret_access_key': None,
+                'aws_role_arn': organization['member_role_arn'].format(
+                    account_id=member['Id'], account_name=member['Name']),
+                'source_role_arn': organization['management_role_arn'],
+                'region': region
+            })
+            if not selected or selected(account):
+                accounts.append(account)
+
+    return assume_member_roles(accounts, organization['max_workers'])
@@ -0,0 +1,143 @@
+"""Streaming stages the collectors are made of.
+
+Each collector chains generator stages, each consuming the records of the
+previous one lazily:
+
+    fetch -> normalize -> select -> aggregate
+
+`fetch` yields the raw records of each page of a describe call, one page
+at a time. A service's normalize function turns a raw record into a
+compact `Instance` or `Reservation`, `select` drops the records which
+aren't counted (spot instances, unavailable clusters, retired
+reservations...) and `aggregate` counts the rest in a results dict. Only
+one page is held at once, so the memory used is bounded by the page size
+rather than the size of the fleet.
+
+The stages after `fetch` take records from any source, e.g. the pages
+received by the async engine or the instances of EC2 events.
+"""
+
+from collections import namedtuple
+import threading
+
+from check_reserved_instances.calculate import add_instance, add_reservation
+
+# a running instance, see `add_instance`; `skip` is the reason it isn't
+# counted, if any
+Instance = namedtuple(
+    'Instance',
+    ('name', 'key', 'instance_id', 'label', 'skip', 'launched_at',
+     'size_flexible'))
+# a reservation, see `add_reservation`
+Reservation = namedtuple(
+    'Reservation',
+    ('name', 'key', 'count', 'expiry', 'reservation_id', 'skip',
+     'size_flexible'))
+
+# guards the instance IDs seen by concurrent pipelines, see `select`
+seen_lock = threading.Lock()
+
+
+def page_records(page, path):
+    """Yield the records of a page.
+
+    Args:
+        page (dict): The page, as returned by a describe call.
+        path (tuple): The keys of the records, nested in the lists of the
+            previous keys, e.g. ('Reservations', 'Instances').
+
+    """
+    for item in page[path[0]]:
+        if len(path) == 1:
+            yield item
+        else:
+            for record in page_records(item, path[1:]):
+                yield record
+
+
+def fetch(client, operation, path, **params):
+    """Yield the records of every page of an operation, a page at a time.
+
+    Args:
+        client (:boto3:client): The client making the calls.
+        operation (str): The paginated operation, e.g. 'describe_instances'.
+        path (tuple): The keys of the records in each page, see
+            `page_records`.
+        **params: The parameters of the calls.
+
+    """
+    for page in client.get_paginator(operation).paginate(**params):
+        for record in page_records(page, path):
+            yield record
+
+
+def normalize(function, records):
+    """Yield the compact record of each raw record.
+
+    Args:
+        function (callable): The normalize function of the service, taking
+            a raw record and returning an `Instance` or `Reservation`.
+        records (iterable): The raw records.
+
+    """
+    for record in records:
+        yield function(record)
+
+
+def select(records, seen=None):
+    """Yield the records which are counted.
+
+    Args:
+        records (iterable): The `Instance` and `Reservation` records.
+        seen (Optional set): IDs of the instances already counted by any
+            pipeline sharing the set, to skip them.
+
+    """
+    for record in records:
+        if record.skip:
+            continue
+        if seen is not None and isinstance(record, Instance):
+            with seen_lock:
+                if record.instance_id in seen:
+                    continue
+                seen.add(record.instance_id)
+        yield record
+
+
+def aggregate(results, records):
+    """Count the records in a results dictionary.
+
+    Args:
+        results (dict): Results in dictionary format to be appended.
+        records (iterable): The `Instance` and `Reservation` records.
+
+    Returns:
+        The updated results dictionary.
+
+    """
+    for record in records:
+        if isinstance(record, Instance):
+            add_instance(results, record.name, record.key,
+                         record.instance_id, record.label,
+                         record.launched_at, record.size_flexible)
+        else:
+            add_reservation(results, record.name, record.key, record.count,
+                            record.expiry, record.reservation_id,
+                            record.size_flexible)
+    return results
+
+
+def count_records(results, records, function, seen=None):
+    """Normalize, select and aggregate raw records.
+
+    Args:
+        results (dict): Results in dictionary format to be appended.
+        records (iterable): The raw records, e.g. as yielded by `fetch`.
+        function (callable): The normalize function of the service.
+        seen (Optional set): See `select`.
+
+    Returns:
+        The updated results dictionary.
+
+    """
+    return aggregate(results, select(normalize(function, records), seen))
@@ -0,0 +1,261 @@
+"""Cost figures from the AWS bulk pricing offer files.
+
+The offer files (the CSV format of the EC2, RDS and ElastiCache price
+lists) are streamed once into a SQLite index of the hourly price of each
+(region, type, platform, term), and only ingested again when the file
+changes. The report is then annotated with the hourly and monthly cost of
+its unused reservations and unreserved instances.
+"""
+
+import csv
+import io
+import os
+import sqlite3
+
+import botocore.loaders
+
+HOURS_PER_MONTH = 730
+HOURS_PER_YEAR = 8760
+ON_DEMAND_TERM = 'OnDemand'
+
+# the offer of the services of each report section
+SECTION_OFFERS = {
+    'EC2 Classic': 'ec2',
+    'EC2 VPC': 'ec2',
+    'RDS': 'rds',
+    'ElastiCache': 'elasticache'
+}
+
+# metadata lines before the header of an offer file
+OFFER_METADATA_LINES = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    offer TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prices (
+    offer TEXT NOT NULL,
+    region TEXT NOT NULL,
+    instance_type TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    term TEXT NOT NULL,
+    hourly REAL NOT NULL,
+    PRIMARY KEY (offer, region, instance_type, platform, term)
+) WITHOUT ROWID;
+"""
+
+
+def region_codes():
+    """Return the region codes by region name, e.g. 'US East (Ohio)'."""
+    endpoints = botocore.loaders.create_loader().load_data('endpoints')
+    return dict((region['description'], code)
+                for partition in endpoints['partitions']
+                for code, region in partition['regions'].items())
+
+
+def offer_platform(offer, row):
+    """Return the platform of a price list row, or None to skip the row.
+
+    Only the prices matching how the collectors key the instances are kept:
+    shared tenancy Linux EC2 instances without pre-installed software, RDS
+    instances by engine and deployment option, and ElastiCache nodes by
+    engine.
+
+    """
+    if offer == 'ec2':
+        if (row.get('Tenancy') != 'Shared' or
+                row.get('Pre Installed S/W', 'NA') != 'NA' or
+                row.get('CapacityStatus', 'Used') != 'Used' or
+                row.get('License Model') == 'Bring your own license'):
+            return None
+        return row.get('Operating System') or None
+    if offer == 'rds':
+        if not row.get('Database Engine'):
+            return None
+        return '{}|{}'.format(row['Database Engine'],
+                              row.get('Deployment Option'))
+    return (row.get('Cache Engine') or '').lower() or None
+
+
+def offer_term(row):
+    """Return the term of a price list row, e.g. '1yr No Upfront'."""
+    if row['TermType'] == ON_DEMAND_TERM:
+        return ON_DEMAND_TERM
+    if row.get('OfferingClass', 'standard') != 'standard':
+        return None
+    return '{} {}'.format(row['LeaseContractLength'], row['PurchaseOption'])
+
+
+def iter_prices(offer, path):
+    """Yield the hourly prices of an offer file.
+
+    Upfront fees are spread over the hours of the reservation term. Rows
+    are streamed, and only one total per SKU and term is kept in memory.
+
+    Args:
+        offer (str): The offer, ec2, rds or elasticache.
+        path (str): A filesystem location of the CSV offer file.
+
+    Yields:
+        (region, instance type, platform, term, hourly price) tuples.
+
+    """
+    regions = region_codes()
+    terms = {}
+    with io.open(path, 'r', encoding='utf-8', newline='') as offer_file:
+        for _ in range(OFFER_METADATA_LINES):
+            next(offer_file)
+        for row in csv.DictReader(offer_file):
+            if not row.get('Instance Type') or row.get('Currency') != 'USD':
+                continue
+            platform = offer_platform(offer, row)
+            term = offer_term(row)
+            region = row.get('Region Code') or regions.get(row['Location'])
+            if not platform or not term or not region:
+                continue
+            price = float(row['PricePerUnit'] or 0)
+            if row['Unit'] == 'Quantity':
+                # an upfront fee
+                price /= HOURS_PER_YEAR * int(
+                    row['LeaseContractLength'][0])
+            elif row['Unit'] not in ('Hrs', 'Hours'):
+                continue
+            total = terms.setdefault(
+                (row['SKU'], row['OfferTermCode']),
+                [(region, row['Instance Type'], platform, term), 0.0])
+            total[1] += price
+
+    # several SKUs can match a key, e.g. licensing variants, keep the lowest
+    prices = {}
+    for key, hourly in terms.values():
+        if key not in prices or hourly < prices[key]:
+            prices[key] = hourly
+    for key, hourly in prices.items():
+        yield key + (hourly,)
+
+
+class PriceIndex(object):
+    """SQLite index of the hourly prices of the offer files."""
+
+    def __init__(self, database):
+        """Open (and create if needed) the price index.
+
+        Args:
+            database (str): A filesystem location to the SQLite database.
+
+        """
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+    def update(self, offer, path):
+        """Ingest an offer file, unless it is unchanged since last ingested.
+
+        Args:
+            offer (str): The offer, ec2, rds or elasticache.
+            path (str): A filesystem location of the CSV offer file.
+
+        Returns:
+            Whether the file was ingested.
+
+        """
+        stat = os.stat(path)
+        source = self.connection.execute(
+            'SELECT size, mtime FROM sources WHERE offer = ?',
+            (offer,)).fetchone()
+        if source == (stat.st_size, stat.st_mtime):
+            return False
+
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM prices WHERE offer = ?', (offer,))
+            self.connection.executemany(
+                'INSERT INTO prices VALUES (?, ?, ?, ?, ?, ?)',
+                ((offer,) + price for price in iter_prices(offer, path)))
+            self.connection.execute(
+                'INSERT OR REPLACE INTO sources VALUES (?, ?, ?)',
+                (offer, stat.st_size, stat.st_mtime))
+        return True
+
+    def hourly(self, offer, region, instance_type, platform, term):
+        """Return the hourly price of an instance type, or None."""
+        price = self.connection.execute(
+            'SELECT hourly FROM prices WHERE offer = ? AND region = ? AND '
+            'instance_type = ? AND platform = ? AND term = ?',
+            (offer, region, instance_type, platform, term)).fetchone()
+        return price[0] if price else None
+
+
+def price_key(offer, key, pricing):
+    """Return the region, instance type and platform of a report key.
+
+    Args:
+        offer (str): The offer of the report section.
+        key (tuple): The report key, as the collectors key the instances.
+        pricing (dict): The [Pricing] configuration.
+
+    Returns:
+        A (region, instance type, platform) tuple.
+
+    """
+    region = pricing['region']
+    if offer == 'ec2':
+        if key[1] != 'All':
+            # the availability zone, e.g. us-east-1a
+            region = key[1][:-1]
+        return region, key[0], pricing['ec2_platform']
+    if offer == 'rds':
+        return region, key[0], '{}|{}'.format(
+            pricing['rds_engine'], 'Multi-AZ' if key[1] else 'Single-AZ')
+    return region, key[0], key[1].lower()
+
+
+def price_report(config, report):
+    """Calculate the cost of the unused reservations and unreserved instances.
+
+    Unused reservations cost their reserved rate, and unreserved instances
+    their on-demand rate.
+
+    Args:
+        config (dict): The application configuration.
+        report (dict): The report, as returned by `build_report`.
+
+    Returns:
+        A dict of the (hourly, monthly) costs by (report section, key), or
+        None if no [Pricing] section is configured.
+
+    """
+    pricing = config.get('Pricing')
+    if not pricing:
+        return None
+
+    index = PriceIndex(pricing['index'])
+    try:
+        offers = set()
+        for offer in ('ec2', 'rds', 'elasticache'):
+            if pricing[offer + '_offer']:
+                index.update(offer, pricing[offer + '_offer'])
+                offers.add(offer)
+
+        costs = {}
+        for service, diffs in report.items():
+            offer = SECTION_OFFERS.get(service)
+            if offer not in offers:
+                continue
+            for field, term in (
+                    ('unused_reservations', pricing['reserved_term']),
+                    ('unreserved_instances', ON_DEMAND_TERM)):
+                for key, count in diffs[field].items():
+                    hourly = index.hourly(
+                        offer, *price_key(offer, key, pricing) + (term,))
+                    if hourly is not None:
+                        costs[(service, key)] = (
+                            hourly * count, hourly * count * HOURS_PER_MONTH)
+        return costs
+    finally:
+        index.close()
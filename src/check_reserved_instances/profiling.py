@@ -0,0 +1,242 @@
+"""Wall time, CPU time and memory profiling of the stages of a run.
+
+Stages are timed with the `stage` context manager, which does nothing
+unless profiling was enabled with `enable`. The running stages are kept
+per thread and asyncio task, so the AWS calls are charged to the stage of
+the thread or task making them. The worker processes of the process
+engine profile their tasks, which are merged with `Profiler.merge`.
+"""
+
+from __future__ import print_function
+
+from collections import OrderedDict
+import contextlib
+import cProfile
+import threading
+import time
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    contextvars = None
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+# suffix of the stages timing the AWS calls made during another stage
+AWS_CALLS = ' (AWS calls)'
+# keys of the (stage name, start time) of an AWS call in its botocore context
+CONTEXT_STAGE = 'profiling_stage'
+CONTEXT_START = 'profiling_start'
+
+# CPU time of the process
+cpu_time = getattr(time, 'process_time', None) or time.clock
+
+
+class StageStats(object):
+    """Accumulated measurements of a stage."""
+
+    def __init__(self):
+        """Initialize empty measurements."""
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = None
+
+
+class Profiler(object):
+    """Profiler of the stages of a run."""
+
+    def __init__(self):
+        """Initialize a profiler with no stages recorded."""
+        self.stages = OrderedDict()
+        self.lock = threading.Lock()
+        # the [stage name, start memory, highest memory] of the stages
+        # running in each thread, or asyncio task where available
+        if contextvars:
+            self.running = contextvars.ContextVar('stages', default=())
+        else:  # pragma: no cover
+            self.local = threading.local()
+
+    def stack(self):
+        """Return the stages running in this thread or task, innermost last."""
+        if contextvars:
+            return self.running.get()
+        return getattr(self.local, 'stack', ())  # pragma: no cover
+
+    def set_stack(self, stack):
+        """Replace the stages running in this thread or task."""
+        if contextvars:
+            self.running.set(stack)
+        else:  # pragma: no cover
+            self.local.stack = stack
+
+    def record(self, name, wall, cpu=0.0, peak=None, calls=1):
+        """Add the measurements of calls of a stage."""
+        with self.lock:
+            stats = self.stages.setdefault(name, StageStats())
+            stats.calls += calls
+            stats.wall += wall
+            stats.cpu += cpu
+            if peak is not None:
+                stats.peak = max(stats.peak or 0, peak)
+
+    def merge(self, stages):
+        """Add the stages recorded by another profiler, e.g. of a worker."""
+        for name, stats in stages.items():
+            self.record(name, stats.wall, stats.cpu, stats.peak, stats.calls)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure the wall time, CPU time and peak memory of a block."""
+        stack = self.stack()
+        entry = [name, None, None]
+        memory = tracemalloc and tracemalloc.is_tracing()
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack and stack[-1][2] is not None:
+                stack[-1][2] = max(stack[-1][2], peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            entry[1:] = [current, current]
+        self.set_stack(stack + (entry,))
+
+        wall_start = time.time()
+        cpu_start = cpu_time()
+        try:
+            yield
+        finally:
+            cpu = cpu_time() - cpu_start
+            wall = time.time() - wall_start
+            self.set_stack(stack)
+            peak = None
+            if memory:
+                _, highest = tracemalloc.get_traced_memory()
+                highest = max(highest, entry[2])
+                if stack and stack[-1][2] is not None:
+                    stack[-1][2] = max(stack[-1][2], highest)
+                peak = highest - entry[1]
+            self.record(name, wall, cpu, peak)
+
+    def current_stage(self):
+        """Return the name of the innermost stage of this thread or task."""
+        stack = self.stack()
+        return stack[-1][0] if stack else 'other'
+
+    def before_call(self, context, **kwargs):
+        """Start timing an AWS call, for the botocore 'before-call' event."""
+        context[CONTEXT_STAGE] = self.current_stage()
+        context[CONTEXT_START] = time.time()
+
+    def after_call(self, context, **kwargs):
+        """Record an AWS call, for the botocore 'after-call' event."""
+        start = context.pop(CONTEXT_START, None)
+        if start is not None:
+            self.record(context.pop(CONTEXT_STAGE) + AWS_CALLS,
+                        time.time() - start)
+
+    def summary(self):
+        """Return the measurements of every stage, slowest first.
+
+        Returns:
+            A list of lines of text.
+
+        """
+        lines = ['{:<60}{:>7}{:>10}{:>10}{:>12}'.format(
+            'Stage', 'Calls', 'Wall (s)', 'CPU (s)', 'Peak (KiB)')]
+        for name, stats in sorted(self.stages.items(),
+                                  key=lambda item: -item[1].wall):
+            lines.append('{:<60}{:>7}{:>10.3f}{:>10}{:>12}'.format(
+                name[:59], stats.calls, stats.wall,
+                '-' if name.endswith(AWS_CALLS) else '{:.3f}'.format(
+                    stats.cpu),
+                '-' if stats.peak is None else '{:.1f}'.format(
+                    stats.peak / 1024.0)))
+        return lines
+
+
+# the profiler of the run, if enabled
+profiler = None
+
+
+def enable(memory=True):
+    """Start profiling the stages of the run.
+
+    Args:
+        memory (Optional bool): Whether to trace memory allocations to
+            measure the peak memory of each stage.
+
+    Returns:
+        The `Profiler`.
+
+    """
+    global profiler
+    profiler = Profiler()
+    if memory and tracemalloc and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return profiler
+
+
+def disable():
+    """Stop profiling.
+
+    Returns:
+        The `Profiler` of the run, or None if profiling wasn't enabled.
+
+    """
+    global profiler
+    finished, profiler = profiler, None
+    if tracemalloc and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return finished
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Profile a block of code as a stage, if profiling is enabled.
+
+    Args:
+        name (str): The name of the stage, e.g. the account and service.
+
+    """
+    if profiler is None:
+        yield
+    else:
+        with profiler.stage(name):
+            yield
+
+
+def instrument_session(botocore_session):
+    """Time the AWS calls made by the clients of a botocore session.
+
+    Args:
+        botocore_session (:botocore:session.Session): The session.
+
+    """
+    if profiler is not None:
+        botocore_session.register('before-call', profiler.before_call)
+        botocore_session.register('after-call', profiler.after_call)
+
+
+@contextlib.contextmanager
+def profiled(output=None):
+    """Profile a run and print the summary of its stages when it ends.
+
+    Args:
+        output (Optional str): A filesystem location to also write the
+            cProfile statistics of the run to, for `pstats` or snakeviz.
+
+    """
+    enable()
+    function_profiler = None
+    if output:
+        function_profiler = cProfile.Profile()
+        function_profiler.enable()
+    try:
+        yield
+    finally:
+        if function_profiler:
+            function_profiler.disable()
+            function_profiler.dump_stats(output)
+        print('\n'.join(disable().summary()))
@@ -0,0 +1,154 @@
+"""Progressive output of the accounts as they are scanned.
+
+With --progress, the reconciled results of each account are printed as
+soon as the account is scanned, before the consolidated report of every
+account. An account's section only reconciles its instances with its own
+reservations; reservations shared across the accounts of an organization
+are only accounted for in the consolidated report.
+
+The `text` format prints a block per account, the `ndjson` format a JSON
+object per line: one per account, then the consolidated report.
+"""
+
+from __future__ import print_function
+
+import json
+import sys
+import threading
+import time
+
+import jinja2
+
+from check_reserved_instances.calculate import build_report
+from check_reserved_instances.coverage import cover_report
+
+FORMATS = ('text', 'ndjson')
+
+account_template = """
+{{ account['name'] }} ({{ account['region'] }}) scanned after {{ '%.1f'|format(elapsed) }}s
+{%- for failure in failures %}
+COULD NOT SCAN {{ failure['service'] }}: {{ failure['error'] }}
+{%- endfor %}
+{%- for service, diffs in report|dictsort %}
+{{ service }}: ({{ diffs['qty_running_instances'] }}) running, ({{ diffs['qty_reserved_instances'] }}) reserved
+  {%- for type, count in diffs['unused_reservations'].items() %}
+UNUSED RESERVATION!\t({{ count }})\t{{ type[0] }}\t{{ type[1] }}
+  {%- endfor %}
+  {%- for type, count in diffs['unreserved_instances'].items() %}
+NOT RESERVED!\t({{ count }})\t{{ type[0] }}\t{{ type[1] }}{% if instance_ids.get(type) %}\t{{ ", ".join(instance_ids[type]) }}{% endif %}
+  {%- endfor %}
+{%- endfor %}
+"""  # noqa
+
+
+def encode_entries(entries):
+    """Convert report entries by key to a list of JSON-compatible items."""
+    return [{'key': list(key), 'count': count}
+            for key, count in sorted(entries.items(), key=repr)]
+
+
+def build_payload(report, instance_ids, failures):
+    """Build the JSON-compatible payload of a report.
+
+    Args:
+        report (dict): The report, as returned by `build_report`.
+        instance_ids (dict): The instance IDs/names by key of the unreserved
+            instances, as returned by `flag_idle`.
+        failures (list): The units which could not be scanned.
+
+    Returns:
+        A dict of the report sections, the units not scanned and whether
+        the coverage is partial.
+
+    """
+    sections = {}
+    for service, diffs in report.items():
+        sections[service] = {
+            'unused_reservations': encode_entries(
+                diffs['unused_reservations']),
+            'unreserved_instances': [
+                dict(entry, instance_ids=instance_ids.get(
+                    tuple(entry['key']), []))
+                for entry in encode_entries(diffs['unreserved_instances'])],
+            'running_instances': diffs['qty_running_instances'],
+            'reserved_instances': diffs['qty_reserved_instances']
+        }
+    return {
+        'report': sections,
+        'failures': failures,
+        'partial': bool(failures)
+    }
+
+
+class ProgressPrinter(object):
+    """Print the section of each account once it is scanned."""
+
+    def __init__(self, output_format, stream=None):
+        """Initialize a printer.
+
+        Args:
+            output_format (str): One of `FORMATS`.
+            stream (Optional file): Where to print to. Defaults to stdout.
+
+        """
+        self.output_format = output_format
+        self.stream = stream
+        self.started_at = time.time()
+        # accounts may be scanned in concurrent threads
+        self.lock = threading.Lock()
+        self.template = None
+
+    def write(self, text):
+        """Print text and flush it, so it shows up right away."""
+        stream = self.stream or sys.stdout
+        with self.lock:
+            print(text, file=stream)
+            stream.flush()
+
+    def __call__(self, account, services, results, failures):
+        """Print the section of a scanned account.
+
+        Args:
+            account (dict): The AWS Account scanned.
+            services (list): (report section, results prefix) tuples of the
+                services collected.
+            results (dict): The results of the account.
+            failures (list): The units of the account which failed.
+
+        """
+        report = build_report(results, services)
+        instance_ids = cover_report(report, results, services)
+        elapsed = time.time() - self.started_at
+        if self.output_format == 'ndjson':
+            payload = build_payload(report, instance_ids, failures)
+            payload.update(type='account', account=account['name'],
+                           region=account['region'], elapsed=elapsed)
+            self.write(json.dumps(payload, sort_keys=True))
+            return
+        if self.template is None:
+            self.template = jinja2.Template(account_template)
+        self.write(self.template.render(
+            account=account, elapsed=elapsed, report=report,
+            instance_ids=instance_ids, failures=failures))
+
+    def summary(self, report, instance_ids, failures, costs=None):
+        """Print the consolidated report of every account as NDJSON.
+
+        Args:
+            report (dict): The report, as returned by `build_report`.
+            instance_ids (dict): The instance IDs/names by key of the
+                unreserved instances.
+            failures (list): The units which could not be scanned.
+            costs (Optional dict): The (hourly, monthly) costs by (report
+                section, key).
+
+        """
+        payload = build_payload(report, instance_ids, failures or [])
+        for (service, key), (hourly, monthly) in (costs or {}).items():
+            for kind in ('unused_reservations', 'unreserved_instances'):
+                for entry in payload['report'][service][kind]:
+                    if tuple(entry['key']) == key:
+                        entry.update(hourly_cost=hourly, monthly_cost=monthly)
+        payload.update(type='summary',
+                       elapsed=time.time() - self.started_at)
+        self.write(json.dumps(payload, sort_keys=True))
@@ -0,0 +1,438 @@
+"""Recommend EC2 reserved instance modifications covering more instances.
+
+Unused zonal or regional reservations can be modified to another
+availability zone of their region, split or merged into other sizes of
+their instance family (keeping the same normalized footprint), or
+converted to regional scope. Within each instance family and region, the
+unused reservations and unreserved instances form a transportation
+problem in normalized units, solved as a min-cost flow: the flow covers
+as many instances as possible, preferring resizing in the same zone over
+moving to another zone. A reservation only covers an instance its
+target configuration reserves whole, so the flow is rounded down to whole
+instances, the units carried over covering the instances it rounded away
+where one reservation group has enough of them left. Each reservation
+group covering an instance is one modification. Unused regional
+reservations then cover the instances left in their region: the report
+doesn't record the region of a regional reservation, so it is the region
+of the section given, or of its zones when they are all in one region.
+"""
+
+from collections import deque, OrderedDict
+
+# cost of covering an instance from a reservation of the same zone, or of
+# a regional reservation, and from another zone
+SAME_ZONE_COST = 1
+OTHER_ZONE_COST = 2
+# weight of the zone costs over filling smaller instances first, which
+# covers more instances when the reservations can't cover them all
+ZONE_COST_WEIGHT = 100
+
+# normalization factors in units of a nano instance (0.25), so they're all
+# integers; sizes Nxlarge are N times an xlarge
+SIZE_UNITS = {
+    'nano': 1,
+    'micro': 2,
+    'small': 4,
+    'medium': 8,
+    'large': 16,
+    'xlarge': 32
+}
+
+REGIONAL = 'All'
+# EC2 report sections whose keys are (instance type, availability zone)
+EC2_SECTIONS = ('EC2 Classic', 'EC2 VPC')
+
+
+def size_units(instance_type):
+    """Return the normalized units of an instance type, or None.
+
+    Args:
+        instance_type (str): The instance type, e.g. m5.2xlarge.
+
+    Returns:
+        The normalization factor in nano units, or None if the size can't be
+        modified (e.g. metal).
+
+    """
+    size = instance_type.split('.', 1)[-1]
+    if size in SIZE_UNITS:
+        return SIZE_UNITS[size]
+    if size.endswith('xlarge') and size[:-len('xlarge')].isdigit():
+        return int(size[:-len('xlarge')]) * SIZE_UNITS['xlarge']
+    return None
+
+
+def split_units(family, units):
+    """Express normalized units as instances of the sizes of a family.
+
+    Args:
+        family (str): The instance family, e.g. m5.
+        units (int): The normalized units.
+
+    Returns:
+        A list of (instance type, count) tuples, largest first.
+
+    """
+    instances = []
+    for size, size_unit in sorted(SIZE_UNITS.items(),
+                                  key=lambda item: -item[1]):
+        count, units = divmod(units, size_unit)
+        if count:
+            instances.append(('{}.{}'.format(family, size), count))
+    return instances
+
+
+def shortest_path(graph, source, sink):
+    """Find the cheapest path with capacity left in a residual graph.
+
+    Uses SPFA (queue-based Bellman-Ford), as residual edges have negative
+    costs.
+
+    Args:
+        graph (list): The edges leaving each node, as [to, capacity, cost,
+            reverse edge position] lists.
+        source (int): The start node.
+        sink (int): The end node.
+
+    Returns:
+        The path as a list of (node, edge position) tuples from the sink
+        back to the source, or None if the sink can't be reached.
+
+    """
+    distance = [None] * len(graph)
+    previous = [None] * len(graph)
+    distance[source] = 0
+    queue = deque([source])
+    queued = set([source])
+    while queue:
+        node = queue.popleft()
+        queued.discard(node)
+        for position, (end, capacity, edge_cost, _) in enumerate(
+                graph[node]):
+            if capacity > 0 and (distance[end] is None or
+                                 distance[node] + edge_cost < distance[end]):
+                distance[end] = distance[node] + edge_cost
+                previous[end] = (node, position)
+                if end not in queued:
+                    queue.append(end)
+                    queued.add(end)
+    if distance[sink] is None:
+        return None
+
+    path = []
+    node = sink
+    while node != source:
+        node, position = previous[node]
+        path.append((node, position))
+    return path
+
+
+def min_cost_flow(supplies, demands, cost):
+    """Solve a transportation problem as a min-cost max-flow.
+
+    Uses successive shortest paths from a source linked to every supply to
+    a sink linked from every demand.
+
+    Args:
+        supplies (dict): Units available by supply node.
+        demands (dict): Units wanted by demand node.
+        cost (callable): Function of a supply and a demand node returning
+            the cost per unit of the flow between them, or None if they
+            can't be linked.
+
+    Returns:
+        A dict of the units flowing by (supply, demand).
+
+    """
+    source, sink = 0, 1
+    nodes = [None, None] + list(supplies) + list(demands)
+    supply_nodes = range(2, 2 + len(supplies))
+    demand_nodes = range(2 + len(supplies), len(nodes))
+    graph = [[] for _ in nodes]
+
+    def add_edge(start, end, capacity, edge_cost):
+        graph[start].append([end, capacity, edge_cost, len(graph[end])])
+        graph[end].append([start, 0, -edge_cost, len(graph[start]) - 1])
+
+    for node in supply_nodes:
+        add_edge(source, node, supplies[nodes[node]], 0)
+    for node in demand_nodes:
+        add_edge(node, sink, demands[nodes[node]], 0)
+    for start in supply_nodes:
+        for end in demand_nodes:
+            edge_cost = cost(nodes[start], nodes[end])
+            if edge_cost is not None:
+                add_edge(start, end, supplies[nodes[start]], edge_cost)
+
+    path = shortest_path(graph, source, sink)
+    while path:
+        # augment along the path by its bottleneck capacity
+        flow = min(graph[node][position][1] for node, position in path)
+        for node, position in path:
+            edge = graph[node][position]
+            edge[1] -= flow
+            graph[edge[0]][edge[3]][1] += flow
+        path = shortest_path(graph, source, sink)
+
+    flows = {}
+    for start in supply_nodes:
+        for end, _, _, reverse in graph[start]:
+            if end in demand_nodes and graph[end][reverse][1] > 0:
+                flows[(nodes[start], nodes[end])] = graph[end][reverse][1]
+    return flows
+
+
+def link_cost(supply, demand):
+    """Return the cost per unit of covering a demand from a supply.
+
+    Args:
+        supply (tuple): The (instance type, availability zone) of unused
+            reservations.
+        demand (tuple): The (instance type, availability zone) of unreserved
+            instances.
+
+    Returns:
+        The cost, or None if the reservation can't be modified to cover the
+        instances.
+
+    """
+    # reservations stay in their region, the regional ones are only given
+    # the instances of their region by `recommend_section`
+    if region(supply) not in (None, region(demand)):
+        return None
+    zone_cost = OTHER_ZONE_COST
+    if supply[1] in (REGIONAL, demand[1]):
+        zone_cost = SAME_ZONE_COST
+    return zone_cost * ZONE_COST_WEIGHT + size_units(demand[0]).bit_length()
+
+
+def region(placement_key):
+    """Return the region of an EC2 key, or None for a regional one."""
+    zone = placement_key[1]
+    return None if zone == REGIONAL else zone[:-1]
+
+
+def target_configuration(supply, count, supply_targets):
+    """Return the target configurations of a modification.
+
+    Args:
+        supply (tuple): The key of the reservations modified.
+        count (int): How many of the reservations are modified.
+        supply_targets (list): (demand key, instance count) tuples of the
+            instances the reservations cover.
+
+    Returns:
+        A list of (instance type, zone, count) tuples, unique by instance
+        type and zone as ModifyReservedInstances requires.
+
+    """
+    family = supply[0].split('.', 1)[0]
+    counts = OrderedDict()
+
+    def add(instance_type, zone, instance_count):
+        counts[(instance_type, zone)] = counts.get(
+            (instance_type, zone), 0) + instance_count
+
+    for demand, instance_count in supply_targets:
+        add(demand[0], demand[1], instance_count)
+    # the rest of the reservations' footprint stays in their zone
+    for instance_type, instance_count in split_units(
+            family, count * size_units(supply[0]) - sum(
+                instance_count * size_units(demand[0])
+                for demand, instance_count in supply_targets)):
+        add(instance_type, supply[1], instance_count)
+    return [(instance_type, zone, instance_count)
+            for (instance_type, zone), instance_count in counts.items()]
+
+
+def whole_flows(flows, supplies):
+    """Round the flows of a transportation problem down to whole instances.
+
+    The units of a flow short of a whole instance are carried over: the
+    instances of a key the rounding left uncovered are covered whole by a
+    reservation group flowing to it with enough units left, the group with
+    the most units left first, and the units left otherwise stay with their
+    reservations.
+
+    Args:
+        flows (dict): The units flowing by (supply, demand) key, as returned
+            by `min_cost_flow`.
+        supplies (dict): The units of the unused reservations by key.
+
+    Returns:
+        A dict of the units flowing by (supply, demand) key, each a multiple
+        of the demand's units.
+
+    """
+    left = dict(supplies)
+    whole = {}
+    carried = {}
+    for (supply, demand), units in sorted(flows.items()):
+        units -= units % size_units(demand[0])
+        if units:
+            whole[(supply, demand)] = units
+            left[supply] -= units
+        carried.setdefault(demand, []).append(supply)
+    for demand, demand_supplies in sorted(carried.items()):
+        demand_unit = size_units(demand[0])
+        missing = (sum(flows[(supply, demand)] for supply in demand_supplies)
+                   - sum(whole.get((supply, demand), 0)
+                         for supply in demand_supplies)) // demand_unit
+        for supply in sorted(demand_supplies, key=lambda key: -left[key]):
+            units = min(missing, left[supply] // demand_unit) * demand_unit
+            if units:
+                whole[(supply, demand)] = whole.get(
+                    (supply, demand), 0) + units
+                left[supply] -= units
+                missing -= units // demand_unit
+    return whole
+
+
+def zones_region(diffs):
+    """Return the region of the zones of a section, if they share one."""
+    regions = set(region(key) for field in ('unused_reservations',
+                                            'unreserved_instances')
+                  for key in diffs[field])
+    regions.discard(None)
+    return regions.pop() if len(regions) == 1 else None
+
+
+def recommend_section(diffs, section_region=None):
+    """Recommend modifications for the unused reservations of one section.
+
+    Args:
+        diffs (dict): The output of `report_diffs` for an EC2 section.
+        section_region (Optional str): The region of the section's regional
+            reservations. Defaults to the region of its zones if they are
+            all in one region, otherwise the regional reservations aren't
+            modified.
+
+    Returns:
+        A tuple of the list of modification dicts (of the reservations'
+        type, zone, count, the (type, zone, count) target configuration and
+        whether to convert them to regional scope), and the number of
+        unreserved instances they cover.
+
+    """
+    if section_region is None:
+        section_region = zones_region(diffs)
+    # (supplies, demands) in normalized units by instance family and region,
+    # where the region of regional reservations is None
+    groups = {}
+    for field, position in (('unused_reservations', 0),
+                            ('unreserved_instances', 1)):
+        for key, count in diffs[field].items():
+            if size_units(key[0]):
+                group = groups.setdefault(
+                    (key[0].split('.', 1)[0], region(key)), ({}, {}))
+                group[position][key] = count * size_units(key[0])
+
+    # zonal reservations can only cover their region, so they are matched
+    # first, region by region, and regional reservations then cover the
+    # instances left in the section's region, which keeps each problem
+    # small
+    flows = {}
+    left = {}
+    for (family, key_region), (supplies, demands) in groups.items():
+        if key_region is not None:
+            if supplies and demands:
+                flows.update(whole_flows(
+                    min_cost_flow(supplies, demands, link_cost), supplies))
+            family_left = left.setdefault(family, {})
+            for demand, units in demands.items():
+                family_left[demand] = units - sum(
+                    flows.get((supply, demand), 0) for supply in supplies)
+    for (family, key_region), (supplies, _) in groups.items():
+        demands = dict((demand, units) for demand, units in
+                       left.get(family, {}).items()
+                       if units > 0 and region(demand) == section_region)
+        if key_region is None and demands:
+            flows.update(whole_flows(
+                min_cost_flow(supplies, demands, link_cost), supplies))
+
+    targets = {}
+    for (supply, demand), units in sorted(flows.items()):
+        targets.setdefault(supply, []).append(
+            (demand, units // size_units(demand[0])))
+
+    modifications = []
+    covered = 0
+    for supply, supply_targets in sorted(targets.items()):
+        covered += sum(count for _, count in supply_targets)
+        used = sum(count * size_units(demand[0])
+                   for demand, count in supply_targets)
+        count = -(-used // size_units(supply[0]))
+        configuration = target_configuration(
+            supply, count, supply_targets)
+
+        zones = set(zone for _, zone, _ in configuration)
+        modifications.append({
+            'instance_type': supply[0],
+            'zone': supply[1],
+            'count': count,
+            'configuration': configuration,
+            # one regional reservation covers every zone
+            'regional': (supply[1] != REGIONAL and len(zones) > 1 and all(
+                instance_type == supply[0]
+                for instance_type, _, _ in configuration))
+        })
+
+    return modifications, covered
+
+
+def recommend(report, report_region=None):
+    """Recommend modifications for the unused EC2 reservations of a report.
+
+    Args:
+        report (dict): The report, as returned by `build_report`.
+        report_region (Optional str): The region of the report's regional
+            reservations, see `recommend_section`.
+
+    Returns:
+        A dict of the `recommend_section` output by EC2 report section.
+
+    """
+    return dict((service, recommend_section(report[service], report_region))
+                for service in EC2_SECTIONS if service in report)
+
+
+def merge_recommendations(region_recommendations):
+    """Combine the recommendations of the reports of several regions.
+
+    Args:
+        region_recommendations (list): The `recommend` output of each
+            region.
+
+    Returns:
+        A dict of the modifications and instances covered in every region,
+        by EC2 report section.
+
+    """
+    merged = {}
+    for recommendations in region_recommendations:
+        for service, (modifications, covered) in recommendations.items():
+            merged_modifications, merged_covered = merged.get(
+                service, ([], 0))
+            merged[service] = (merged_modifications + modifications,
+                               merged_covered + covered)
+    return merged
+
+
+def format_recommendations(recommendations):
+    """Return the recommendations as lines of text."""
+    lines = []
+    for service, (modifications, covered) in sorted(
+            recommendations.items()):
+        lines.append('{}: {} modifications covering {} unreserved '
+                     'instances'.format(service, len(modifications), covered))
+        for modification in modifications:
+            source = '{count} {instance_type} ({zone})'.format(
+                **modification)
+            if modification['regional']:
+                lines.append('  CONVERT {} to regional scope'.format(source))
+                continue
+            lines.append('  MODIFY {} into {}'.format(source, ', '.join(
+                '{} {} ({})'.format(count, instance_type, zone)
+                for instance_type, zone, count in
+                modification['configuration'])))
+    return lines
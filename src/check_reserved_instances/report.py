@@ -5,33 +5,50 @@ from __future__ import print_function
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+import os
 import smtplib
 
 import jinja2
 
-import pkg_resources
+from check_reserved_instances.notify import open_notification_state
 
-from check_reserved_instances.aws import instance_ids, reserve_expiry
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'templates')
+HTML_TEMPLATE = 'html_template.html'
 
-TEMPLATE_DIR = pkg_resources.resource_filename(
-    'check_reserved_instances', 'templates')
+# templates compiled once per process, see get_template
+compiled_templates = {}
 
 text_template = """
 ##########################################################
 ####            Reserved Instances Report            #####
 ##########################################################
+{%- if failures %}
+
+PARTIAL COVERAGE! The following could not be scanned:
+{%- for failure in failures %}
+{{ failure['account'] }} ({{ failure['region'] }}) {{ failure['service'] }}: {{ failure['error'] }}
+{%- endfor %}
+{% endif %}
+{%- if changes %}
+
+CHANGES since the last report:
+{%- for change in changes %}
+{{ change['service'] }} {{ change['kind'] }}\t{{ change['key']|join('\t') }}\t({{ change['previous'] }} -> {{ change['current'] }})
+{%- endfor %}
+{% endif %}
 {% for service in report %}
 Below is the report on {{ service }} reserved instances:
     {%- if report[service]['unused_reservations'] -%}
       {%- for type, count in report[service]['unused_reservations'].items() %}
-UNUSED RESERVATION!\t({{ count }})\t{{ type[0] }}\t{{ type[1] }}{%- if reserve_expiry %}\tExpires in {{ reserve_expiry[type]|string }} days.{%- endif %}
+UNUSED RESERVATION!\t({{ count }})\t{{ type[0] }}\t{{ type[1] }}{%- if reserve_expiry %}\tExpires in {{ reserve_expiry[type]|string }} days.{%- endif %}{%- if costs and (service, type) in costs %}\t${{ '%.3f'|format(costs[(service, type)][0]) }}/hour, ${{ '%.2f'|format(costs[(service, type)][1]) }}/month{%- endif %}
       {%- endfor %}
     {%- else %}
 You have no unused {{ service }} reservations.
     {%- endif %}
     {%- if report[service]['unreserved_instances'] %}
       {%- for type, count in report[service]['unreserved_instances'].items() %}
-NOT RESERVED!\t({{ count }})\t{{ type[0] }}\t{{ type[1] }}{% if instance_ids %}\t{{ ", ".join(instance_ids[type]) }}{% endif %}
+NOT RESERVED!\t({{ count }})\t{{ type[0] }}\t{{ type[1] }}{% if instance_ids %}\t{{ ", ".join(instance_ids[type]) }}{% endif %}{%- if costs and (service, type) in costs %}\t${{ '%.3f'|format(costs[(service, type)][0]) }}/hour, ${{ '%.2f'|format(costs[(service, type)][1]) }}/month{%- endif %}
       {%- endfor %}
     {%- else %}
 You have no unreserved {{ service }} instances.
@@ -42,27 +59,77 @@ You have no unreserved {{ service }} instances.
 """  # noqa
 
 
-def report_results(config, results):
+def get_template(name):
+    """Return a compiled report template, compiling it on first use.
+
+    Args:
+        name (str): The name of a template in TEMPLATE_DIR, or 'text' for
+            the text report.
+
+    Returns:
+        The `jinja2.Template`.
+
+    """
+    if name not in compiled_templates:
+        if name == 'text':
+            template = jinja2.Template(text_template)
+        else:
+            template = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+                trim_blocks=True
+            ).get_template(name)
+        compiled_templates[name] = template
+    return compiled_templates[name]
+
+
+def report_results(config, results, instance_ids=None, reserve_expiry=None,
+                   failures=None, costs=None, echo=True):
     """Print results to stdout and email if configured.
 
     Args:
         config (dict): The application configuration.
         results (dict): The results to report.
+        instance_ids (Optional dict): Instance IDs/names by key, to report
+            with unreserved instances.
+        reserve_expiry (Optional dict): Days until expiry by key, to report
+            with unused reservations.
+        failures (Optional list): The units which could not be scanned, to
+            report the coverage as partial.
+        costs (Optional dict): The (hourly, monthly) costs by (report
+            section, key), to report with unused reservations and unreserved
+            instances.
+        echo (Optional bool): Whether to print the report and what is done
+            with it, besides emailing it.
 
     """
-    report_text = jinja2.Template(text_template).render(
+    def echo_line(text):
+        if echo:
+            print(text)
+
+    # with a [Notification] section, only report changed results
+    notification_state = open_notification_state(config)
+    changes = None
+    if notification_state:
+        changes = notification_state.changes(results, failures)
+        if changes is None:
+            echo_line('The report is unchanged since the last one sent, not '
+                      'reporting it')
+            return
+    changed_keys = set((change['service'], change['kind'], change['key'])
+                       for change in changes or [])
+
+    report_text = get_template('text').render(
         report=results, instance_ids=instance_ids,
-        reserve_expiry=reserve_expiry)
+        reserve_expiry=reserve_expiry, failures=failures, changes=changes,
+        costs=costs)
 
-    print(report_text)
+    echo_line(report_text)
 
     if config.get('Email'):
-        report_html = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
-            trim_blocks=True
-        ).get_template('html_template.html').render(
+        report_html = get_template(HTML_TEMPLATE).render(
             report=results, instance_ids=instance_ids,
-            reserve_expiry=reserve_expiry)
+            reserve_expiry=reserve_expiry, failures=failures,
+            changes=changes, changed_keys=changed_keys, costs=costs)
 
         email_config = config['Email']
         smtp_recipients = email_config['smtp_recipients']
@@ -73,9 +140,11 @@ def report_results(config, results):
         smtp_password = email_config['smtp_password']
         smtp_tls = bool(email_config['smtp_tls'])
 
-        print('\nSending emails to {}'.format(smtp_recipients))
+        echo_line('\nSending emails to {}'.format(smtp_recipients))
         mailmsg = MIMEMultipart('alternative')
         mailmsg['Subject'] = 'Reserved Instance Report'
+        if changes:
+            mailmsg['Subject'] += ' ({} changes)'.format(len(changes))
         mailmsg['To'] = smtp_recipients
         mailmsg['From'] = smtp_sendas
         email_text = MIMEText(report_text, 'plain')
@@ -91,4 +160,7 @@ def report_results(config, results):
         smtp.sendmail(smtp_sendas, smtp_recipients, mailmsg)
         smtp.quit()
     else:
-        print('\nNot sending email for this report')
+        echo_line('\nNot sending email for this report')
+
+    if notification_state:
+        notification_state.save(results, failures)
@@ -0,0 +1,68 @@
+"""Build the report of the results, then print and email it.
+
+Shared by the command line interface and the Lambda handler, without
+importing click or the modules of the other commands.
+"""
+
+from check_reserved_instances.calculate import build_report
+from check_reserved_instances.coverage import cover_report
+from check_reserved_instances.pricing import price_report
+from check_reserved_instances.profiling import stage
+from check_reserved_instances.report import report_results
+from check_reserved_instances.tracing import span
+from check_reserved_instances.utilization import flag_idle
+
+
+def assemble_report(current_config, results, services):
+    """Build the report of the results.
+
+    Args:
+        current_config (dict): The application configuration.
+        results (dict): The results of every account.
+        services (list): (report section, results prefix) tuples of the
+            services in the results.
+
+    Returns:
+        A (report, instance IDs) tuple: the report of `build_report` with
+        the unreserved instances left uncovered by the reservations, and
+        the instance IDs/names by key of the unreserved instances, flagged
+        if idle.
+
+    """
+    with stage('report_diffs'), span('report_diffs'):
+        report = build_report(results, services)
+        instance_ids = flag_idle(
+            current_config, report, results,
+            cover_report(report, results, services, labels=False))
+    return report, instance_ids
+
+
+def send_report(current_config, results, services, failures=None,
+                printer=None):
+    """Build the report of the results, then print and email it.
+
+    Args:
+        current_config (dict): The application configuration.
+        results (dict): The results of every account.
+        services (list): (report section, results prefix) tuples of the
+            services in the results.
+        failures (Optional list): The units which could not be scanned.
+        printer (Optional ProgressPrinter): The printer of the accounts.
+            In the NDJSON format, the report is printed as its last line
+            instead of as text.
+
+    Returns:
+        The (report, instance IDs) tuple of `assemble_report`.
+
+    """
+    report, instance_ids = assemble_report(current_config, results, services)
+    with stage('pricing'), span('pricing'):
+        costs = price_report(current_config, report)
+    ndjson = printer is not None and printer.output_format == 'ndjson'
+    if ndjson:
+        printer.summary(report, instance_ids, failures, costs)
+    with stage('report_results'), span('report_results'):
+        report_results(current_config, report, instance_ids,
+                       results['reserve_expiry'], failures, costs,
+                       echo=not ndjson)
+    return report, instance_ids
@@ -0,0 +1,569 @@
+"""Scan the configured AWS accounts with the enabled collectors."""
+
+from collections import OrderedDict
+from concurrent.futures import as_completed, Future, ProcessPoolExecutor
+import threading
+import time
+import zlib
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from check_reserved_instances import profiling
+from check_reserved_instances.aws import (
+    apply_client_settings, client_settings, create_boto_session,
+    deadline_passed, DeadlineExceeded, get_account_id)
+from check_reserved_instances.calculate import merge_results, new_results
+from check_reserved_instances.checkpoint import (
+    open_checkpoints, retry_settings, unit_name)
+from check_reserved_instances.collectors import (
+    enabled_collectors, load_entry_points, report_sections)
+from check_reserved_instances.organizations import discover_accounts
+from check_reserved_instances.profiling import stage
+from check_reserved_instances.tracing import set_attributes, span
+from check_reserved_instances.utilization import sample_utilization
+
+# errors after which a unit is reported as not scanned
+UNIT_ERRORS = (BotoCoreError, ClientError)
+# codes of the errors after which a unit is retried, as are 5xx errors:
+# throttling and expired credentials or requests
+RETRYABLE_CODES = frozenset([
+    'Throttling', 'ThrottlingException', 'ThrottledException',
+    'RequestThrottled', 'RequestThrottledException', 'RequestLimitExceeded',
+    'TooManyRequestsException', 'SlowDown', 'ExpiredToken',
+    'ExpiredTokenException', 'RequestExpired'])
+
+ENGINES = ('serial', 'process', 'async')
+# how the accounts are scanned, see set_engine
+engine = 'serial'
+engine_workers = None
+
+
+def set_engine(name, workers=None):
+    """Set how the accounts are scanned.
+
+    Args:
+        name (str): 'serial' to scan the accounts one after the other,
+            'process' to scan them in a pool of worker processes, or 'async'
+            to scan them all at once on an event loop, see `aio`.
+        workers (Optional int): How many worker processes to use, defaulting
+            to the number of processors, or with 'async', how many calls may
+            be in flight per endpoint of each account.
+
+    """
+    global engine, engine_workers
+    engine = name
+    engine_workers = workers
+
+
+def in_shard(account, shard):
+    """Check whether an account belongs to a shard.
+
+    Accounts are assigned to shards by a hash of their name and region, so
+    every host computes the same partition.
+
+    Args:
+        account (dict): The AWS Account.
+        shard (tuple): The (index, count) of the shard, where index starts
+            at 1.
+
+    Returns:
+        Whether the shard should scan the account.
+
+    """
+    index, count = shard
+    identity = u'{}|{}'.format(account['name'], account['region'])
+    return (zlib.crc32(identity.encode('utf-8')) & 0xffffffff) % count == (
+        index - 1)
+
+
+def get_accounts(config, shard=None):
+    """Return the AWS Accounts to scan.
+
+    Args:
+        config (dict): The application configuration.
+        shard (Optional tuple): The (index, count) of the shard to return the
+            accounts of. Defaults to all accounts.
+
+    Returns:
+        The accounts of the [AWS ] sections, followed by the accounts
+        discovered from the [Organization] section if configured.
+
+    """
+    def selected(account):
+        return not shard or in_shard(account, shard)
+
+    accounts = [account for account in config['Accounts']
+                if selected(account)]
+    if config.get('Organization'):
+        with stage('discover organization accounts'):
+            accounts = accounts + discover_accounts(
+                config['Organization'], selected)
+    return accounts
+
+
+def retryable_error(error):
+    """Return whether a unit failing with an error is worth retrying.
+
+    Only throttling, expired credentials or requests and server errors are
+    transient. Other errors, e.g. AccessDenied, would fail again.
+
+    Args:
+        error (Exception): One of the `UNIT_ERRORS`.
+
+    Returns:
+        Whether to retry the unit.
+
+    """
+    if not isinstance(error, ClientError):
+        return False
+    status = error.response.get('ResponseMetadata', {}).get(
+        'HTTPStatusCode') or 0
+    return (error.response.get('Error', {}).get('Code') in RETRYABLE_CODES or
+            status >= 500)
+
+
+def collect_unit(get_session, collector, services, max_attempts,
+                 retry_delay, counts_only=False):
+    """Collect one service of an account, retrying on transient AWS errors.
+
+    Args:
+        get_session (callable): Function returning the account's boto3
+            session.
+        collector (Collector): The collector of the service.
+        services (list): (report section, results prefix) tuples of the
+            services to collect.
+        max_attempts (int): How many times to try before giving up.
+        retry_delay (float): Seconds to wait before the first retry, doubled
+            for each further retry.
+        counts_only (Optional bool): Whether to only count the instances, see
+            `new_results`.
+
+    Returns:
+        The results dictionary of the service.
+
+    """
+    for attempt in range(1, max_attempts + 1):
+        set_attributes(attempts=attempt)
+        try:
+            return collector.collect(
+                get_session(), new_results(services, counts_only))
+        except UNIT_ERRORS as error:
+            if (attempt >= max_attempts or deadline_passed() or
+                    not retryable_error(error)):
+                raise
+            time.sleep(retry_delay * 2 ** (attempt - 1))
+
+
+class SingleFlight(object):
+    """Run each call once per key, sharing its outcome with the callers."""
+
+    def __init__(self):
+        """Initialize with no calls made."""
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function):
+        """Call a function, unless a call of the same key was made.
+
+        Callers of a key whose call is still running wait for its outcome.
+
+        Args:
+            key: The key of the call.
+            function (callable): The function to call.
+
+        Returns:
+            A tuple of the result of the call, and whether it was made by
+            another caller.
+
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            shared = future is not None
+            if not shared:
+                future = self.calls[key] = Future()
+        if not shared:
+            try:
+                future.set_result(function())
+            except Exception as error:
+                future.set_exception(error)
+        return future.result(), shared
+
+
+def unit_failure(account, collector, error):
+    """Describe a unit which could not be scanned.
+
+    Args:
+        account (dict): The AWS Account being scanned.
+        collector (Collector): The collector of the service.
+        error (Exception): Why the unit failed.
+
+    Returns:
+        A dict of the account name, region, service and error.
+
+    """
+    return {
+        'account': account['name'],
+        'region': account['region'],
+        'service': collector.name,
+        'error': str(error)
+    }
+
+
+def load_unit(account, collector, get_session, services, checkpoints,
+              resume, max_attempts, retry_delay, counts_only):
+    """Load a unit from its checkpoint, or collect it.
+
+    Args:
+        account (dict): The AWS Account being scanned.
+        collector (Collector): The collector of the service.
+        get_session (callable): Function returning the account's boto3
+            session.
+        services (list): (report section, results prefix) tuples of the
+            services to collect.
+        checkpoints (CheckpointStore): Where to record the results of the
+            unit, or None.
+        resume (bool): Whether to reuse the recent results of the unit.
+        max_attempts (int): How many times to try the unit.
+        retry_delay (float): Seconds to wait before the first retry.
+        counts_only (bool): Whether to only count the instances.
+
+    Returns:
+        A tuple of the results dictionary of the unit, and None, or of None
+        and the failure dict of its account name, region, service and error.
+
+    """
+    unit = unit_name(account, collector)
+    partial = checkpoints.load(unit) if checkpoints and resume else None
+    if partial is not None:
+        return partial, None
+    try:
+        if deadline_passed():
+            raise DeadlineExceeded('Run deadline exceeded')
+        with stage(u'collect {} ({}) {}'.format(
+                account['name'], account['region'], collector.name)):
+            with span(u'collect {}'.format(collector.name),
+                      account=account['name'], region=account['region'],
+                      service=collector.name):
+                partial = collect_unit(
+                    get_session, collector, services, max_attempts,
+                    retry_delay, counts_only)
+    except UNIT_ERRORS + (DeadlineExceeded,) as error:
+        return None, unit_failure(account, collector, error)
+    if checkpoints:
+        checkpoints.save(unit, partial, services)
+    return partial, None
+
+
+def scan_account(account, services, checkpoints=None, resume=False,
+                 max_attempts=1, retry_delay=0, counts_only=False,
+                 flights=None, utilization=None):
+    """Collect the running/reserved instances of one account.
+
+    Each service (unit) is collected separately, so a failing service
+    doesn't prevent the others from being reported.
+
+    Args:
+        account (dict): The AWS Account to scan.
+        services (list): (report section, results prefix) tuples of the
+            services to collect.
+        checkpoints (Optional CheckpointStore): Where to record the results
+            of each unit.
+        resume (Optional bool): Whether to reuse the recent results of units
+            from `checkpoints` instead of collecting them again.
+        max_attempts (Optional int): How many times to try each unit.
+        retry_delay (Optional float): Seconds to wait before the first retry.
+        counts_only (Optional bool): Whether to only count the instances, see
+            `new_results`.
+        flights (Optional SingleFlight): The units of every account by AWS
+            account ID, region and service, so a unit of an account also
+            listed in another section is only collected and counted once.
+        utilization (Optional dict): The [Utilization] configuration, to
+            sample the CPU utilization of the running instances collected.
+
+    Returns:
+        A tuple of the results dictionary of the account, and a list of the
+        units which failed as dicts of their account name, region, service
+        and error.
+
+    """
+    results = new_results(services, counts_only)
+    failures = []
+    # the session is only created once a unit needs to be collected
+    session = []
+
+    def get_session():
+        if not session:
+            with stage(u'session {name} ({region})'.format(**account)):
+                with span('create_boto_session', account=account['name'],
+                          region=account['region']):
+                    session.append(create_boto_session(account))
+        return session[0]
+
+    unit_options = (get_session, services, checkpoints, resume, max_attempts,
+                    retry_delay, counts_only)
+    account_id = None
+    if flights:
+        try:
+            account_id = get_account_id(account, get_session)
+        except UNIT_ERRORS + (DeadlineExceeded,):
+            # the units are collected without coalescing them
+            pass
+
+    for collector in enabled_collectors(account):
+        if account_id is None:
+            partial, failure = load_unit(account, collector, *unit_options)
+        else:
+            (partial, failure), shared = flights.do(
+                (account_id, account['region'], collector.name),
+                lambda: load_unit(account, collector, *unit_options))
+            if shared:
+                # counted (or reported as failed) with the other section
+                continue
+        if failure:
+            failures.append(failure)
+        else:
+            merge_results(results, partial)
+
+    if utilization and results.get('instances'):
+        try:
+            with span('sample utilization', account=account['name'],
+                      region=account['region']):
+                sample_utilization(get_session(), results, utilization)
+        except UNIT_ERRORS + (DeadlineExceeded,):
+            # the instances are reported without their utilization
+            pass
+
+    return results, failures
+
+
+def overlapping_regions(accounts):
+    """Return the regions of more than one account section.
+
+    Only the sections of those regions could connect to the same AWS
+    account and region as another section.
+
+    """
+    regions = [account['region'] for account in accounts]
+    return set(region for region in regions if regions.count(region) > 1)
+
+
+def scan_accounts(accounts, services, progress=None, **options):
+    """Collect the running/reserved instances of every account.
+
+    Sections connecting to the same AWS account and region, e.g. with the
+    credentials of different users or under different names, share the
+    collection of their units, which are counted once.
+
+    Args:
+        accounts (list): The AWS Accounts to scan.
+        services (list): (report section, results prefix) tuples of the
+            services to collect.
+        progress (Optional callable): Function called with each account,
+            the services, and the results and failed units of the account,
+            once it is scanned, see `progress.ProgressPrinter`.
+        **options: Checkpoint, retry, counts_only and utilization options
+            passed to `scan_account`.
+
+    Returns:
+        A tuple of the results for all accounts, a list of (account name,
+        results dict) tuples for each account, and the list of failed units.
+
+    """
+    # global results for all accounts
+    results = new_results(services, options.get('counts_only', False))
+    account_results = []
+    failures = []
+    flights = SingleFlight()
+    overlapping = overlapping_regions(accounts)
+
+    for account in accounts:
+        partial, account_failures = scan_account(
+            account, services,
+            flights=flights if account['region'] in overlapping else None,
+            **options)
+        merge_results(results, partial)
+        account_results.append((account['name'], partial))
+        failures.extend(account_failures)
+        if progress:
+            progress(account, services, partial, account_failures)
+
+    return results, account_results, failures
+
+
+def plan_tasks(accounts):
+    """Group the accounts into the tasks of the worker processes.
+
+    The sections of the same AWS account and region are in the same task,
+    so they are still coalesced (see `scan_accounts`), and every other
+    section is a task of its own.
+
+    Args:
+        accounts (list): The AWS Accounts to scan.
+
+    Returns:
+        A list of the tasks, as lists of (position, account) tuples.
+
+    """
+    overlapping = overlapping_regions(accounts)
+    tasks = OrderedDict()
+    for position, account in enumerate(accounts):
+        key = position
+        if account['region'] in overlapping:
+            try:
+                key = (get_account_id(
+                    account, lambda: create_boto_session(account)),
+                    account['region'])
+            except UNIT_ERRORS + (DeadlineExceeded,):
+                pass
+        tasks.setdefault(key, []).append((position, account))
+    return list(tasks.values())
+
+
+def scan_task(task):
+    """Scan the accounts of a task in a worker process.
+
+    Args:
+        task (tuple): The accounts, the services to collect, the client
+            settings of the parent process, the `scan_account` options and
+            whether the parent process is profiled.
+
+    Returns:
+        A tuple of the output of `scan_accounts`, which is already
+        aggregated by placement key, so only counts, IDs and expiries are
+        sent back to the parent process, and the profiled stages of the
+        task, or None.
+
+    """
+    accounts, services, settings, options, profile = task
+    apply_client_settings(settings)
+    load_entry_points()
+    if not profile:
+        return scan_accounts(accounts, services, **options), None
+    profiling.enable()
+    try:
+        output = scan_accounts(accounts, services, **options)
+    finally:
+        stages = profiling.disable().stages
+    return output, stages
+
+
+def scan_accounts_in_processes(accounts, services, workers=None,
+                               progress=None, **options):
+    """Collect the running/reserved instances in worker processes.
+
+    The AWS responses are parsed and aggregated in the worker processes,
+    so the scan isn't bound by one processor, and the results are merged
+    in this process.
+
+    Args:
+        accounts (list): The AWS Accounts to scan.
+        services (list): (report section, results prefix) tuples of the
+            services to collect.
+        workers (Optional int): How many worker processes to use.
+        progress (Optional callable): See `scan_accounts`, called with the
+            accounts of each task as it completes.
+        **options: Options passed to `scan_account`.
+
+    Returns:
+        The output of `scan_accounts`, in the order of the accounts.
+
+    """
+    tasks = plan_tasks(accounts)
+    settings = client_settings()
+    profiler = profiling.profiler
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(scan_task, (
+            [account for _, account in task], services, settings, options,
+            profiler is not None))
+            for task in tasks]
+        if progress:
+            for future in as_completed(futures):
+                task = tasks[futures.index(future)]
+                (_, task_account_results, task_failures), _ = (
+                    future.result())
+                for (_, account), (_, partial) in zip(
+                        task, task_account_results):
+                    progress(account, services, partial, [
+                        failure for failure in task_failures
+                        if failure['account'] == account['name'] and
+                        failure['region'] == account['region']])
+        outputs = []
+        for future in futures:
+            output, stages = future.result()
+            if stages:
+                profiler.merge(stages)
+            outputs.append(output)
+    finally:
+        executor.shutdown()
+
+    results = new_results(services, options.get('counts_only', False))
+    account_results = []
+    failures = []
+    for task, (partial, task_account_results, task_failures) in zip(
+            tasks, outputs):
+        merge_results(results, partial)
+        account_results.extend(zip(
+            [position for position, _ in task], task_account_results))
+        failures.extend(task_failures)
+    account_results.sort(key=lambda item: item[0])
+    return (results, [item for _, item in account_results], failures)
+
+
+def scan(config, shard=None, resume=False, counts_only=False,
+         progress=None, accounts=None):
+    """Scan every account of the configuration, with the engine set.
+
+    Args:
+        config (dict): The application configuration.
+        shard (Optional tuple): The (index, count) of the shard to scan the
+            accounts of. Defaults to all accounts.
+        resume (Optional bool): Whether to reuse recent checkpoints. The
+            checkpoints of the units scanned are deleted once a run has no
+            failed units.
+        counts_only (Optional bool): Whether to only count the instances, for
+            the monitoring check. Checkpoints are neither read nor written,
+            since they would lack the instance IDs of a full report.
+        progress (Optional callable): Function called with each account
+            once it is scanned, see `scan_accounts`.
+        accounts (Optional list): The AWS Accounts to scan instead of those
+            of the configuration, see `batch`.
+
+    Returns:
+        A tuple of the results for all accounts, the (report section,
+        results prefix) tuples of the services collected, a list of
+        (account name, results dict) tuples for each account, and a list of
+        the units which could not be scanned.
+
+    """
+    if accounts is None:
+        accounts = get_accounts(config, shard)
+    services = report_sections(accounts)
+    max_attempts, retry_delay = retry_settings(config)
+    checkpoints = None if counts_only else open_checkpoints(config)
+    options = {
+        'checkpoints': checkpoints,
+        'resume': resume,
+        'max_attempts': max_attempts,
+        'retry_delay': retry_delay,
+        'counts_only': counts_only
+    }
+    if config.get('Utilization') and not counts_only:
+        options['utilization'] = config['Utilization']
+    if engine == 'process':
+        results, account_results, failures = scan_accounts_in_processes(
+            accounts, services, engine_workers, progress, **options)
+    elif engine == 'async':
+        # Python 3 only, imported when selected
+        from check_reserved_instances.aio import scan_accounts_async
+        results, account_results, failures = scan_accounts_async(
+            accounts, services, engine_workers, progress, **options)
+    else:
+        results, account_results, failures = scan_accounts(
+            accounts, services, progress, **options)
+    if checkpoints and not failures:
+        # the run completed, a rerun scans every unit again
+        checkpoints.remove([unit_name(account, collector)
+                            for account in accounts
+                            for collector in enabled_collectors(account)])
+    return results, services, account_results, failures
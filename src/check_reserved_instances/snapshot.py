@@ -0,0 +1,178 @@
+"""Save and load results to and from snapshot files.
+
+Snapshots are JSON documents, gzip compressed when the file name ends with
+`.gz`. Results are keyed by tuples, which are stored as lists of [key,
+value] pairs.
+"""
+
+import gzip
+import io
+import json
+import os
+import time
+
+from check_reserved_instances.calculate import (
+    merge_results, new_results, RESULTS_INDEXES, RESULTS_LISTS)
+
+SNAPSHOT_VERSION = 1
+
+
+def encode_results(results):
+    """Convert a results dictionary to JSON-compatible types.
+
+    Args:
+        results (dict): The results dictionary.
+
+    Returns:
+        A dict of the results entries.
+
+    """
+    encoded = {}
+    for name, values in results.items():
+        if name in RESULTS_INDEXES:
+            encoded[name] = dict(
+                (record_id, [record[0], list(record[1])] + list(record[2:]))
+                for record_id, record in values.items())
+        else:
+            encoded[name] = [[list(placement_key), value]
+                             for placement_key, value in values.items()]
+    return encoded
+
+
+def decode_results(encoded):
+    """Convert the output of `encode_results` back to a results dictionary.
+
+    Args:
+        encoded (dict): The encoded results.
+
+    Returns:
+        The results dictionary.
+
+    """
+    results = {}
+    for name, values in encoded.items():
+        if name in RESULTS_INDEXES:
+            results[name] = dict(
+                (record_id, (record[0], tuple(record[1])) + tuple(record[2:]))
+                for record_id, record in values.items())
+        else:
+            results[name] = dict((tuple(placement_key), value)
+                                 for placement_key, value in values)
+    return results
+
+
+def open_snapshot(path, mode):
+    """Open a snapshot file for text reading or writing."""
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, mode + 'b'), encoding='utf-8')
+    return io.open(path, mode, encoding='utf-8')
+
+
+def dump_snapshot(path, results, services, **metadata):
+    """Write results to a snapshot file.
+
+    The file is replaced atomically, so readers never see a partial file.
+
+    Args:
+        path (str): A filesystem location to write the snapshot to.
+        results (dict): The results dictionary.
+        services (list): (report section, results prefix) tuples of the
+            services in the results.
+        **metadata: Additional JSON-compatible values to store.
+
+    """
+    snapshot = dict(metadata)
+    snapshot.update({
+        'version': SNAPSHOT_VERSION,
+        'taken_at': int(time.time()),
+        'services': [list(service) for service in services],
+        'results': encode_results(results)
+    })
+
+    # keep the extension, which decides the compression
+    directory, filename = os.path.split(path)
+    temporary_path = os.path.join(
+        directory, '.{}.{}'.format(os.getpid(), filename))
+    with open_snapshot(temporary_path, 'w') as snapshot_file:
+        snapshot_file.write(json.dumps(snapshot, separators=(',', ':')))
+    getattr(os, 'replace', os.rename)(temporary_path, path)
+
+
+def load_snapshot(path):
+    """Read results from a snapshot file.
+
+    Args:
+        path (str): A filesystem location to read the snapshot from.
+
+    Returns:
+        The snapshot dict, with its 'results' decoded and 'services' as a
+        list of tuples.
+
+    """
+    with open_snapshot(path, 'r') as snapshot_file:
+        snapshot = json.loads(snapshot_file.read())
+
+    snapshot['services'] = [tuple(service)
+                            for service in snapshot['services']]
+    snapshot['results'] = decode_results(snapshot['results'])
+    return snapshot
+
+
+def dump_partial(path, results, services, account_results, shard,
+                 failures=None):
+    """Write the results of one shard to a partial results file.
+
+    Besides the results, the counts of each account are kept for the
+    history database.
+
+    Args:
+        path (str): A filesystem location to write the file to.
+        results (dict): The results of the shard.
+        services (list): (report section, results prefix) tuples of the
+            services in the results.
+        account_results (list): (account name, results dict) tuples, one for
+            each account scanned by the shard.
+        shard (tuple): The (index, count) of the shard.
+        failures (Optional list): The units the shard failed to scan.
+
+    """
+    accounts = []
+    for name, account in account_results:
+        counts = dict((entry, values) for entry, values in account.items()
+                      if entry not in RESULTS_LISTS + RESULTS_INDEXES)
+        accounts.append([name, encode_results(counts)])
+    dump_snapshot(path, results, services, shard=list(shard),
+                  accounts=accounts, failures=failures or [])
+
+
+def load_partials(paths):
+    """Combine the partial results files of shards.
+
+    Args:
+        paths (list): Filesystem locations of the files to combine.
+
+    Returns:
+        A tuple of the combined results, the (report section, results
+        prefix) tuples of the services in them, the (account name, results
+        dict) tuples of every account, the (index, count) tuples of the
+        shards combined and the units the shards failed to scan.
+
+    """
+    snapshots = [load_snapshot(path) for path in paths]
+    services = sorted(set(service for snapshot in snapshots
+                          for service in snapshot['services']))
+
+    results = new_results(services)
+    account_results = []
+    shards = []
+    failures = []
+    for snapshot in snapshots:
+        merge_results(results, snapshot['results'])
+        account_results.extend(
+            (name, decode_results(counts))
+            for name, counts in snapshot.get('accounts', []))
+        if snapshot.get('shard'):
+            shards.append(tuple(snapshot['shard']))
+        failures.extend(snapshot.get('failures', []))
+
+    return results, services, account_results, shards, failures
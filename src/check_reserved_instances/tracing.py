@@ -0,0 +1,351 @@
+"""OpenTelemetry-compatible trace spans of the accounts, services and calls.
+
+Spans are opened with the `span` context manager, which does nothing unless
+tracing was enabled with `enable`. The AWS calls of every session (each
+paginator page is one call) are traced from botocore events. Once the run
+ends, the spans are exported in the OTLP/HTTP JSON format, either posted to
+an OTLP collector, e.g. http://localhost:4318/v1/traces, or written to a
+file.
+"""
+
+from __future__ import print_function
+
+import contextlib
+import io
+import json
+import os
+import threading
+import time
+
+try:
+    from urllib.request import Request, urlopen
+except ImportError:  # pragma: no cover
+    # Python 2
+    from urllib2 import Request, urlopen
+
+SERVICE_NAME = 'check-reserved-instances'
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+# key of the span of an AWS call in the botocore request context
+CONTEXT_SPAN = 'check_reserved_instances_span'
+
+EXPORT_TIMEOUT = 10
+
+
+def random_id(size):
+    """Return a random trace or span ID of `size` bytes, hex encoded."""
+    return ''.join('{:02x}'.format(byte) for byte in bytearray(
+        os.urandom(size)))
+
+
+def encode_value(value):
+    """Encode an attribute value as an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        # 64-bit integers are strings in the JSON encoding
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': u'{}'.format(value)}
+
+
+class Span(object):
+    """A timed operation of the run."""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None,
+                 kind=SPAN_KIND_INTERNAL):
+        """Start a span.
+
+        Args:
+            name (str): The name of the operation.
+            trace_id (str): The ID of the trace of the run.
+            parent_id (Optional str): The ID of the enclosing span.
+            attributes (Optional dict): The attributes of the span.
+            kind (Optional int): The OTLP span kind.
+
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random_id(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.kind = kind
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    def set_attributes(self, **attributes):
+        """Add attributes to the span."""
+        self.attributes.update(attributes)
+
+    def finish(self, error=None):
+        """End the span, failed with `error` if any."""
+        self.end = time.time()
+        if error is not None:
+            self.error = u'{}'.format(error) or type(error).__name__
+
+    def encode(self):
+        """Return the span in the OTLP JSON format."""
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(int(self.start * 1e9)),
+            'endTimeUnixNano': str(int((self.end or self.start) * 1e9)),
+            'attributes': [{'key': key, 'value': encode_value(value)}
+                           for key, value in sorted(self.attributes.items())
+                           if value is not None],
+            'status': {}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.error is not None:
+            span['status'] = {'code': STATUS_ERROR, 'message': self.error}
+        return span
+
+
+class Tracer(object):
+    """Collector of the spans of one trace."""
+
+    def __init__(self):
+        """Initialize a tracer with a new trace and no spans."""
+        self.trace_id = random_id(16)
+        self.spans = []
+        self.lock = threading.Lock()
+        # the stack of the spans open in each thread
+        self.local = threading.local()
+
+    def stack(self):
+        """Return the stack of the spans open in this thread."""
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def current_span(self):
+        """Return the innermost span open in this thread, or None."""
+        stack = self.stack()
+        return stack[-1] if stack else None
+
+    def start_span(self, name, attributes=None, kind=SPAN_KIND_INTERNAL,
+                   parent=None):
+        """Start a span, child of `parent` or of the current span.
+
+        The span is not made the current span, see `span`.
+
+        """
+        parent = parent or self.current_span()
+        span = Span(name, self.trace_id, parent and parent.span_id,
+                    attributes, kind)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name, attributes=None):
+        """Trace a block of code as the current span."""
+        span = self.start_span(name, attributes)
+        stack = self.stack()
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.finish(error)
+            raise
+        else:
+            span.finish()
+        finally:
+            stack.pop()
+
+    @contextlib.contextmanager
+    def attach(self, span):
+        """Make a span of another thread the current span of this one."""
+        stack = self.stack()
+        if span is not None:
+            stack.append(span)
+        try:
+            yield
+        finally:
+            if span is not None:
+                stack.pop()
+
+    def before_call(self, model, context, **kwargs):
+        """Start the span of an AWS call, for the 'before-call' event."""
+        parent = self.current_span()
+        context[CONTEXT_SPAN] = self.start_span(
+            model.name, {
+                'account': parent and parent.attributes.get('account'),
+                'service': model.service_model.service_name,
+                'operation': model.name,
+                'region': context.get('client_region')
+            }, SPAN_KIND_CLIENT)
+
+    def after_call(self, http_response, parsed, context, **kwargs):
+        """End the span of an AWS call, for the 'after-call' event."""
+        span = context.pop(CONTEXT_SPAN, None)
+        if span is None:
+            return
+        metadata = parsed.get('ResponseMetadata', {})
+        # the records of the page, e.g. the Reservations of DescribeInstances
+        records = [value for key, value in parsed.items()
+                   if isinstance(value, list)]
+        span.set_attributes(
+            status_code=http_response.status_code,
+            retries=metadata.get('RetryAttempts'),
+            page_size=len(records[0]) if records else None,
+            next_page=any(key in parsed for key in (
+                'NextToken', 'Marker', 'NextMarker')))
+        error = None
+        if http_response.status_code >= 300:
+            error = parsed.get('Error', {}).get('Code', 'HTTP error')
+        span.finish(error)
+
+    def after_call_error(self, exception, context, **kwargs):
+        """End the span of a failed call, for the 'after-call-error' event."""
+        span = context.pop(CONTEXT_SPAN, None)
+        if span is not None:
+            span.finish(exception)
+
+    def export_payload(self):
+        """Return the spans as an OTLP/HTTP JSON export request."""
+        with self.lock:
+            spans = [span.encode() for span in self.spans]
+        return {'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name',
+                 'value': encode_value(SERVICE_NAME)}]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': spans
+            }]
+        }]}
+
+
+# the tracer of the run, if enabled
+tracer = None
+
+
+def enable():
+    """Start tracing the run.
+
+    Returns:
+        The `Tracer`.
+
+    """
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+
+def disable():
+    """Stop tracing.
+
+    Returns:
+        The `Tracer` of the run, or None if tracing wasn't enabled.
+
+    """
+    global tracer
+    finished, tracer = tracer, None
+    return finished
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Trace a block of code as a span, if tracing is enabled.
+
+    Args:
+        name (str): The name of the operation.
+        **attributes: The attributes of the span, e.g. account and region.
+
+    """
+    if tracer is None:
+        yield
+    else:
+        with tracer.span(name, attributes):
+            yield
+
+
+def current_span():
+    """Return the current span, to `attach` it in another thread."""
+    return tracer.current_span() if tracer is not None else None
+
+
+@contextlib.contextmanager
+def attach(parent):
+    """Make a span of another thread the parent of this thread's spans."""
+    if tracer is None:
+        yield
+    else:
+        with tracer.attach(parent):
+            yield
+
+
+def set_attributes(**attributes):
+    """Add attributes to the current span, if tracing is enabled."""
+    parent = current_span()
+    if parent is not None:
+        parent.set_attributes(**attributes)
+
+
+def instrument_session(botocore_session):
+    """Trace the AWS calls made by the clients of a botocore session.
+
+    Args:
+        botocore_session (:botocore:session.Session): The session.
+
+    """
+    if tracer is not None:
+        botocore_session.register('before-call', tracer.before_call)
+        botocore_session.register('after-call', tracer.after_call)
+        botocore_session.register('after-call-error',
+                                  tracer.after_call_error)
+
+
+def export(payload, target):
+    """Post spans to an OTLP collector, or write them to a file.
+
+    Args:
+        payload (dict): The OTLP/HTTP JSON export request.
+        target (str): The OTLP/HTTP traces endpoint URL, or a filesystem
+            location.
+
+    """
+    data = json.dumps(payload, separators=(',', ':'))
+    if target.startswith(('http://', 'https://')):
+        request = Request(target, data.encode('utf-8'),
+                          {'Content-Type': 'application/json'})
+        urlopen(request, timeout=EXPORT_TIMEOUT).close()
+    else:
+        with io.open(target, 'w', encoding='utf-8') as trace_file:
+            trace_file.write(u'{}'.format(data))
+
+
+@contextlib.contextmanager
+def traced(target):
+    """Trace a run and export its spans when it ends.
+
+    A failing export is reported, and doesn't fail the run.
+
+    Args:
+        target (str): See `export`, or None to not trace the run.
+
+    """
+    if not target:
+        yield
+        return
+    enable()
+    try:
+        with span('run'):
+            yield
+    finally:
+        payload = disable().export_payload()
+        try:
+            export(payload, target)
+        except (IOError, OSError) as error:
+            print('Could not export the trace to {}: {}'.format(
+                target, error))
@@ -0,0 +1,319 @@
+"""CPU utilization of the running instances, to flag idle ones.
+
+The average CPU utilization of the running EC2 and RDS instances of each
+account is read from CloudWatch with GetMetricData, up to 500 metric
+queries per request with the requests of an account issued concurrently.
+Only the instances of the types and placements the account's own
+reservations leave unreserved are sampled: the accounts are reconciled
+together once they are all scanned, which can only cover more of them.
+The averages are cached in a SQLite database, so instances sampled less
+than `cache_ttl_hours` ago aren't fetched again.
+
+Once the report is built, the unreserved instances below the CPU threshold
+are annotated as idle, or excluded from the unreserved instances.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import sqlite3
+import time
+
+from check_reserved_instances.calculate import report_diffs
+from check_reserved_instances.coverage import instance_label
+
+# most metric queries of one GetMetricData request
+MAX_QUERIES = 500
+
+# the CloudWatch namespace and dimension of the instances of each results
+# entry
+METRICS = {
+    'ec2_classic_running_instances': ('AWS/EC2', 'InstanceId'),
+    'ec2_vpc_running_instances': ('AWS/EC2', 'InstanceId'),
+    'rds_running_instances': ('AWS/RDS', 'DBInstanceIdentifier')
+}
+METRIC_NAME = 'CPUUtilization'
+
+ACTIONS = ('annotate', 'exclude')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS utilization (
+    namespace TEXT NOT NULL,
+    instance_id TEXT NOT NULL,
+    cpu REAL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (namespace, instance_id)
+);
+"""
+
+
+class UtilizationCache(object):
+    """SQLite cache of the average CPU utilization of instances."""
+
+    def __init__(self, database, ttl):
+        """Open (and create if needed) the cache.
+
+        Args:
+            database (str): A filesystem location to the SQLite database.
+            ttl (float): Seconds the averages are reused for.
+
+        """
+        self.connection = sqlite3.connect(database, timeout=30)
+        self.connection.executescript(SCHEMA)
+        self.ttl = ttl
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+    def get(self, namespace, instance_ids, now=None):
+        """Return the cached averages of instances, if recent enough.
+
+        Args:
+            namespace (str): The CloudWatch namespace of the instances.
+            instance_ids (list): The instance IDs.
+            now (Optional float): The current time, defaults to now.
+
+        Returns:
+            A dict of the average CPU utilization (None without data) by
+            instance ID, of the instances cached.
+
+        """
+        oldest = (time.time() if now is None else now) - self.ttl
+        cached = {}
+        for instance_id in instance_ids:
+            row = self.connection.execute(
+                'SELECT cpu FROM utilization WHERE namespace = ? AND '
+                'instance_id = ? AND fetched_at >= ?',
+                (namespace, instance_id, oldest)).fetchone()
+            if row:
+                cached[instance_id] = row[0]
+        return cached
+
+    def put(self, namespace, averages, now=None):
+        """Cache the averages of instances.
+
+        Args:
+            namespace (str): The CloudWatch namespace of the instances.
+            averages (dict): The average CPU utilization by instance ID.
+            now (Optional float): The time they were fetched.
+
+        """
+        fetched_at = time.time() if now is None else now
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO utilization VALUES (?, ?, ?, ?)',
+                ((namespace, instance_id, cpu, fetched_at)
+                 for instance_id, cpu in averages.items()))
+
+
+def metric_queries(namespace, dimension, instance_ids, period):
+    """Build the GetMetricData queries of the average CPU of instances.
+
+    Args:
+        namespace (str): The CloudWatch namespace of the instances.
+        dimension (str): The metric dimension identifying an instance.
+        instance_ids (list): The instance IDs.
+        period (int): Seconds to average over, as one datapoint.
+
+    Returns:
+        A list of the metric data queries, with the ID 'q<position>'.
+
+    """
+    return [{
+        'Id': 'q{}'.format(position),
+        'MetricStat': {
+            'Metric': {
+                'Namespace': namespace,
+                'MetricName': METRIC_NAME,
+                'Dimensions': [{'Name': dimension, 'Value': instance_id}]
+            },
+            'Period': period,
+            'Stat': 'Average'
+        },
+        'ReturnData': True
+    } for position, instance_id in enumerate(instance_ids)]
+
+
+def fetch_averages(cloudwatch, namespace, dimension, instance_ids, days,
+                   max_workers):
+    """Fetch the average CPU utilization of instances from CloudWatch.
+
+    Args:
+        cloudwatch (:boto3:client.CloudWatch): The CloudWatch client.
+        namespace (str): The CloudWatch namespace of the instances.
+        dimension (str): The metric dimension identifying an instance.
+        instance_ids (list): The instance IDs.
+        days (int): Days to average over, until now.
+        max_workers (int): How many requests to make at once.
+
+    Returns:
+        A dict of the average CPU utilization by instance ID, None for the
+        instances without datapoints.
+
+    """
+    end = datetime.datetime.utcnow().replace(second=0, microsecond=0)
+    start = end - datetime.timedelta(days=days)
+    period = days * 86400
+
+    def fetch(batch):
+        averages = dict((instance_id, None) for instance_id in batch)
+        paginator = cloudwatch.get_paginator('get_metric_data')
+        for page in paginator.paginate(
+                MetricDataQueries=metric_queries(
+                    namespace, dimension, batch, period),
+                StartTime=start, EndTime=end):
+            for result in page['MetricDataResults']:
+                if result['Values']:
+                    averages[batch[int(result['Id'][1:])]] = (
+                        sum(result['Values']) / len(result['Values']))
+        return averages
+
+    batches = [instance_ids[index:index + MAX_QUERIES]
+               for index in range(0, len(instance_ids), MAX_QUERIES)]
+    averages = {}
+    if len(batches) <= 1 or max_workers <= 1:
+        for batch in batches:
+            averages.update(fetch(batch))
+        return averages
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for batch_averages in executor.map(fetch, batches):
+            averages.update(batch_averages)
+    finally:
+        executor.shutdown()
+    return averages
+
+
+def sample_utilization(session, results, utilization):
+    """Record the average CPU utilization of the instances of an account.
+
+    Args:
+        session (:boto3:session.Session): The authenticated boto3 session
+            of the account.
+        results (dict): The results of the account, whose `instances` left
+            unreserved by its reservations are sampled.
+        utilization (dict): The [Utilization] configuration.
+
+    Returns:
+        The updated results dictionary, whose `utilization` indexes the
+        (results name, key, average CPU) of the instances sampled by
+        instance ID.
+
+    """
+    unreserved = {}
+    for name in METRICS:
+        if name in results:
+            unreserved[name] = report_diffs(
+                results[name], results.get(name.replace(
+                    '_running_', '_reserved_'), {}))['unreserved_instances']
+    # instance IDs by namespace and dimension
+    instances = {}
+    for instance_id, record in results.get('instances', {}).items():
+        name, placement_key = record[:2]
+        if placement_key in unreserved.get(name, ()):
+            instances.setdefault(METRICS[name], []).append(
+                (instance_id, name, placement_key))
+    if not instances:
+        return results
+
+    cloudwatch = session.client('cloudwatch')
+    cache = UtilizationCache(utilization['cache'],
+                             utilization['cache_ttl_hours'] * 3600)
+    try:
+        for (namespace, dimension), sampled in sorted(instances.items()):
+            instance_ids = sorted(instance_id for instance_id, _, _ in sampled)
+            averages = cache.get(namespace, instance_ids)
+            missing = [instance_id for instance_id in instance_ids
+                       if instance_id not in averages]
+            if missing:
+                fetched = fetch_averages(
+                    cloudwatch, namespace, dimension, missing,
+                    utilization['period_days'], utilization['max_workers'])
+                cache.put(namespace, fetched)
+                averages.update(fetched)
+            for instance_id, name, placement_key in sampled:
+                if averages.get(instance_id) is not None:
+                    results['utilization'][instance_id] = (
+                        name, placement_key, averages[instance_id])
+    finally:
+        cache.close()
+    return results
+
+
+def exclude_idle(report, placement_key, idle):
+    """Exclude idle instances from the unreserved instances of a key.
+
+    Args:
+        report (dict): The report, whose unreserved instance count of the
+            key is reduced.
+        placement_key (tuple): The key of the instances.
+        idle (list): The IDs of the idle instances of the key.
+
+    Returns:
+        The IDs of the instances excluded, no more than the unreserved
+        instances of the key are counted.
+
+    """
+    for diffs in report.values():
+        unreserved = diffs['unreserved_instances']
+        count = unreserved.get(placement_key)
+        if count:
+            excluded = idle[:count]
+            if len(excluded) == count:
+                del unreserved[placement_key]
+            else:
+                unreserved[placement_key] = count - len(excluded)
+            return excluded
+    return []
+
+
+def flag_idle(config, report, results, instance_ids=None):
+    """Annotate or exclude the idle unreserved instances of a report.
+
+    Args:
+        config (dict): The application configuration.
+        report (dict): The report, as returned by `build_report`, whose
+            unreserved instance counts are reduced by the idle instances
+            excluded.
+        results (dict): The results, with the sampled `utilization`.
+        instance_ids (Optional dict): The instance IDs by key of the
+            unreserved instances, as returned by `cover_report` without
+            labels. Defaults to every instance of the results.
+
+    Returns:
+        The instance IDs/names by key to report with the unreserved
+        instances, with the idle ones annotated or excluded.
+
+    """
+    utilization = config.get('Utilization')
+    if instance_ids is None:
+        if not utilization or not results.get('instances'):
+            return results.get('instance_ids')
+        instance_ids = {}
+        for instance_id, record in results['instances'].items():
+            instance_ids.setdefault(record[1], []).append(instance_id)
+
+    samples = results.get('utilization', {})
+    idle = {}
+    if utilization:
+        idle = dict((instance_id, record[2])
+                    for instance_id, record in samples.items()
+                    if record[2] < utilization['cpu_threshold'])
+
+    labels = {}
+    for placement_key, key_instance_ids in instance_ids.items():
+        key_idle = [instance_id for instance_id in key_instance_ids
+                    if instance_id in idle]
+        if key_idle and utilization['action'] == 'exclude':
+            excluded = exclude_idle(report, placement_key, key_idle)
+            key_instance_ids = [instance_id for instance_id in
+                                key_instance_ids if instance_id not in
+                                excluded]
+            key_idle = []
+        labels[placement_key] = [
+            '{} (idle, {:.1f}% CPU)'.format(label, idle[instance_id])
+            if instance_id in key_idle else label
+            for label, instance_id in sorted(
+                (instance_label(results, instance_id), instance_id)
+                for instance_id in key_instance_ids)]
+    return labels
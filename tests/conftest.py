@@ -0,0 +1,303 @@
+"""Fixtures shared by the tests.
+
+The EC2 responses are those `test_calculate` mocks, so the tests of the
+other commands report on the same instances and reservations.
+"""
+import datetime
+
+from click.testing import CliRunner
+import mock
+import pytest
+
+from check_reserved_instances import cli
+
+
+def ec2_instances_page():
+    """Return a mocked page of EC2 instances."""
+    return {
+        u'Reservations': [
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1b',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'InstanceType': 'm4.large',
+                        'InstanceId': 'i-456sdf4g',
+                        'Tags': [
+                            {
+                                'Key': 'Name',
+                                'Value': 'test'
+                            }
+                        ]
+                    }
+                ]
+            },
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1b',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'InstanceType': 'c3.large',
+                        'InstanceId': 'i-sdklfmi3',
+                        'Tags': [
+                            {
+                                'Key': 'Name',
+                                'Value': 'test2'
+                            }
+                        ]
+                    }
+                ]
+            },
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1b',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'InstanceType': 'c3.large',
+                        'InstanceId': 'i-kcndnj3j',
+                        'Tags': [
+                            {
+                                'Key': 'Name',
+                                'Value': 'test2'
+                            }
+                        ]
+                    }
+                ]
+            },
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1b',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'InstanceType': 'c3.large',
+                        'InstanceId': 'i-mnen9n4n',
+                        'Tags': [
+                            {
+                                'Key': 'Name',
+                                'Value': 'test2'
+                            }
+                        ]
+                    }
+                ]
+            },
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1b',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'InstanceType': 'c3.large',
+                        'InstanceId': 'i-qnhvhzn3',
+                        'Tags': [
+                            {
+                                'Key': 'Name',
+                                'Value': 'test2'
+                            }
+                        ]
+                    }
+                ]
+            },
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1d',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'InstanceType': 'c3.large',
+                        'VpcId': 'vpc-23hund21',
+                        'InstanceId': 'i-lksjdfi2',
+                        'Tags': [
+                            {
+                                'Key': 'Name',
+                                'Value': 'test3'
+                            }
+                        ]
+                    }
+                ]
+            },
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1b',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'VpcId': 'vpc-23hund21',
+                        'InstanceType': 'm4.large',
+                        'InstanceId': 'i-sdf3f4d6'
+                    }
+                ]
+            },
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1c',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'InstanceType': 't1.micro',
+                        'InstanceId': 'i-dfgeqa53',
+                        'Tags': [
+                            {
+                                'Key': 'Random',
+                                'Value': 'Tag'
+                            }
+                        ]
+                    }
+                ]
+            },
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1c',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'VpcId': 'vpc-23hund21',
+                        'InstanceType': 't2.medium',
+                        'InstanceId': 'i-sdfjj239',
+                        'SpotInstanceRequestId':
+                            'sfr-a1e8ac61-1029-4edc-8f06-92289516e0b7'
+                    }
+                ]
+            },
+            {
+                u'Groups': [],
+                u'Instances': [
+                    {
+                        'Placement': {
+                            'AvailabilityZone': 'us-east-1c',
+                            'GroupName': '',
+                            'Tenancy': 'default'
+                        },
+                        'InstanceType': 't1.micro',
+                        'InstanceId': 'i-odfg35vs',
+                        'Tags': [
+                            {
+                                'Key': 'NoReservation',
+                                'Value': 'True'
+                            }
+                        ]
+                    }
+                ]
+            },
+        ]
+    }
+
+
+def ec2_reserved_instances_response():
+    """Return a mocked list of EC2 RIs."""
+    return {
+        'ReservedInstances': [
+            {
+                'Scope': 'Availability Zone',
+                'AvailabilityZone': 'us-east-1b',
+                'InstanceType': 'c4.large',
+                'InstanceCount': 1,
+                'ProductDescription': 'Linux/UNIX (Amazon VPC)',
+                'End': datetime.datetime.utcnow() + datetime.timedelta(
+                    days=365),
+            },
+            {
+                'Scope': 'Availability Zone',
+                'AvailabilityZone': 'us-east-1c',
+                'InstanceType': 'm4.large',
+                'InstanceCount': 1,
+                'ProductDescription': 'Linux/UNIX (Amazon VPC)',
+                'End': datetime.datetime.utcnow() + datetime.timedelta(
+                    days=365),
+            },
+            {
+                'Scope': 'Availability Zone',
+                'AvailabilityZone': 'us-east-1b',
+                'InstanceType': 'm4.large',
+                'InstanceCount': 1,
+                'ProductDescription': 'Linux/UNIX (Amazon VPC)',
+                'End': datetime.datetime.utcnow() + datetime.timedelta(
+                    days=365),
+            },
+            {
+                'Scope': 'Region',
+                'InstanceType': 'c3.large',
+                'InstanceCount': 3,
+                'ProductDescription': 'Linux/UNIX',
+                'End': datetime.datetime.utcnow() + datetime.timedelta(
+                    days=365),
+            },
+            {
+                'Scope': 'Region',
+                'InstanceType': 'm3.medium',
+                'InstanceCount': 1,
+                'ProductDescription': 'Linux/UNIX',
+                'End': datetime.datetime.utcnow() + datetime.timedelta(
+                    days=365),
+            }
+        ]
+    }
+
+
+@pytest.fixture
+def ec2_instances():
+    """Return a mocked page of EC2 instances."""
+    return ec2_instances_page()
+
+
+@pytest.fixture
+def ec2_reserved_instances():
+    """Return a mocked list of EC2 RIs."""
+    return ec2_reserved_instances_response()
+
+
+@pytest.fixture
+def mocked_boto3():
+    """Patch the boto3 sessions, every account returning the EC2 fixtures.
+
+    Each call of the clients' paginators and describe_reserved_instances
+    returns new EC2 instances and RIs, which the tests may override.
+
+    """
+    with mock.patch('check_reserved_instances.aws.boto3.Session') as session:
+        client = session.return_value.client.return_value
+        client.get_paginator.return_value.paginate.side_effect = (
+            lambda **kwargs: [ec2_instances_page()])
+        client.describe_reserved_instances.side_effect = (
+            lambda **kwargs: ec2_reserved_instances_response())
+        yield session
+
+
+@pytest.fixture
+def invoke_cli():
+    """Return a function running the command with arguments."""
+    runner = CliRunner()
+
+    def invoke(*args):
+        return runner.invoke(cli, list(args), catch_exceptions=False)
+    return invoke
@@ -0,0 +1,170 @@
+"""Tests for scanning the accounts with asyncio."""
+import threading
+import time
+
+from click.testing import CliRunner
+import pytest
+
+from check_reserved_instances import aws, cli
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs
+except ImportError:  # pragma: no cover
+    pytest.skip('the async engine requires Python 3',
+                allow_module_level=True)
+pytest.importorskip('aiobotocore')
+
+CONFIG = ''.join(
+    '[AWS account{0}]\naws_access_key_id = key{0}\n'
+    'aws_secret_access_key = secret\nregion = {1}\nrds = False\n'
+    'elasticache = False\n\n'.format(number, region)
+    for number, region in enumerate(('us-east-1', 'us-west-2'), 1))
+
+INSTANCE = """<item><instanceId>{0}</instanceId>
+<instanceType>{1}</instanceType>
+<placement><availabilityZone>us-east-1a</availabilityZone></placement>
+<vpcId>vpc-1</vpcId>
+<tagSet><item><key>Name</key><value>{0}-name</value></item></tagSet>
+</item>"""
+
+RESPONSES = {
+    'DescribeAccountAttributes': """<accountAttributeSet><item>
+<attributeName>supported-platforms</attributeName><attributeValueSet>
+<item><attributeValue>VPC</attributeValue></item></attributeValueSet>
+</item></accountAttributeSet>""",
+    'DescribeInstances': """<reservationSet><item><instancesSet>
+{}{}</instancesSet></item></reservationSet><nextToken>page2</nextToken>
+""".format(INSTANCE.format('i-1', 't2.micro'),
+           INSTANCE.format('i-2', 'm5.large')),
+    'DescribeInstancesPage2': """<reservationSet><item><instancesSet>
+{}</instancesSet></item></reservationSet>""".format(
+        INSTANCE.format('i-3', 'm5.large')),
+    'DescribeAvailabilityZones': """<availabilityZoneInfo>
+<item><zoneName>us-east-1a</zoneName></item>
+<item><zoneName>us-east-1b</zoneName></item></availabilityZoneInfo>""",
+    'DescribeReservedInstances': """<reservedInstancesSet><item>
+<reservedInstancesId>ri-1</reservedInstancesId>
+<instanceType>m5.large</instanceType>
+<availabilityZone>us-east-1a</availabilityZone>
+<instanceCount>1</instanceCount><end>2030-01-01T00:00:00.000Z</end>
+<productDescription>Linux/UNIX (Amazon VPC)</productDescription>
+<scope>Availability Zone</scope><state>active</state>
+</item></reservedInstancesSet>"""
+}
+
+THROTTLED = """<Response><Errors><Error><Code>RequestLimitExceeded</Code>
+<Message>Request limit exceeded.</Message></Error></Errors>
+<RequestID>1</RequestID></Response>"""
+
+
+class StandInEC2(ThreadingMixIn, HTTPServer):
+    """Local stand-in of the EC2 endpoint, recording the calls in flight."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        """Listen on a free local port."""
+        HTTPServer.__init__(self, ('127.0.0.1', 0), EC2Handler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.throttle = True
+        self.actions = []
+
+
+class EC2Handler(BaseHTTPRequestHandler):
+    """Answer the EC2 calls of the collector."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        """Answer a query API call."""
+        params = parse_qs(self.rfile.read(
+            int(self.headers['Content-Length'])).decode('utf-8'))
+        action = params['Action'][0]
+        server = self.server
+        with server.lock:
+            server.actions.append(action)
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+            throttled = (server.throttle and
+                         action == 'DescribeReservedInstances')
+            server.throttle = server.throttle and not throttled
+        time.sleep(0.05)
+        with server.lock:
+            server.in_flight -= 1
+
+        if throttled:
+            status, body = 503, THROTTLED
+        else:
+            if 'NextToken' in params:
+                action += 'Page2'
+            status, body = 200, '<{0}Response>{1}</{0}Response>'.format(
+                action, RESPONSES[action])
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Keep the test output quiet."""
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    """Run the stand-in endpoint, used by every client."""
+    server = StandInEC2()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    monkeypatch.setenv('AWS_ENDPOINT_URL', 'http://127.0.0.1:{}'.format(
+        server.server_address[1]))
+    aws.account_ids.clear()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_async_engine_reports_as_serial(stand_in, tmpdir):
+    """Test the async engine reports the same as the serial one."""
+    config = tmpdir.join('config.ini')
+    config.write(CONFIG)
+    runner = CliRunner()
+
+    concurrent = runner.invoke(
+        cli, ['--config', str(config), '--engine', 'async', '--workers', '2'],
+        catch_exceptions=False)
+    # two accounts, each with two calls in flight at most
+    assert 1 < stand_in.peak <= 4
+    assert not stand_in.throttle
+    serial = runner.invoke(
+        cli, ['--config', str(config)], catch_exceptions=False)
+
+    assert 'm5.large' in concurrent.output
+    assert 'i-3-name' in concurrent.output
+    assert 'PARTIAL COVERAGE' not in concurrent.output
+    assert concurrent.output == serial.output
+
+
+def test_async_engine_segments(stand_in, tmpdir):
+    """Test the async engine scans the EC2 instances in segments."""
+    config = tmpdir.join('config.ini')
+    # one account, the instance IDs of the stand-in being the same in both
+    config.write(CONFIG.split('\n\n')[0] +
+                 '\n\n[Connection]\nec2_segments = 2\n')
+    runner = CliRunner()
+
+    concurrent = runner.invoke(
+        cli, ['--config', str(config), '--engine', 'async'],
+        catch_exceptions=False)
+    serial = runner.invoke(
+        cli, ['--config', str(config)], catch_exceptions=False)
+
+    assert 'DescribeAvailabilityZones' in stand_in.actions
+    # two segments of two pages each, then the serial scan
+    assert stand_in.actions.count('DescribeInstances') == 8
+    assert concurrent.output == serial.output
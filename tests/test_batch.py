@@ -0,0 +1,49 @@
+"""Tests for reporting several configurations from one scan."""
+import mock
+
+from check_reserved_instances.batch import plan_batch
+
+SECTION = ('[AWS {}]\naws_access_key_id = key\naws_secret_access_key = '
+           'secret\nregion = us-east-1\nrds = {}\nelasticache = False\n')
+
+
+def account(name, rds=False, account_id='111111111111', role='Reports'):
+    """Return an account section as loaded from a configuration file."""
+    return {'name': name, 'aws_access_key_id': None,
+            'aws_secret_access_key': None,
+            'aws_role_arn': 'arn:aws:iam::{}:role/{}'.format(account_id, role),
+            'region': 'us-west-2', 'ec2': True, 'rds': rds,
+            'elasticache': False}
+
+
+def test_plan_batch_groups_sections():
+    """Test each AWS account is scanned once, with every service."""
+    accounts, members = plan_batch([
+        [account('team a'), account('other', account_id='222222222222')],
+        [account('team b', rds=True, role='TeamB')]])
+
+    assert [(item['name'], item['rds']) for item in accounts] == [
+        ('team a', True), ('other', False)]
+    assert members == [[0, 1], [0]]
+
+
+def test_batch_scans_once(mocked_boto3, ec2_instances, invoke_cli, tmpdir):
+    """Test a directory of configurations is reported from one scan."""
+    client = mocked_boto3.return_value.client.return_value
+    paginate = client.get_paginator.return_value.paginate
+    paginate.side_effect = lambda **kwargs: [dict(
+        ec2_instances, DBInstances=[], ReservedDBInstances=[])]
+    tmpdir.join('a.ini').write(SECTION.format('team a', 'False'))
+    tmpdir.join('b.ini').write(SECTION.format('team b', 'True'))
+    tmpdir.join('notes.txt').write('not a configuration')
+
+    output = invoke_cli('--config', str(tmpdir)).output
+
+    assert client.get_paginator.call_args_list.count(
+        mock.call('describe_instances')) == 1
+    first = output.index('Configuration {}'.format(tmpdir.join('a.ini')))
+    second = output.index('Configuration {}'.format(tmpdir.join('b.ini')))
+    assert 'RDS' not in output[first:second]
+    assert 'RDS' in output[second:]
+    assert output[first:second].count('NOT RESERVED') == output[
+        second:].count('NOT RESERVED')
@@ -0,0 +1,61 @@
+"""Tests for the monitoring check mode."""
+from click.testing import CliRunner
+
+from check_reserved_instances import check, cli
+from check_reserved_instances.calculate import new_results
+
+SERVICES = [('EC2 VPC', 'ec2_vpc')]
+
+CONFIG = """
+[AWS account1]
+rds = False
+elasticache = False
+
+[Check]
+warning_unreserved = 3
+critical_coverage = 50
+"""
+
+
+def test_check_thresholds():
+    """Test the status and perfdata of each threshold."""
+    results = new_results(SERVICES, counts_only=True)
+    results['ec2_vpc_running_instances'] = {('m5.large', 'us-east-1a'): 4}
+    results['ec2_vpc_reserved_instances'] = {('m5.large', 'us-east-1a'): 1}
+    results['reserve_expiry'] = {('m5.large', 'us-east-1a'): [10]}
+
+    status, output = check.check_results(
+        results, SERVICES, {'critical_unreserved': 2})
+    assert status == check.CRITICAL
+    assert output == (
+        'RESERVED INSTANCES CRITICAL - 3 unreserved, 25.0% coverage | '
+        "'unreserved'=3;;2;0 'coverage'=25.0%;;;0 'running'=4;;;0 "
+        "'reserved'=1;;;0")
+
+    status, output = check.check_results(
+        results, SERVICES, {'warning_coverage': 30.0,
+                            'warning_expiry_days': 30})
+    assert status == check.WARNING
+    assert '1 reservations expiring within 30 days' in output
+    assert "'expiring'=1;;;0" in output
+
+    status, output = check.check_results(
+        results, SERVICES, {'warning_coverage': 30.0},
+        failures=[{'account': 'AWS account1', 'region': 'us-east-1',
+                   'service': 'ec2', 'error': 'Expired'}])
+    assert status == check.UNKNOWN
+    assert '1 units not scanned' in output
+
+
+def test_check_run(mocked_boto3, tmpdir):
+    """Test the --check option exits with the status of the thresholds."""
+    config = tmpdir.join('config.ini')
+    config.write(CONFIG)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--config', str(config), '--check'])
+
+    assert result.exit_code == check.WARNING
+    assert result.output.startswith('RESERVED INSTANCES WARNING - ')
+    assert "'unreserved'=" in result.output
+    assert 'Reserved Instances Report' not in result.output
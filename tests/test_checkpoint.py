@@ -0,0 +1,102 @@
+"""Tests for checkpointing, retrying and resuming scans."""
+from botocore.exceptions import ClientError
+from click.testing import CliRunner
+import pytest
+
+from check_reserved_instances import aws, cli
+from check_reserved_instances.checkpoint import retry_settings
+
+CONFIG = """
+[AWS account1]
+aws_access_key_id = key1
+aws_secret_access_key = secret1
+rds = False
+elasticache = False
+
+[AWS account2]
+aws_access_key_id = key2
+aws_secret_access_key = secret2
+rds = False
+elasticache = False
+
+[Checkpoint]
+directory = {}
+max_attempts = 2
+retry_delay = 0
+"""
+
+
+def test_resume_failed_units(mocked_boto3, ec2_reserved_instances,
+                             invoke_cli, tmpdir):
+    """Test reporting failed units as partial coverage, then resuming."""
+    describe = (mocked_boto3.return_value.client.return_value.
+                describe_reserved_instances)
+    error = ClientError(
+        {'Error': {'Code': 'RequestExpired', 'Message': 'Expired'}},
+        'DescribeReservedInstances')
+    # account1 succeeds, account2 fails both attempts, then succeeds
+    describe.side_effect = [ec2_reserved_instances, error, error,
+                            ec2_reserved_instances]
+    # the sections are of different AWS accounts
+    aws.account_ids.clear()
+    get_caller_identity = (mocked_boto3.return_value.client.return_value.
+                           get_caller_identity)
+    get_caller_identity.side_effect = [{'Account': '111111111111'},
+                                       {'Account': '222222222222'}]
+
+    config = tmpdir.join('config.ini')
+    config.write(CONFIG.format(tmpdir.join('checkpoints')))
+
+    result = invoke_cli('--config', str(config))
+    assert 'PARTIAL COVERAGE!' in result.output
+    assert 'AWS account2 (us-east-1) ec2: An error occurred' in result.output
+    assert 'Reserved Instances Report' in result.output
+    assert describe.call_count == 3
+
+    assert tmpdir.join('checkpoints').listdir()
+
+    result = invoke_cli('--config', str(config), '--resume')
+    assert 'PARTIAL COVERAGE!' not in result.output
+    # only the failed unit is scanned again
+    assert describe.call_count == 4
+    # the run completed, so its checkpoints are deleted
+    assert tmpdir.join('checkpoints').listdir() == []
+
+
+@pytest.mark.parametrize('code,status,attempts', [
+    ('AccessDenied', 403, 1),
+    ('UnauthorizedOperation', 403, 1),
+    ('Throttling', 400, 3),
+    ('InternalError', 500, 3)])
+def test_retry_transient_errors(mocked_boto3, invoke_cli, tmpdir, code,
+                                status, attempts):
+    """Test only retrying the units failing with transient errors."""
+    describe = (mocked_boto3.return_value.client.return_value.
+                describe_reserved_instances)
+    describe.side_effect = ClientError(
+        {'Error': {'Code': code, 'Message': code},
+         'ResponseMetadata': {'HTTPStatusCode': status}},
+        'DescribeReservedInstances')
+    config = tmpdir.join('config.ini')
+    config.write('[AWS account1]\nrds = False\nelasticache = False\n\n'
+                 '[Checkpoint]\ndirectory = {}\nretry_delay = 0\n'.format(
+                     tmpdir.join('checkpoints')))
+
+    result = invoke_cli('--config', str(config))
+
+    assert 'PARTIAL COVERAGE!' in result.output
+    assert describe.call_count == attempts
+
+
+def test_no_retries_by_default():
+    """Test units are tried once without a [Checkpoint] section."""
+    assert retry_settings({})[0] == 1
+
+
+def test_resume_requires_checkpoints():
+    """Test --resume without a [Checkpoint] section."""
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ['--config', 'tests/fixtures/config.ini.no_email', '--resume'])
+
+    assert '--resume requires a [Checkpoint] section' in result.output
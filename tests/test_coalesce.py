@@ -0,0 +1,71 @@
+"""Tests for coalescing the sections of the same account and region."""
+import threading
+
+from check_reserved_instances import aws
+from check_reserved_instances.collectors import report_sections
+from check_reserved_instances.scan import scan_accounts, SingleFlight
+
+
+def section(name, key, region='us-east-1'):
+    """Return an account section collecting EC2 with an access key."""
+    return {'name': name, 'aws_access_key_id': key,
+            'aws_secret_access_key': 'secret', 'aws_role_arn': None,
+            'region': region, 'ec2': True, 'rds': False,
+            'elasticache': False}
+
+
+def test_overlapping_sections_counted_once(mocked_boto3):
+    """Test sections of the same account and region are collected once."""
+    client = mocked_boto3.return_value.client.return_value
+    aws.account_ids.clear()
+    # key1 and key2 are users of the same account
+    client.get_caller_identity.return_value = {'Account': '111111111111'}
+
+    single = [section('AWS team-a', 'key1')]
+    accounts = single + [
+        section('AWS team-b', 'key1'), section('AWS team-c', 'key2'),
+        section('AWS team-a west', 'key1', 'us-west-2')]
+    services = report_sections(accounts)
+    expected, _, _ = scan_accounts(single, services)
+    assert client.describe_reserved_instances.call_count == 1
+
+    results, account_results, failures = scan_accounts(accounts, services)
+
+    # one STS call by access key, and one more scan for us-west-2
+    assert client.get_caller_identity.call_count == 2
+    assert client.describe_reserved_instances.call_count == 3
+    assert not failures
+    for name in ('ec2_classic_running_instances',
+                 'ec2_vpc_reserved_instances'):
+        assert results[name] == dict(
+            (key, count * 2) for key, count in expected[name].items())
+    assert not dict(account_results)['AWS team-b']['ec2_vpc_running_instances']
+
+
+def test_single_flight_shares_running_call():
+    """Test callers of a running call wait for its result."""
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def collect():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 'results'
+
+    outcomes = []
+    first = threading.Thread(
+        target=lambda: outcomes.append(flights.do('unit', collect)))
+    first.start()
+    started.wait()
+    second = threading.Thread(
+        target=lambda: outcomes.append(flights.do('unit', collect)))
+    second.start()
+    release.set()
+    first.join()
+    second.join()
+
+    assert len(calls) == 1
+    assert sorted(outcomes) == [('results', False), ('results', True)]
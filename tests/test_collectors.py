@@ -0,0 +1,45 @@
+"""Tests for the service collector registry."""
+from click.testing import CliRunner
+import mock
+
+from check_reserved_instances import cli
+from check_reserved_instances.collectors import (
+    Collector, register_collector, registry)
+
+
+def calculate_redshift_ris(session, results):
+    """Record one unreserved Redshift node."""
+    results['redshift_running_instances'][('dc2.large', 'All')] = 1
+    return results
+
+
+@mock.patch('check_reserved_instances.aws.boto3.Session')
+def test_registered_collector(mocked_boto3, tmpdir):
+    """Test enabling a registered collector and skipping a disabled one."""
+    config = tmpdir.join('config.ini')
+    config.write('[AWS account1]\nec2 = False\nrds = False\n'
+                 'elasticache = False\nredshift = True\n')
+
+    register_collector(Collector(
+        'redshift', 'test_collectors:calculate_redshift_ris', 'redshift',
+        ('describe_cluster_nodes',), ('node_type', 'region'),
+        [('Redshift', 'redshift')], default=False))
+    # never enabled, so never imported
+    register_collector(Collector(
+        'dynamodb', 'not_installed:calculate_dynamodb_ris', 'dynamodb',
+        (), ('table', 'region'), [('DynamoDB', 'dynamodb')],
+        default=False))
+
+    try:
+        runner = CliRunner()
+        result = runner.invoke(
+            cli, ['--config', str(config)], catch_exceptions=False)
+    finally:
+        del registry['redshift']
+        del registry['dynamodb']
+
+    assert 'report on Redshift reserved instances' in result.output
+    assert 'NOT RESERVED!\t(1)\tdc2.large\tAll' in result.output
+    assert 'DynamoDB' not in result.output
+    assert 'EC2' not in result.output
+    assert not mocked_boto3.return_value.client.called
@@ -0,0 +1,111 @@
+"""Tests for assigning the running instances to reservations."""
+import datetime
+
+from check_reserved_instances.aws import (
+    ec2_instance_record, ec2_reservation_record)
+from check_reserved_instances.calculate import (
+    add_instance, add_reservation, build_report, new_results)
+from check_reserved_instances.coverage import assign_coverage, cover_report
+
+SERVICES = [('EC2 VPC', 'ec2_vpc')]
+RUNNING = 'ec2_vpc_running_instances'
+RESERVED = 'ec2_vpc_reserved_instances'
+
+
+def vpc_results(size_flexible=True):
+    """Return results with zonal, regional and size-flexible coverage."""
+    results = new_results(SERVICES)
+    for instance_id, key, year in [
+            ('i-new', ('m5.large', 'us-east-1a'), 2021),
+            ('i-old', ('m5.large', 'us-east-1a'), 2019),
+            ('i-b', ('m5.large', 'us-east-1b'), 2020),
+            ('i-x', ('m5.xlarge', 'us-east-1b'), 2018),
+            ('i-y', ('t3.micro', 'us-east-1a'), 2017)]:
+        add_instance(results, RUNNING, key, instance_id, instance_id,
+                     datetime.datetime(year, 1, 1), True)
+    add_reservation(results, RESERVED, ('m5.large', 'us-east-1a'), 1,
+                    datetime.datetime(2030, 1, 1), 'ri-zonal')
+    add_reservation(results, RESERVED, ('m5.large', 'All'), 4,
+                    datetime.datetime(2031, 1, 1), 'ri-regional',
+                    size_flexible)
+    return results
+
+
+def test_assign_coverage():
+    """Test the oldest instances are covered first, in three passes."""
+    coverage, unused = assign_coverage(vpc_results(), SERVICES)
+
+    assert dict((instance_id, (assignment.reservation_id, assignment.scope))
+                for instance_id, assignment in coverage.items()) == {
+        'i-old': ('ri-zonal', 'zonal'),
+        'i-new': ('ri-regional', 'regional'),
+        'i-b': ('ri-regional', 'regional'),
+        'i-x': ('ri-regional', 'size-flexible'),
+        'i-y': (None, None)}
+    assert unused == {('EC2 VPC', ('m5.large', 'All')): 0}
+
+
+def test_assign_coverage_not_size_flexible():
+    """Test other platforms' reservations only cover their own size."""
+    coverage, unused = assign_coverage(vpc_results(False), SERVICES)
+
+    assert coverage['i-x'].scope is None
+    assert coverage['i-b'].scope == 'regional'
+    assert unused == {('EC2 VPC', ('m5.large', 'All')): 2}
+
+
+def test_ec2_records_size_flexible():
+    """Test only Linux/UNIX default tenancy records are size flexible."""
+    instance = {'InstanceId': 'i-1', 'InstanceType': 'm5.large',
+                'VpcId': 'vpc-1', 'PlatformDetails': 'Linux/UNIX',
+                'Placement': {'AvailabilityZone': 'us-east-1a',
+                              'Tenancy': 'default'}}
+    assert ec2_instance_record(instance).size_flexible
+    instance['PlatformDetails'] = 'Red Hat Enterprise Linux'
+    assert not ec2_instance_record(instance).size_flexible
+    del instance['PlatformDetails']
+    assert not ec2_instance_record(instance).size_flexible
+
+    reservation = {'InstanceType': 'm5.large', 'Scope': 'Region',
+                   'InstanceCount': 1, 'End': None,
+                   'ProductDescription': 'Linux/UNIX (Amazon VPC)',
+                   'InstanceTenancy': 'default'}
+    assert ec2_reservation_record(reservation, True).size_flexible
+    reservation['InstanceTenancy'] = 'dedicated'
+    assert not ec2_reservation_record(reservation, True).size_flexible
+    reservation.update(InstanceTenancy='default', ProductDescription='Windows')
+    assert not ec2_reservation_record(reservation, True).size_flexible
+
+
+def test_cover_report_lists_uncovered():
+    """Test the report only lists the instances left uncovered."""
+    results = vpc_results()
+    report = build_report(results, SERVICES)
+    assert report['EC2 VPC']['unused_reservations'] == {
+        ('m5.large', 'All'): 2}
+
+    instance_ids = cover_report(report, results, SERVICES)
+
+    diffs = report['EC2 VPC']
+    assert diffs['unreserved_instances'] == {('t3.micro', 'us-east-1a'): 1}
+    assert diffs['unused_reservations'] == {}
+    assert instance_ids[('t3.micro', 'us-east-1a')] == ['i-y']
+
+
+def test_coverage_command(mocked_boto3, invoke_cli, tmpdir):
+    """Test looking up instances and exporting the table."""
+    config = tmpdir.join('config.ini')
+    config.write('[AWS account]\nregion = us-east-1\nrds = False\n'
+                 'elasticache = False\n')
+
+    table = invoke_cli('--config', str(config),
+                       'coverage').output.splitlines()
+    assert table[0] == ('instance_id,section,instance_type,placement,label,'
+                        'reservation_id,scope')
+    assert len(table) == 1 + 8
+
+    instance_id = table[1].split(',')[0]
+    lookup = invoke_cli('--config', str(config), 'coverage', '--instance',
+                        instance_id, '--instance', 'i-missing').output
+    assert lookup.splitlines()[0].startswith(instance_id + '\t')
+    assert lookup.splitlines()[1] == 'i-missing\tNOT RUNNING'
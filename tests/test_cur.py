@@ -0,0 +1,146 @@
+"""Tests for reading Cost and Usage Report files."""
+import csv
+import datetime
+import gzip
+import io
+
+from click.testing import CliRunner
+import pytest
+
+from check_reserved_instances import cli
+from check_reserved_instances.cur import cur_results
+
+HEADER = ['identity/LineItemId', 'lineItem/LineItemType',
+          'lineItem/ProductCode', 'lineItem/UsageType',
+          'lineItem/UsageAmount', 'lineItem/UsageStartDate',
+          'lineItem/UsageEndDate', 'lineItem/ResourceId',
+          'lineItem/AvailabilityZone', 'product/instanceType',
+          'product/deploymentOption', 'reservation/ReservationARN',
+          'reservation/NumberOfReservations', 'reservation/EndTime']
+
+EC2_RI = ['', 'RIFee', 'AmazonEC2', 'HeavyUsage:m5.large', '744', '', '', '',
+          '', 'm5.large', '', 'arn:aws:ec2:us-east-1:1:reserved-instances/a',
+          '1', '2030-01-01T00:00:00Z']
+RDS_RI = ['', 'RIFee', 'AmazonRDS', 'HeavyUsage:db.m5.large', '744', '', '',
+          '', '', 'db.m5.large', 'Multi-AZ', 'arn:aws:rds:us-east-1:1:ri:b',
+          '2', '2030-01-01T00:00:00Z']
+
+
+def usage(line_item_type, product, usage_type, hour, resource_id, az=''):
+    """Return an hour of instance usage."""
+    return ['', line_item_type, product, usage_type, '1',
+            '2024-01-01T0{}:00:00Z'.format(hour),
+            '2024-01-01T0{}:00:00Z'.format(hour + 1), resource_id, az, '',
+            '', '', '', '']
+
+
+def write_part(path, rows):
+    """Write a gzip CSV report file."""
+    with io.TextIOWrapper(gzip.open(str(path), 'wb'), encoding='utf-8',
+                          newline='') as report:
+        writer = csv.writer(report)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return str(path)
+
+
+def write_parquet_part(path, rows):
+    """Write a Parquet report file, named as the reports name the columns."""
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+
+    columns = {
+        'line_item_line_item_type': [row[1] for row in rows],
+        'line_item_product_code': [row[2] for row in rows],
+        'line_item_usage_type': [row[3] for row in rows],
+        'line_item_usage_amount': [float(row[4]) for row in rows],
+        'line_item_usage_start_date': [
+            datetime.datetime.strptime(row[5], '%Y-%m-%dT%H:%M:%SZ')
+            if row[5] else None for row in rows],
+        'line_item_usage_end_date': [
+            datetime.datetime.strptime(row[6], '%Y-%m-%dT%H:%M:%SZ')
+            if row[6] else None for row in rows],
+        'line_item_resource_id': [row[7] for row in rows],
+        'line_item_availability_zone': [row[8] for row in rows],
+        'product_instance_type': [row[9] for row in rows],
+        'product_deployment_option': [row[10] for row in rows],
+        'reservation_reservation_a_r_n': [row[11] for row in rows],
+        'reservation_number_of_reservations': [row[12] for row in rows],
+        'reservation_end_time': [row[13] for row in rows]
+    }
+    pyarrow.parquet.write_table(pyarrow.table(columns), str(path))
+    return str(path)
+
+
+def write_report(tmpdir):
+    """Write a report of two hours, in one file per hour."""
+    return [write_part(tmpdir.join('report-{}.csv.gz'.format(hour)), [
+        usage('Usage', 'AmazonEC2', 'BoxUsage:m5.large', hour, 'i-1',
+              'us-east-1a'),
+        usage('DiscountedUsage', 'AmazonEC2', 'BoxUsage:m5.large', hour,
+              'i-2', 'us-east-1a'),
+        usage('Usage', 'AmazonEC2', 'SpotUsage:m5.large', hour, 'i-3',
+              'us-east-1a'),
+        usage('Usage', 'AmazonEC2', 'EBS:VolumeUsage.gp2', hour, 'vol-1'),
+        usage('Usage', 'AmazonRDS', 'Multi-AZUsage:db.m5.large', hour,
+              'arn:aws:rds:us-east-1:1:db:db1'),
+        EC2_RI,
+        RDS_RI
+    ]) for hour in (0, 1)]
+
+
+def test_cur_results(tmpdir):
+    """Test counting the average instances and reservations of a report."""
+    results, services = cur_results(write_report(tmpdir), max_workers=2)
+
+    assert ('EC2 VPC', 'ec2_vpc') in services
+    assert results['ec2_vpc_running_instances'] == {
+        ('m5.large', 'us-east-1a'): 2}
+    assert results['instance_ids'][('m5.large', 'us-east-1a')] == [
+        'i-1', 'i-2']
+    assert results['ec2_vpc_reserved_instances'] == {('m5.large', 'All'): 1}
+    assert results['rds_running_instances'] == {('db.m5.large', True): 1}
+    # reservations are counted once, whatever the number of fee line items
+    assert results['rds_reserved_instances'] == {('db.m5.large', True): 2}
+
+
+def test_cur_results_parquet(tmpdir):
+    """Test reading the acronym columns and timestamps of Parquet reports."""
+    paths = [write_parquet_part(tmpdir.join('report-{}.parquet'.format(
+        hour)), [
+            usage('Usage', 'AmazonEC2', 'BoxUsage:m5.large', hour, 'i-1',
+                  'us-east-1a'),
+            EC2_RI,
+            RDS_RI
+        ]) for hour in (0, 1)]
+    results, _ = cur_results(paths, max_workers=1)
+
+    assert results['ec2_vpc_running_instances'] == {
+        ('m5.large', 'us-east-1a'): 1}
+    assert results['ec2_vpc_reserved_instances'] == {('m5.large', 'All'): 1}
+    assert results['rds_reserved_instances'] == {('db.m5.large', True): 2}
+
+
+def test_cur_results_missing_columns(tmpdir):
+    """Test skipping the line items of a report lacking some columns."""
+    path = tmpdir.join('report.csv')
+    path.write('lineItem/LineItemType,lineItem/ProductCode,'
+               'lineItem/UsageType\n'
+               'RIFee,AmazonEC2,HeavyUsage:m5.large\n'
+               'Usage,AmazonEC2,BoxUsage:m5.large\n')
+    results, _ = cur_results([str(path)])
+
+    assert results['ec2_vpc_running_instances'] == {}
+    assert results['ec2_vpc_reserved_instances'] == {}
+
+
+def test_cur_command(tmpdir):
+    """Test the cur command reports on the report files."""
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ['--config', 'tests/fixtures/config.ini.no_email', 'cur'] +
+        write_report(tmpdir), catch_exceptions=False)
+
+    assert 'NOT RESERVED!\t(1)\tm5.large\tus-east-1a\ti-1, i-2' in (
+        result.output)
+    assert 'UNUSED RESERVATION!\t(1)\tdb.m5.large\tTrue' in result.output
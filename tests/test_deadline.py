@@ -0,0 +1,57 @@
+"""Tests for client connection settings and the run deadline."""
+from click.testing import CliRunner
+import mock
+import pytest
+
+from check_reserved_instances import aws, cli
+
+ACCOUNT = {
+    'aws_access_key_id': 'test',
+    'aws_secret_access_key': 'test',
+    'aws_role_arn': None,
+    'region': 'us-east-1'
+}
+
+
+def test_client_config():
+    """Test every client of a session gets the connection settings."""
+    aws.configure_clients({
+        'connect_timeout': 2.0, 'read_timeout': 5.0,
+        'max_pool_connections': 50, 'retry_mode': 'adaptive',
+        'max_retries': None})
+    try:
+        ec2 = aws.create_boto_session(ACCOUNT).client('ec2')
+    finally:
+        aws.configure_clients({})
+
+    assert ec2.meta.config.connect_timeout == 2.0
+    assert ec2.meta.config.read_timeout == 5.0
+    assert ec2.meta.config.max_pool_connections == 50
+    assert ec2.meta.config.retries == {'mode': 'adaptive'}
+
+
+def test_deadline_stops_calls():
+    """Test no AWS call is made once the deadline passed."""
+    ec2 = aws.create_boto_session(ACCOUNT).client('ec2')
+    aws.set_deadline(-1)
+    try:
+        with pytest.raises(aws.DeadlineExceeded):
+            ec2.describe_instances()
+    finally:
+        aws.set_deadline(None)
+
+
+@mock.patch('check_reserved_instances.aws.boto3.Session')
+def test_deadline_reports_partial_coverage(mocked_boto3):
+    """Test units not scanned before the deadline are reported."""
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ['--config', 'tests/fixtures/config.ini.no_email',
+              '--deadline', '0'], catch_exceptions=False)
+    aws.set_deadline(None)
+
+    assert 'PARTIAL COVERAGE!' in result.output
+    assert 'AWS account1 (us-east-1) ec2: Run deadline exceeded' in (
+        result.output)
+    assert 'Reserved Instances Report' in result.output
+    assert not mocked_boto3.called
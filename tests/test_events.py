@@ -0,0 +1,156 @@
+"""Tests for incremental updates from instance and reservation events."""
+import datetime
+import json
+
+import mock
+import pytest
+
+from check_reserved_instances.aws import (
+    add_ec2_instance, add_ec2_reservation)
+from check_reserved_instances.calculate import new_results
+from check_reserved_instances.collectors import report_sections
+from check_reserved_instances.events import (
+    APPLIED, apply_event, IGNORED, STALE, watch)
+from check_reserved_instances.snapshot import dump_snapshot, load_snapshot
+
+SERVICES = report_sections([{'ec2': True}])
+
+
+@pytest.fixture
+def get_baseline(ec2_instances, ec2_reserved_instances):
+    """Return a function building results of the mocked EC2 fixtures."""
+    for number, reserved_instance in enumerate(
+            ec2_reserved_instances['ReservedInstances']):
+        reserved_instance['ReservedInstancesId'] = 'ri-{}'.format(number)
+
+    def build():
+        results = new_results(SERVICES)
+        for reservation in ec2_instances['Reservations']:
+            for instance in reservation['Instances']:
+                add_ec2_instance(results, instance)
+        for reserved_instance in ec2_reserved_instances['ReservedInstances']:
+            add_ec2_reservation(results, reserved_instance, True)
+        return results
+    return build
+
+
+def state_change(instance_id, state, instance=None):
+    """Return an instance state-change event."""
+    detail = {'instance-id': instance_id, 'state': state}
+    if instance:
+        detail['instance'] = instance
+    return {'detail-type': 'EC2 Instance State-change Notification',
+            'detail': detail}
+
+
+def ri_change(reservation_id, state, reserved_instance=None):
+    """Return a reservation state-change event."""
+    detail = {'reserved-instances-id': reservation_id, 'state': state}
+    if reserved_instance:
+        detail['reserved-instances'] = reserved_instance
+    return {'detail-type': 'EC2 Reserved Instances State-change',
+            'detail': detail}
+
+
+def test_apply_events(get_baseline):
+    """Test adjusting the counts and instance IDs from events."""
+    results = get_baseline()
+    running = results['ec2_classic_running_instances']
+    assert running[('c3.large', 'us-east-1b')] == 4
+
+    assert apply_event(results, state_change(
+        'i-sdklfmi3', 'stopping')) == APPLIED
+    assert running[('c3.large', 'us-east-1b')] == 3
+    assert results['instance_ids'][('c3.large', 'us-east-1b')] == [
+        'test2', 'test2', 'test2']
+    assert apply_event(results, state_change(
+        'i-sdklfmi3', 'stopped')) == IGNORED
+
+    assert apply_event(results, state_change('i-new', 'running', {
+        'InstanceId': 'i-new', 'InstanceType': 'm5.large',
+        'Placement': {'AvailabilityZone': 'us-east-1a'},
+        'VpcId': 'vpc-1'})) == APPLIED
+    assert results['ec2_vpc_running_instances'][
+        ('m5.large', 'us-east-1a')] == 1
+    assert apply_event(results, state_change('i-other', 'running')) == STALE
+
+    assert apply_event(results, ri_change('ri-3', 'retired')) == APPLIED
+    assert ('c3.large', 'All') not in results['ec2_vpc_reserved_instances']
+    assert apply_event(results, ri_change('ri-new', 'active', {
+        'ReservedInstancesId': 'ri-new', 'Scope': 'Region',
+        'InstanceType': 'm5.large', 'InstanceCount': 2,
+        'ProductDescription': 'Linux/UNIX (Amazon VPC)',
+        'End': '2099-01-01T00:00:00.000Z'})) == APPLIED
+    assert results['ec2_vpc_reserved_instances'][('m5.large', 'All')] == 2
+
+
+def test_snapshot_round_trip(get_baseline, tmpdir):
+    """Test results survive being written to and read from a snapshot."""
+    results = get_baseline()
+    path = str(tmpdir.join('snapshot.json.gz'))
+    dump_snapshot(path, results, SERVICES)
+
+    snapshot = load_snapshot(path)
+    assert snapshot['services'] == SERVICES
+    assert snapshot['results'] == results
+
+
+def test_watch_reconciles_stale_results(get_baseline):
+    """Test a full reconcile replaces the results an event can't update."""
+    reconcile = mock.Mock(return_value=get_baseline())
+    on_change = mock.Mock()
+    events = [state_change('i-456sdf4g', 'terminated'), None,
+              state_change('i-other', 'running'),
+              state_change('i-sdklfmi3', 'terminated')]
+
+    results = watch(get_baseline(), iter(events), reconcile, 0, on_change)
+
+    assert reconcile.call_count == 1
+    assert on_change.call_count == 3
+    assert 'i-456sdf4g' in results['instances']
+    assert 'i-sdklfmi3' not in results['instances']
+
+
+def test_watch_reconciles_busy_stream(get_baseline):
+    """Test the periodic reconcile runs while events keep arriving."""
+    reconcile = mock.Mock(side_effect=lambda: get_baseline())
+    on_change = mock.Mock()
+    now = [0]
+
+    def clock():
+        now[0] += 10
+        return now[0]
+    events = [state_change('i-456sdf4g', 'stopping')] * 6
+
+    watch(get_baseline(), iter(events), reconcile, 25, on_change, clock)
+
+    assert reconcile.call_count == 2
+    assert on_change.call_count == 2
+
+
+def test_watch_command(mocked_boto3, invoke_cli, tmpdir):
+    """Test creating a snapshot and updating it from an events file."""
+    events = tmpdir.join('events.jsonl')
+    events.write(json.dumps(state_change('i-lksjdfi2', 'stopped')) + '\n')
+    snapshot = str(tmpdir.join('snapshot.json'))
+
+    result = invoke_cli('--config', 'tests/fixtures/config.ini.no_email',
+                        'watch', '--snapshot', snapshot, '--events',
+                        str(events))
+
+    assert '1 events applied, snapshot updated' in result.output
+    assert 'i-lksjdfi2' not in load_snapshot(snapshot)['results'][
+        'instances']
+    assert 'Reserved Instances Report' in result.output
+
+
+def test_end_parsing():
+    """Test reservations from events expire from their JSON end time."""
+    results = new_results(SERVICES)
+    apply_event(results, ri_change('ri-old', 'active', {
+        'ReservedInstancesId': 'ri-old', 'Scope': 'Region',
+        'InstanceType': 'm5.large', 'InstanceCount': 1,
+        'ProductDescription': 'Linux/UNIX (Amazon VPC)',
+        'End': (datetime.datetime.utcnow() + datetime.timedelta(
+            days=2)).strftime('%Y-%m-%dT%H:%M:%S.000Z')}))
+    assert results['reserve_expiry'][('m5.large', 'All')] == [1]
@@ -0,0 +1,98 @@
+"""Tests for the local history database."""
+from click.testing import CliRunner
+
+from check_reserved_instances import cli
+from check_reserved_instances.calculate import new_results
+from check_reserved_instances.collectors import report_sections
+from check_reserved_instances.history import HistoryStore
+
+SERVICES = report_sections([{'ec2': True, 'rds': True}])
+DAY = 86400
+NOW = 1000 * DAY
+
+
+def make_results(running, reserved):
+    """Return EC2 VPC results with the given m5.large counts."""
+    results = new_results(SERVICES)
+    results['ec2_vpc_running_instances'][('m5.large', 'us-east-1a')] = running
+    results['ec2_vpc_reserved_instances'][('m5.large', 'All')] = reserved
+    results['rds_running_instances'][('db.t2.small', True)] = 1
+    return results
+
+
+def test_record_compact_and_trend(tmpdir):
+    """Test recording runs, downsampling old runs and querying trends."""
+    store = HistoryStore(str(tmpdir.join('history.db')))
+    # four runs a day for the last 60 days
+    for day in range(60):
+        for quarter in range(4):
+            store.record_run(
+                [('account1', make_results(4, quarter))], SERVICES,
+                run_at=NOW - day * DAY - quarter * 3600)
+
+    store.compact(compact_after_days=30, now=NOW)
+
+    rows = store.trend(90, instance_type='m5', now=NOW)
+    # 121 runs within 30 days, and the last run of the 30 days before
+    assert len(rows) == 121 + 30
+    assert rows[0][1:] == (4, 1)
+
+    daily = store.trend(90, instance_type='m5', interval='day', now=NOW)
+    assert len(daily) == 61
+    assert daily[-1][1:] == (4, 0)
+
+    rds = store.trend(90, service='RDS', now=NOW)
+    assert all(row[1:] == (1, 0) for row in rds)
+
+    store.compact(compact_after_days=30, retention_days=45, now=NOW)
+    assert len(store.trend(90, account='account1', interval='day',
+                           now=NOW)) == 46
+    store.close()
+
+
+def test_runs_of_the_same_second(tmpdir):
+    """Test runs recorded at the same time are kept apart."""
+    store = HistoryStore(str(tmpdir.join('history.db')))
+    store.record_run([('account1', make_results(4, 1))], SERVICES,
+                     run_at=NOW)
+    store.record_run([('account2', make_results(2, 2))], SERVICES,
+                     run_at=NOW)
+
+    rows = store.trend(1, instance_type='m5', now=NOW)
+    assert sorted(row[1:] for row in rows) == [(2, 2), (4, 1)]
+    store.compact(compact_after_days=1, now=NOW + 2 * DAY)
+    assert len(store.trend(3, instance_type='m5', now=NOW + 2 * DAY)) == 2
+    store.close()
+
+
+def test_weeks_start_on_monday(tmpdir):
+    """Test the weekly trend buckets start on Monday."""
+    store = HistoryStore(str(tmpdir.join('history.db')))
+    # NOW is a Wednesday, the runs span Tuesday to Thursday
+    for day in (-1, 0, 1):
+        store.record_run([('account1', make_results(4, 1))], SERVICES,
+                         run_at=NOW + day * DAY)
+
+    rows = store.trend(7, interval='week', now=NOW + 2 * DAY)
+    assert [row[0].weekday() for row in rows] == [0]
+    store.close()
+
+
+def test_history_command(tmpdir):
+    """Test printing the coverage trend with the history subcommand."""
+    database = str(tmpdir.join('history.db'))
+    config = tmpdir.join('config.ini')
+    config.write('[AWS account1]\n\n[History]\ndatabase = {}\n'.format(
+        database))
+
+    store = HistoryStore(database)
+    store.record_run([('account1', make_results(4, 3))], SERVICES)
+    store.close()
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ['--config', str(config), 'history', '--instance-type', 'm5'],
+        catch_exceptions=False)
+
+    assert 'Coverage' in result.output
+    assert '75.0%' in result.output
@@ -0,0 +1,67 @@
+"""Tests for the AWS Lambda handler."""
+import io
+import json
+import os
+import subprocess
+import sys
+
+import mock
+import pytest
+
+from check_reserved_instances import lambda_handler
+
+CONFIG_FILE = 'tests/fixtures/config.ini.no_email'
+
+
+@pytest.fixture(autouse=True)
+def cold_start():
+    """Start each test from a cold container."""
+    lambda_handler.current_config.clear()
+    lambda_handler.sessions.clear()
+
+
+def test_warm_invocations_reuse_sessions(mocked_boto3):
+    """Test warm invocations reuse the session and clients of accounts."""
+    client = mocked_boto3.return_value.client
+    with io.open(CONFIG_FILE, encoding='utf-8') as config_file:
+        event = {'config': config_file.read()}
+
+    payload = lambda_handler.handler(event)
+    assert lambda_handler.handler(event) == payload
+
+    assert mocked_boto3.call_count == 1
+    client.assert_called_once_with('ec2')
+
+    payload = json.loads(json.dumps(payload))
+    assert not payload['partial']
+    vpc = payload['report']['EC2 VPC']
+    assert vpc['running_instances'] == 2
+    assert vpc['unreserved_instances'] == [
+        {'key': ['c3.large', 'us-east-1d'], 'count': 1,
+         'instance_ids': ['test3']}]
+
+
+def test_config_from_environment(mocked_boto3, monkeypatch):
+    """Test the configuration file can be named by the environment."""
+    monkeypatch.setenv(lambda_handler.CONFIG_FILE_VARIABLE, CONFIG_FILE)
+    context = mock.Mock()
+    context.get_remaining_time_in_millis.return_value = 5000
+
+    payload = lambda_handler.handler({}, context)
+
+    # the invocation's time left is within the margin, so nothing is scanned
+    assert payload['partial']
+    assert payload['failures'][0]['error'] == 'Run deadline exceeded'
+    assert not mocked_boto3.called
+
+
+def test_cold_start_imports():
+    """Test the handler doesn't import the command line interface."""
+    imported = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys\n'
+        'import check_reserved_instances.lambda_handler\n'
+        'print(sorted(name for name in ("click", "check_reserved_instances.'
+        'commands") if name in sys.modules))'],
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    assert imported.decode('utf-8').strip() == '[]'
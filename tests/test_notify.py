@@ -0,0 +1,58 @@
+"""Tests for change-only reports."""
+import mock
+
+from check_reserved_instances.calculate import report_diffs
+from check_reserved_instances.notify import NotificationState
+from check_reserved_instances.report import report_results
+
+
+def get_report(unreserved):
+    """Return a report of one service with unreserved m5.large instances."""
+    return {'EC2 VPC': report_diffs(
+        {('m5.large', 'us-east-1a'): unreserved + 1},
+        {('m5.large', 'us-east-1a'): 1})}
+
+
+def test_changes(tmpdir):
+    """Test unchanged reports are skipped until the heartbeat is due."""
+    state = NotificationState(str(tmpdir.join('state.json')), 3600)
+    assert state.changes(get_report(2), now=0) == []
+    state.save(get_report(2), now=0)
+
+    assert state.changes(get_report(2), now=60) is None
+    assert state.changes(get_report(2), now=3600) == []
+    assert state.changes(get_report(3), now=60) == [{
+        'service': 'EC2 VPC', 'kind': 'unreserved',
+        'key': ('m5.large', 'us-east-1a'), 'previous': 2, 'current': 3}]
+    failure = {'account': 'AWS account1', 'region': 'us-east-1',
+               'service': 'ec2', 'error': 'Expired'}
+    assert state.changes(get_report(2), [failure], now=60)[0]['kind'] == (
+        'not scanned')
+
+
+@mock.patch('check_reserved_instances.report.smtplib')
+def test_report_changes_only(mocked_smtplib, tmpdir, capsys):
+    """Test an unchanged report is neither printed nor emailed."""
+    config = {
+        'Email': {
+            'smtp_host': 'localhost', 'smtp_port': 25, 'smtp_user': '',
+            'smtp_password': '', 'smtp_recipients': 'to@example.com',
+            'smtp_sendas': 'from@example.com', 'smtp_tls': False},
+        'Notification': {
+            'state_file': str(tmpdir.join('state.json')),
+            'heartbeat_hours': 0.0}
+    }
+    sendmail = mocked_smtplib.SMTP.return_value.sendmail
+
+    report_results(config, get_report(2))
+    assert sendmail.call_count == 1
+    report_results(config, get_report(2))
+    assert sendmail.call_count == 1
+    assert 'unchanged' in capsys.readouterr().out
+
+    report_results(config, get_report(3))
+    assert sendmail.call_count == 2
+    message = sendmail.call_args[0][2]
+    assert 'Reserved Instance Report (1 changes)' in message
+    assert 'EC2 VPC unreserved\tm5.large\tus-east-1a\t(2 -> 3)' in message
+    assert 'background-color' in message
@@ -0,0 +1,96 @@
+"""Tests for discovering the accounts of an AWS Organization."""
+import datetime
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+import mock
+import pytest
+
+from check_reserved_instances.aws import role_credentials
+from check_reserved_instances.config import parse_config_string
+from check_reserved_instances.organizations import discover_accounts
+
+
+def get_accounts():
+    """Return a mocked page of organization accounts."""
+    return {
+        'Accounts': [
+            {'Id': '111111111111', 'Name': 'prod', 'Status': 'ACTIVE'},
+            {'Id': '222222222222', 'Name': 'dev', 'Status': 'ACTIVE'},
+            {'Id': '333333333333', 'Name': 'old', 'Status': 'SUSPENDED'},
+            {'Id': '444444444444', 'Name': 'sandbox', 'Status': 'ACTIVE'},
+        ]
+    }
+
+
+DENIED = ClientError(
+    {'Error': {'Code': 'AccessDenied', 'Message': 'Denied'}}, 'AssumeRole')
+UNREACHABLE = EndpointConnectionError(
+    endpoint_url='https://sts.us-east-1.amazonaws.com')
+
+
+def assume_role(RoleArn, RoleSessionName, error=DENIED):
+    """Return mocked credentials, failing for the dev account."""
+    if '222222222222' in RoleArn:
+        raise error
+    return {
+        'Credentials': {
+            'AccessKeyId': 'test',
+            'SecretAccessKey': 'test',
+            'SessionToken': 'test',
+            'Expiration': datetime.datetime.utcnow() + datetime.timedelta(
+                hours=1)
+        }
+    }
+
+
+@pytest.mark.parametrize('error', [DENIED, UNREACHABLE])
+@mock.patch('check_reserved_instances.aws.boto3.client')
+def test_organization_accounts(mocked_client, mocked_boto3, ec2_instances,
+                               invoke_cli, error, tmpdir):
+    """Test scanning the members, skipping the roles failing to assume."""
+    config = tmpdir.join('config.ini')
+    config.write(
+        '[Organization]\n'
+        'member_role_arn = arn:aws:iam::{account_id}:role/ReadOnly\n'
+        'regions = us-east-1, us-west-2\n'
+        'exclude_accounts = 444444444444\n'
+        'rds = False\nelasticache = False\n')
+
+    client = mocked_boto3.return_value.client.return_value
+    pages = {
+        'list_accounts': [get_accounts()],
+        'describe_instances': [ec2_instances],
+    }
+    client.get_paginator.side_effect = lambda name: mock.Mock(
+        paginate=mock.Mock(return_value=pages[name]))
+    sts = mocked_client.return_value
+    sts.assume_role.side_effect = lambda **kwargs: assume_role(
+        error=error, **kwargs)
+
+    role_credentials.clear()
+    result = invoke_cli('--config', str(config))
+    role_credentials.clear()
+
+    assert 'Skipping AWS dev (222222222222)' in result.output
+    # one role assumed per account, reused for both regions
+    assert sts.assume_role.call_count == 2
+    assert client.describe_reserved_instances.call_count == 2
+    assert 'Reserved Instances Report' in result.output
+
+
+@mock.patch('check_reserved_instances.organizations.assume_member_roles',
+            side_effect=lambda accounts, max_workers: accounts)
+@mock.patch('check_reserved_instances.organizations.list_member_accounts',
+            return_value=[{'Id': '111111111111', 'Name': 'prod'}])
+def test_account_names_by_region(mocked_list, mocked_assume):
+    """Test each region of a member account is named apart."""
+    config = parse_config_string(
+        '[Organization]\n'
+        'member_role_arn = arn:aws:iam::{account_id}:role/ReadOnly\n'
+        'regions = us-east-1, us-west-2\n')
+
+    accounts = discover_accounts(config['Organization'])
+
+    assert [account['name'] for account in accounts] == [
+        'AWS prod (111111111111, us-east-1)',
+        'AWS prod (111111111111, us-west-2)']
@@ -0,0 +1,60 @@
+"""Tests for the streaming stages of the collectors."""
+import mock
+
+from check_reserved_instances.aws import ec2_instance_record
+from check_reserved_instances.calculate import new_results
+from check_reserved_instances.pipeline import (
+    count_records, fetch, normalize, select)
+
+SERVICES = [('EC2 Classic', 'ec2_classic'), ('EC2 VPC', 'ec2_vpc')]
+
+
+def instance(instance_id, **fields):
+    """Return a running VPC instance as returned by DescribeInstances."""
+    return dict({'InstanceId': instance_id, 'InstanceType': 't2.micro',
+                 'Placement': {'AvailabilityZone': 'us-east-1a'},
+                 'VpcId': 'vpc-1'}, **fields)
+
+
+def test_fetch_holds_one_page():
+    """Test the pages are only requested as their records are consumed."""
+    requested = []
+
+    def pages(**kwargs):
+        for number in range(3):
+            requested.append(number)
+            yield {'Reservations': [{'Instances': [
+                instance('i-{}'.format(number))]}]}
+
+    client = mock.Mock()
+    client.get_paginator.return_value.paginate.side_effect = pages
+    records = normalize(ec2_instance_record, fetch(
+        client, 'describe_instances', ('Reservations', 'Instances')))
+
+    assert next(records).instance_id == 'i-0'
+    assert requested == [0]
+    assert [record.instance_id for record in records] == ['i-1', 'i-2']
+    assert requested == [0, 1, 2]
+
+
+def test_select_skips_uncounted_and_seen():
+    """Test spot, NoReservation tagged and already seen instances."""
+    instances = [
+        instance('i-1', Tags=[{'Key': 'Name', 'Value': 'web'}]),
+        instance('i-2', SpotInstanceRequestId='sir-1'),
+        instance('i-3', Tags=[{'Key': 'NoReservation', 'Value': 'True'}]),
+        instance('i-4')]
+    records = list(normalize(ec2_instance_record, instances))
+    assert [record.skip for record in records] == [
+        None, 'spot', 'NoReservation tag', None]
+
+    seen = set(['i-4'])
+    assert [record.label for record in select(records, seen)] == ['web']
+    assert seen == set(['i-1', 'i-4'])
+
+    results = count_records(
+        new_results(SERVICES), instances, ec2_instance_record)
+    assert results['ec2_vpc_running_instances'] == {
+        ('t2.micro', 'us-east-1a'): 2}
+    assert results['instance_ids'] == {
+        ('t2.micro', 'us-east-1a'): ['web', 'i-4']}
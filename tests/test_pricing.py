@@ -0,0 +1,89 @@
+"""Tests for the cost figures from the bulk pricing offer files."""
+import csv
+import io
+
+from check_reserved_instances.calculate import report_diffs
+from check_reserved_instances.pricing import price_report, PriceIndex
+from check_reserved_instances.report import report_results
+
+HEADER = ['SKU', 'OfferTermCode', 'RateCode', 'TermType', 'PriceDescription',
+          'Unit', 'PricePerUnit', 'Currency', 'LeaseContractLength',
+          'PurchaseOption', 'OfferingClass', 'Location', 'Instance Type',
+          'Tenancy', 'Operating System', 'License Model',
+          'Pre Installed S/W', 'CapacityStatus', 'Region Code']
+
+ROWS = [
+    ['A', 'JRTCKXETXF', '', 'OnDemand', '', 'Hrs', '0.096', 'USD', '', '',
+     '', 'US East (N. Virginia)', 'm5.large', 'Shared', 'Linux',
+     'No License required', 'NA', 'Used', 'us-east-1'],
+    ['A', '4NA7Y494T4', '', 'Reserved', '', 'Hrs', '0.04', 'USD', '1yr',
+     'Partial Upfront', 'standard', 'US East (N. Virginia)', 'm5.large',
+     'Shared', 'Linux', 'No License required', 'NA', 'Used', 'us-east-1'],
+    ['A', '4NA7Y494T4', '', 'Reserved', '', 'Quantity', '175.2', 'USD', '1yr',
+     'Partial Upfront', 'standard', 'US East (N. Virginia)', 'm5.large',
+     'Shared', 'Linux', 'No License required', 'NA', 'Used', 'us-east-1'],
+    ['B', 'JRTCKXETXF', '', 'OnDemand', '', 'Hrs', '0.188', 'USD', '', '',
+     '', 'US East (N. Virginia)', 'm5.large', 'Shared', 'Windows',
+     'No License required', 'NA', 'Used', 'us-east-1'],
+    ['C', 'JRTCKXETXF', '', 'OnDemand', '', 'Hrs', '0.1', 'USD', '', '', '',
+     'US West (Oregon)', 'm5.large', 'Shared', 'Linux',
+     'No License required', 'NA', 'Used', '']
+]
+
+
+def write_offer(path):
+    """Write an EC2 offer file."""
+    with io.open(str(path), 'w', encoding='utf-8', newline='') as offer:
+        offer.write(u'"FormatVersion","v1.0"\n"Disclaimer","..."\n'
+                    u'"Publication Date","2024-01-01T00:00:00Z"\n'
+                    u'"Version","20240101000000"\n"OfferCode","AmazonEC2"\n')
+        writer = csv.writer(offer)
+        writer.writerow(HEADER)
+        writer.writerows(ROWS)
+    return str(path)
+
+
+def test_price_index(tmpdir):
+    """Test ingesting an offer file once, and looking up prices."""
+    offer = write_offer(tmpdir.join('ec2.csv'))
+    index = PriceIndex(str(tmpdir.join('pricing.db')))
+
+    assert index.update('ec2', offer)
+    assert not index.update('ec2', offer)
+    assert index.hourly(
+        'ec2', 'us-east-1', 'm5.large', 'Linux', 'OnDemand') == 0.096
+    # the upfront fee is spread over the hours of the term
+    assert round(index.hourly('ec2', 'us-east-1', 'm5.large', 'Linux',
+                              '1yr Partial Upfront'), 3) == 0.06
+    # the region code is looked up from the location
+    assert index.hourly(
+        'ec2', 'us-west-2', 'm5.large', 'Linux', 'OnDemand') == 0.1
+    assert index.hourly(
+        'ec2', 'us-east-1', 'm5.large', 'Windows', 'OnDemand') == 0.188
+    assert index.hourly(
+        'ec2', 'us-east-1', 'm5.large', 'Linux', '3yr All Upfront') is None
+
+
+def test_report_costs(tmpdir, capsys):
+    """Test annotating the report with the cost of each line."""
+    config = {'Pricing': {
+        'ec2_offer': write_offer(tmpdir.join('ec2.csv')),
+        'rds_offer': None,
+        'elasticache_offer': None,
+        'index': str(tmpdir.join('pricing.db')),
+        'region': 'us-east-1',
+        'reserved_term': '1yr Partial Upfront',
+        'ec2_platform': 'Linux',
+        'rds_engine': 'MySQL'
+    }}
+    report = {'EC2 VPC': report_diffs(
+        {('m5.large', 'us-east-1a'): 3, ('m5.large', 'us-west-2b'): 1},
+        {('m5.large', 'us-east-1b'): 2})}
+
+    costs = price_report(config, report)
+    report_results(config, report, costs=costs)
+
+    output = capsys.readouterr().out
+    assert 'm5.large\tus-east-1a\t$0.288/hour, $210.24/month' in output
+    assert 'm5.large\tus-west-2b\t$0.100/hour, $73.00/month' in output
+    assert 'm5.large\tus-east-1b\t$0.120/hour, $87.60/month' in output
@@ -0,0 +1,47 @@
+"""Tests for scanning the accounts in worker processes."""
+import multiprocessing
+
+import pytest
+
+from check_reserved_instances import aws
+from check_reserved_instances.scan import plan_tasks
+
+CONFIG = ''.join(
+    '[AWS account{0}]\nregion = us-east-{0}\nrds = False\n'
+    'elasticache = False\n\n'.format(number) for number in range(1, 5))
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='the workers must inherit the mocked sessions')
+def test_process_engine_reports_as_serial(mocked_boto3, invoke_cli,
+                                          tmpdir):
+    """Test scanning in worker processes reports the same as serially."""
+    config = tmpdir.join('config.ini')
+    config.write(CONFIG)
+
+    serial = invoke_cli('--config', str(config))
+    processes = invoke_cli('--config', str(config), '--engine', 'process',
+                           '--workers', '2')
+
+    assert 'Reserved Instances Report' in processes.output
+    assert processes.output == serial.output
+
+
+def test_overlapping_sections_share_a_task():
+    """Test the sections of the same account and region share a task."""
+    aws.account_ids.clear()
+
+    def account(name, role_arn, region='us-east-1'):
+        return {'name': name, 'region': region, 'aws_role_arn': role_arn,
+                'aws_access_key_id': None}
+
+    accounts = [
+        account('a', 'arn:aws:iam::111111111111:role/A'),
+        account('b', 'arn:aws:iam::222222222222:role/B'),
+        account('c', 'arn:aws:iam::111111111111:role/C'),
+        account('d', 'arn:aws:iam::111111111111:role/A', 'us-west-2')]
+
+    tasks = plan_tasks(accounts)
+
+    assert [[position for position, _ in task] for task in tasks] == [
+        [0, 2], [1], [3]]
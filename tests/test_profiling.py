@@ -0,0 +1,84 @@
+"""Tests for the stage profiler."""
+import multiprocessing
+import pstats
+import threading
+
+import pytest
+
+from check_reserved_instances import profiling
+
+
+def test_nested_stages():
+    """Test nested stages are each measured, including their memory."""
+    profiler = profiling.enable()
+    try:
+        with profiling.stage('outer'):
+            with profiling.stage('inner'):
+                data = bytearray(1024 * 1024)
+            del data
+        with profiling.stage('inner'):
+            pass
+    finally:
+        profiling.disable()
+
+    assert list(profiler.stages) == ['inner', 'outer']
+    assert profiler.stages['inner'].calls == 2
+    assert profiler.stages['inner'].peak >= 1024 * 1024
+    assert profiler.stages['outer'].peak >= profiler.stages['inner'].peak
+    assert profiler.stages['outer'].wall >= profiler.stages['inner'].wall
+    # does nothing once profiling is disabled
+    with profiling.stage('outer'):
+        pass
+    assert profiler.stages['outer'].calls == 1
+
+
+def test_stages_per_thread():
+    """Test AWS calls are charged to the stage of the thread making them."""
+    profiler = profiling.enable(memory=False)
+    entered = threading.Barrier(2)
+    try:
+        def collect(name):
+            with profiling.stage(name):
+                context = {}
+                profiler.before_call(context=context)
+                # both stages are running when the calls end
+                entered.wait()
+                profiler.after_call(context=context)
+
+        threads = [threading.Thread(target=collect, args=(name,))
+                   for name in ('account1', 'account2')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        profiling.disable()
+
+    assert profiler.stages['account1' + profiling.AWS_CALLS].calls == 1
+    assert profiler.stages['account2' + profiling.AWS_CALLS].calls == 1
+    assert profiler.current_stage() == 'other'
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='the workers must inherit the mocked sessions')
+def test_profile_process_engine(mocked_boto3, invoke_cli):
+    """Test the stages of the worker processes are merged."""
+    result = invoke_cli('--config', 'tests/fixtures/config.ini.no_email',
+                        '--engine', 'process', '--profile')
+
+    assert 'collect AWS account1 (us-east-1) ec2' in result.output
+
+
+def test_profile_run(mocked_boto3, invoke_cli, tmpdir):
+    """Test the --profile-output option prints and writes the profile."""
+    output = str(tmpdir.join('run.prof'))
+
+    result = invoke_cli('--config', 'tests/fixtures/config.ini.no_email',
+                        '--profile-output', output)
+
+    assert 'Reserved Instances Report' in result.output
+    assert 'Peak (KiB)' in result.output
+    assert 'collect AWS account1 (us-east-1) ec2' in result.output
+    assert 'report_diffs' in result.output
+    assert pstats.Stats(output).total_calls > 0
+    assert profiling.profiler is None
@@ -0,0 +1,36 @@
+"""Tests for printing each account as soon as it is scanned."""
+import json
+
+CONFIG = ''.join(
+    '[AWS account{0}]\nregion = us-east-{0}\nrds = False\n'
+    'elasticache = False\n\n'.format(number) for number in range(1, 3))
+
+
+def test_progress_text(mocked_boto3, invoke_cli, tmpdir):
+    """Test each account is printed before the consolidated report."""
+    config = tmpdir.join('config.ini')
+    config.write(CONFIG)
+
+    output = invoke_cli('--config', str(config), '--progress', 'text').output
+
+    first = output.index('AWS account1 (us-east-1) scanned after')
+    second = output.index('AWS account2 (us-east-2) scanned after')
+    assert first < second < output.index('Reserved Instances Report')
+    assert 'EC2 VPC: (2) running, (3) reserved' in output[first:second]
+
+
+def test_progress_ndjson(mocked_boto3, invoke_cli, tmpdir):
+    """Test the accounts and the consolidated report are NDJSON lines."""
+    config = tmpdir.join('config.ini')
+    config.write(CONFIG)
+
+    output = invoke_cli('--config', str(config), '--progress', 'ndjson').output
+
+    lines = [json.loads(line) for line in output.splitlines()]
+    assert [(line['type'], line.get('account')) for line in lines] == [
+        ('account', 'AWS account1'), ('account', 'AWS account2'),
+        ('summary', None)]
+    account = lines[0]['report']['EC2 VPC']
+    summary = lines[2]['report']['EC2 VPC']
+    assert summary['running_instances'] == account['running_instances'] * 2
+    assert not lines[2]['partial']
@@ -0,0 +1,86 @@
+"""Tests for the reservation modification recommendations."""
+import time
+
+from check_reserved_instances.calculate import report_diffs
+from check_reserved_instances.recommend import (
+    format_recommendations, recommend, recommend_section)
+
+
+def test_recommend_section():
+    """Test moving, splitting and converting unused reservations."""
+    diffs = report_diffs(
+        {('m5.large', 'us-east-1b'): 2, ('m5.large', 'us-east-1c'): 1,
+         ('c5.large', 'us-east-1a'): 2, ('r5.large', 'us-west-2a'): 1,
+         ('t3.small', 'us-east-1a'): 1},
+        {('m5.large', 'us-east-1a'): 3, ('c5.xlarge', 'us-east-1a'): 1,
+         ('r5.large', 'us-east-1a'): 1, ('t3.large', 'us-east-1a'): 1})
+
+    modifications, covered = recommend_section(diffs)
+
+    assert covered == 6
+    assert modifications == [{
+        'instance_type': 'c5.xlarge', 'zone': 'us-east-1a', 'count': 1,
+        'configuration': [('c5.large', 'us-east-1a', 2)], 'regional': False
+    }, {
+        'instance_type': 'm5.large', 'zone': 'us-east-1a', 'count': 3,
+        'configuration': [('m5.large', 'us-east-1b', 2),
+                          ('m5.large', 'us-east-1c', 1)],
+        'regional': True
+    }, {
+        'instance_type': 't3.large', 'zone': 'us-east-1a', 'count': 1,
+        'configuration': [('t3.small', 'us-east-1a', 2),
+                          ('t3.medium', 'us-east-1a', 1)],
+        'regional': False
+    }]
+    # reservations can't be moved to another region
+    assert ('r5.large', 'us-west-2a') in diffs['unreserved_instances']
+    lines = format_recommendations({'EC2 VPC': (modifications, covered)})
+    assert lines[:3] == [
+        'EC2 VPC: 3 modifications covering 6 unreserved instances',
+        '  MODIFY 1 c5.xlarge (us-east-1a) into 2 c5.large (us-east-1a)',
+        '  CONVERT 3 m5.large (us-east-1a) to regional scope']
+
+
+def test_recommend_many_keys():
+    """Test solving thousands of keys quickly."""
+    running = {}
+    reserved = {}
+    for family in range(50):
+        for zone in 'abcdef':
+            for size in ('large', 'xlarge', '2xlarge'):
+                key = ('f{}.{}'.format(family, size), 'us-east-1' + zone)
+                if zone in 'abc':
+                    running[key] = 3
+                else:
+                    reserved[key] = 2
+
+    start = time.time()
+    _, covered = recommend({'EC2 VPC': report_diffs(running, reserved)})[
+        'EC2 VPC']
+    assert time.time() - start < 1
+    assert covered > 0
+
+
+def test_recommend_mixed_sizes():
+    """Test only recommending modifications covering whole instances."""
+    diffs = report_diffs({('m5.xlarge', 'us-east-1b'): 1},
+                         {('m5.large', 'us-east-1a'): 1})
+    assert recommend_section(diffs) == ([], 0)
+
+    diffs = report_diffs({('m5.xlarge', 'us-east-1b'): 1},
+                         {('m5.large', 'us-east-1a'): 2})
+    assert recommend_section(diffs) == ([{
+        'instance_type': 'm5.large', 'zone': 'us-east-1a', 'count': 2,
+        'configuration': [('m5.xlarge', 'us-east-1b', 1)], 'regional': False
+    }], 1)
+
+
+def test_recommend_regional_region():
+    """Test regional reservations only covering their own region."""
+    diffs = report_diffs({('m5.xlarge', 'us-west-2a'): 1},
+                         {('m5.large', 'All'): 2})
+    assert recommend_section(diffs, 'us-east-1') == ([], 0)
+    modifications, covered = recommend_section(diffs, 'us-west-2')
+    assert covered == 1
+    assert modifications[0]['configuration'] == [
+        ('m5.xlarge', 'us-west-2a', 1)]
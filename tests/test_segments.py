@@ -0,0 +1,72 @@
+"""Tests for scanning the EC2 instances in concurrent segments."""
+import fnmatch
+import functools
+
+import mock
+
+from check_reserved_instances import aws
+from check_reserved_instances.calculate import new_results
+from check_reserved_instances.collectors import get_collector
+
+SERVICES = get_collector('ec2').sections
+
+
+def paginate(instances_page, Filters):
+    """Return the pages of the fixture instances matching the filters."""
+    reservations = []
+    for reservation in instances_page['Reservations']:
+        instances = [instance for instance in reservation['Instances']
+                     if all(matches(instance, name, values)
+                            for name, values in (
+                                (item['Name'], item['Values'])
+                                for item in Filters))]
+        if instances:
+            reservations.append({'Instances': instances})
+    # two pages, each of half the reservations
+    middle = len(reservations) // 2
+    return [{'Reservations': reservations[:middle]},
+            {'Reservations': reservations[middle:]}]
+
+
+def matches(instance, name, values):
+    """Check whether an instance matches a describe_instances filter."""
+    value = {
+        'instance-state-name': 'running',
+        'availability-zone': instance['Placement']['AvailabilityZone'],
+        'instance-type': instance['InstanceType']
+    }[name]
+    return any(fnmatch.fnmatch(value, pattern) for pattern in values)
+
+
+def scan_ec2(segments, instances_page):
+    """Count the fixture instances in segments."""
+    session = mock.Mock()
+    ec2 = session.client.return_value
+    ec2.describe_account_attributes.return_value = {'AccountAttributes': [
+        {'AttributeValues': [{'AttributeValue': 'VPC'}]}]}
+    ec2.describe_availability_zones.return_value = {'AvailabilityZones': [
+        {'ZoneName': 'us-east-1{}'.format(zone)} for zone in 'abcd']}
+    ec2.get_paginator.return_value.paginate.side_effect = functools.partial(
+        paginate, instances_page)
+    ec2.describe_reserved_instances.return_value = {'ReservedInstances': []}
+
+    aws.configure_clients({'ec2_segments': segments})
+    try:
+        return aws.calculate_ec2_ris(session, new_results(SERVICES)), ec2
+    finally:
+        aws.configure_clients({})
+
+
+def test_segments_count_once(ec2_instances):
+    """Test segmented scans count every instance once, like a serial scan."""
+    serial, ec2 = scan_ec2(1, ec2_instances)
+    assert ec2.get_paginator.return_value.paginate.call_count == 1
+    assert not ec2.describe_availability_zones.called
+
+    segmented, ec2 = scan_ec2(12, ec2_instances)
+    # 4 zones, with the instance types in 3 segments each
+    assert ec2.get_paginator.return_value.paginate.call_count == 12
+    assert segmented == serial
+    assert sum(serial['ec2_classic_running_instances'].values()) + sum(
+        serial['ec2_vpc_running_instances'].values()) == len(
+            serial['instances'])
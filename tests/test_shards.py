@@ -0,0 +1,50 @@
+"""Tests for sharded scans and merging their partial results."""
+from click.testing import CliRunner
+
+from check_reserved_instances import cli
+
+CONFIG = ''.join(
+    '[AWS account{0}]\nregion = us-east-{0}\nrds = False\n'
+    'elasticache = False\n\n'.format(number) for number in range(1, 7))
+
+
+def test_shards_merge_to_full_report(mocked_boto3, invoke_cli, tmpdir):
+    """Test merging every shard reports the same as a full scan."""
+    client = mocked_boto3.return_value.client
+    config = tmpdir.join('config.ini')
+    config.write(CONFIG)
+
+    full = invoke_cli('--config', str(config))
+    scans = client.return_value.describe_reserved_instances.call_count
+    assert scans == 6
+
+    partials = []
+    for index in range(1, 4):
+        partial = str(tmpdir.join('shard{}.json.gz'.format(index)))
+        result = invoke_cli('--config', str(config), '--shard',
+                            '{}/3'.format(index), '--partial', partial)
+        assert 'Wrote the results of shard {}/3'.format(
+            index) in result.output
+        partials.append(partial)
+    # every account scanned by exactly one shard
+    assert client.return_value.describe_reserved_instances.call_count == (
+        2 * scans)
+
+    merged = invoke_cli('--config', str(config), 'merge', *partials)
+    assert 'Warning' not in merged.output
+    assert sorted(merged.output.splitlines()) == sorted(
+        full.output.splitlines())
+
+    incomplete = invoke_cli('--config', str(config), 'merge', *partials[1:])
+    assert 'Warning: merging an incomplete set of shards' in (
+        incomplete.output)
+
+
+def test_shard_option_format():
+    """Test rejecting a badly formatted shard."""
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ['--config', 'tests/fixtures/config.ini.no_email',
+              '--shard', '4/3', '--partial', 'partial.json'])
+
+    assert 'I must be between 1 and N' in result.output
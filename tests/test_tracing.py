@@ -0,0 +1,66 @@
+"""Tests for the trace spans of a run."""
+import json
+
+import mock
+
+from check_reserved_instances import tracing
+
+
+def test_trace_file(mocked_boto3, invoke_cli, tmpdir):
+    """Test the spans of a run are written to a file in the OTLP format."""
+    output = str(tmpdir.join('trace.json'))
+
+    result = invoke_cli('--config', 'tests/fixtures/config.ini.no_email',
+                        '--trace', output)
+    assert 'Reserved Instances Report' in result.output
+    assert tracing.tracer is None
+
+    with open(output) as trace_file:
+        payload = json.load(trace_file)
+    spans = dict((span['name'], span) for span in
+                 payload['resourceSpans'][0]['scopeSpans'][0]['spans'])
+    assert set(spans) == set([
+        'run', 'create_boto_session', 'collect ec2', 'report_diffs',
+        'pricing', 'report_results'])
+    assert spans['collect ec2']['parentSpanId'] == spans['run']['spanId']
+    assert len(set(span['traceId'] for span in spans.values())) == 1
+    attributes = dict((attribute['key'], attribute['value'])
+                      for attribute in spans['collect ec2']['attributes'])
+    assert attributes == {
+        'account': {'stringValue': 'AWS account1'},
+        'attempts': {'intValue': '1'},
+        'region': {'stringValue': 'us-east-1'},
+        'service': {'stringValue': 'ec2'}}
+
+
+def test_call_spans():
+    """Test AWS calls are traced as children of the current span."""
+    tracer = tracing.enable()
+    try:
+        model = mock.Mock()
+        model.name = 'DescribeInstances'
+        model.service_model.service_name = 'ec2'
+        context = {'client_region': 'us-west-2'}
+        with tracing.span('collect ec2', account='prod'):
+            tracer.before_call(model=model, params={}, context=context)
+            tracer.after_call(
+                http_response=mock.Mock(status_code=200),
+                parsed={'Reservations': [{}, {}], 'NextToken': 'x',
+                        'ResponseMetadata': {'RetryAttempts': 2}},
+                model=model, context=context)
+            tracer.before_call(model=model, params={}, context=context)
+            tracer.after_call_error(exception=IOError('reset'),
+                                    context=context)
+    finally:
+        tracing.disable()
+
+    parent, page, failed = tracer.export_payload()['resourceSpans'][0][
+        'scopeSpans'][0]['spans']
+    assert page['parentSpanId'] == parent['spanId']
+    assert dict((attribute['key'], list(attribute['value'].values())[0])
+                for attribute in page['attributes']) == {
+        'account': 'prod', 'service': 'ec2', 'operation': 'DescribeInstances',
+        'region': 'us-west-2', 'status_code': '200', 'retries': '2',
+        'page_size': '2', 'next_page': True}
+    assert failed['status'] == {'code': tracing.STATUS_ERROR,
+                                'message': 'reset'}
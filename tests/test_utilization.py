@@ -0,0 +1,119 @@
+"""Tests for flagging the idle instances from their CPU utilization."""
+import mock
+
+from check_reserved_instances.calculate import add_instance, new_results
+from check_reserved_instances.utilization import (
+    fetch_averages, flag_idle, sample_utilization)
+
+KEY = ('t2.micro', 'us-east-1a')
+UTILIZATION = {'cpu_threshold': 5.0, 'period_days': 14, 'action': 'annotate',
+               'cache_ttl_hours': 24.0, 'max_workers': 4}
+
+
+def metric_data(**kwargs):
+    """Return one page of a CPU utilization of 1% per query."""
+    return [{'MetricDataResults': [
+        {'Id': query['Id'], 'Values': [0.5, 1.5]}
+        for query in kwargs['MetricDataQueries']]}]
+
+
+def test_fetch_averages_batches_queries():
+    """Test the instances are fetched 500 at a time."""
+    cloudwatch = mock.Mock()
+    paginate = cloudwatch.get_paginator.return_value.paginate
+    paginate.side_effect = metric_data
+    instance_ids = ['i-{}'.format(number) for number in range(1201)]
+
+    averages = fetch_averages(cloudwatch, 'AWS/EC2', 'InstanceId',
+                              instance_ids, 14, 4)
+
+    assert sorted(len(call[1]['MetricDataQueries'])
+                  for call in paginate.call_args_list) == [201, 500, 500]
+    assert averages == dict((instance_id, 1.0) for instance_id in instance_ids)
+
+
+def test_sample_utilization_cached(tmpdir):
+    """Test recently sampled instances aren't fetched again."""
+    session = mock.Mock()
+    paginate = session.client.return_value.get_paginator.return_value.paginate
+    paginate.side_effect = metric_data
+    utilization = dict(UTILIZATION, cache=str(tmpdir.join('cpu.db')))
+    key = ('t2.micro', 'us-east-1a')
+
+    for _ in range(2):
+        results = new_results([('EC2 VPC', 'ec2_vpc')])
+        add_instance(results, 'ec2_vpc_running_instances', key, 'i-1', 'web')
+        sample_utilization(session, results, utilization)
+        assert results['utilization'] == {
+            'i-1': ('ec2_vpc_running_instances', key, 1.0)}
+
+    assert paginate.call_count == 1
+
+
+def test_sample_unreserved_only(tmpdir):
+    """Test the instances the account's reservations cover aren't sampled."""
+    session = mock.Mock()
+    paginate = session.client.return_value.get_paginator.return_value.paginate
+    paginate.side_effect = metric_data
+    utilization = dict(UTILIZATION, cache=str(tmpdir.join('cpu.db')))
+    reserved_key = ('m5.large', 'us-east-1a')
+
+    results = new_results([('EC2 VPC', 'ec2_vpc')])
+    add_instance(results, 'ec2_vpc_running_instances', reserved_key, 'i-1',
+                 'api')
+    add_instance(results, 'ec2_vpc_running_instances',
+                 ('t2.micro', 'us-east-1a'), 'i-2', 'web')
+    results['ec2_vpc_reserved_instances'][reserved_key] = 1
+    sample_utilization(session, results, utilization)
+
+    assert list(results['utilization']) == ['i-2']
+
+
+def utilization_results(*instances):
+    """Return results of (instance ID, name, average CPU) instances."""
+    results = new_results([('EC2 VPC', 'ec2_vpc')])
+    for instance_id, label, cpu in instances:
+        add_instance(results, 'ec2_vpc_running_instances', KEY, instance_id,
+                     label)
+        results['utilization'][instance_id] = (
+            'ec2_vpc_running_instances', KEY, cpu)
+    return results
+
+
+def report():
+    """Return a report of two unreserved instances."""
+    return {'EC2 VPC': {'unreserved_instances': {KEY: 2}}}
+
+
+def test_flag_idle():
+    """Test idle unreserved instances are annotated or excluded."""
+    results = utilization_results(('i-1', 'web', 1.0), ('i-2', 'db', 40.0))
+    instance_ids = {KEY: ['i-1', 'i-2']}
+
+    annotated = report()
+    assert flag_idle({'Utilization': UTILIZATION}, annotated, results,
+                     instance_ids) == {KEY: ['db', 'web (idle, 1.0% CPU)']}
+    assert annotated == report()
+
+    excluded = report()
+    exclude = dict(UTILIZATION, action='exclude')
+    assert flag_idle({'Utilization': exclude}, excluded, results,
+                     instance_ids) == {KEY: ['db']}
+    assert excluded['EC2 VPC']['unreserved_instances'] == {KEY: 1}
+    assert flag_idle({}, report(), results) is results['instance_ids']
+    assert flag_idle({}, report(), results, instance_ids) == {
+        KEY: ['db', 'web']}
+
+
+def test_flag_idle_same_names():
+    """Test idle instances are told apart from busy ones of the same name."""
+    results = utilization_results(('i-1', 'web', 1.0), ('i-2', 'web', 40.0))
+    exclude = dict(UTILIZATION, action='exclude')
+
+    excluded = report()
+    assert flag_idle({'Utilization': exclude}, excluded, results) == {
+        KEY: ['web']}
+    assert excluded['EC2 VPC']['unreserved_instances'] == {KEY: 1}
+
+    assert flag_idle({'Utilization': UTILIZATION}, report(), results) == {
+        KEY: ['web (idle, 1.0% CPU)', 'web']}